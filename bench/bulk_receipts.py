@@ -0,0 +1,100 @@
+# bench/bulk_receipts.py
+# Đo thời gian nhập kho hàng loạt từ file: đọc, kiểm tra, xem trước và ghi vào DB.
+#   python -m bench.bulk_receipts --url sqlite:////tmp/warehouse_bulk.db --lines 10000
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+BENCH_PREFIX = "BENCH-BULK-"
+
+
+def setup(engine, parts):
+    # Lược đồ đầy đủ qua migrations: danh mục phụ tùng đọc từ cache dùng chung cần đủ các cột
+    from migrations import upgrade
+    from stock_movements import MOVEMENT_TABLES
+    from table_versions import bump
+
+    upgrade(engine)
+    with engine.begin() as conn:
+        for table, column in (("import_export", "part_id"), ("movement_monthly", "part_id"), ("stock_ledger", "part_id"),
+                              ("spare_parts", "material_no")):
+            conn.execute(text(f"DELETE FROM {table} WHERE {column} LIKE :p"), {"p": BENCH_PREFIX + "%"})
+        conn.execute(text("""
+            INSERT INTO spare_parts (material_no, description, stock, price)
+            VALUES (:material_no, :description, 0, 1)
+        """), [{"material_no": f"{BENCH_PREFIX}{i:05d}", "description": f"Bulk bench {i}"} for i in range(parts)])
+        bump(conn, *MOVEMENT_TABLES)
+
+
+def make_file(lines, parts):
+    rng = random.Random(42)
+    df = pd.DataFrame({
+        "Mã vật liệu": [f"{BENCH_PREFIX}{rng.randrange(parts):05d}" for _ in range(lines)],
+        "Số lượng": [rng.randint(1, 50) for _ in range(lines)],
+        "Đơn giá": [round(rng.uniform(1, 500), 2) for _ in range(lines)],
+    })
+    output = io.BytesIO()
+    df.to_excel(output, index=False)
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo nhập kho hàng loạt từ file")
+    parser.add_argument("--url", default=os.environ.get("WAREHOUSE_DB_URL"))
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--parts", type=int, default=2000)
+    args = parser.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.gettempdir(), "warehouse_bulk.db")
+    os.environ["WAREHOUSE_DB_URL"] = url
+
+    from bulk_receipts import load_part_catalog, read_receipt_file, receipts_from_preview, summarize_receipts, validate_receipts
+    from database import get_engine
+    from stock_movements import apply_receipts
+
+    engine = get_engine()
+    setup(engine, args.parts)
+    data = make_file(args.lines, args.parts)
+
+    timings = {}
+    started = time.perf_counter()
+    df = read_receipt_file("bench.xlsx", data)
+    timings["đọc file"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    catalog = load_part_catalog(engine)
+    checked = validate_receipts(df, catalog)
+    timings["kiểm tra"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    preview = summarize_receipts(checked[checked["error"] == ""], catalog)
+    timings["xem trước"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    apply_receipts(engine, receipts_from_preview(preview), "BENCH")
+    timings["ghi DB"] = time.perf_counter() - started
+
+    for step, seconds in timings.items():
+        print(f"{step:<10} {seconds * 1000:>9.1f} ms")
+    print(f"{'tổng':<10} {sum(timings.values()) * 1000:>9.1f} ms ({args.lines} dòng, {len(preview)} mã)")
+
+    with engine.connect() as conn:
+        total_stock = conn.execute(
+            text("SELECT COALESCE(SUM(stock), 0) FROM spare_parts WHERE material_no LIKE :p"), {"p": BENCH_PREFIX + "%"}
+        ).scalar()
+    expected = int(pd.to_numeric(df["quantity"]).sum())
+    if (checked["error"] != "").any() or total_stock != expected:
+        print(f"THẤT BẠI: tồn kho {total_stock} != {expected}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# bench/generate_data.py
+# Sinh dữ liệu kho giả lập (phụ tùng, máy, vị trí, nhân viên, lịch sử nhập/xuất có tính mùa vụ)
+# vào một CSDL cục bộ để đo hiệu năng các trang.
+#   python -m bench.generate_data --url sqlite:////tmp/warehouse_bench.db --parts 50000 --movements 5000000
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+CHUNK_SIZE = 50_000
+
+PART_WORDS = ["Vòng bi", "Dây đai", "Bạc đạn", "Cảm biến", "Động cơ", "Van khí", "Xi lanh", "Bánh răng",
+              "Lò xo", "Công tắc", "Rơ le", "Ống dẫn", "Trục", "Kim", "Suốt chỉ", "Lưỡi dao"]
+PART_SIZES = ["6204", "6205", "M8", "M10", "24V", "220V", "Ø12", "Ø20", "L100", "L250", "A1", "B2"]
+FAMILY_NAMES = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ"]
+GIVEN_NAMES = ["An", "Bình", "Chi", "Dũng", "Giang", "Hà", "Hải", "Hạnh", "Hùng", "Lan", "Long", "Minh",
+               "Nam", "Ngọc", "Phúc", "Quân", "Thảo", "Trang", "Tuấn", "Việt", "Yến"]
+EXPORT_REASONS = ["Thay thế định kỳ", "Hỏng hóc", "Bảo trì", "Lắp mới", "Dự phòng"]
+TABLES = ["import_export", "movement_monthly", "stock_snapshot", "stock_ledger", "spare_parts", "machine_pos",
+          "machine", "group_mc", "machine_type", "employees"]
+
+
+def _insert(conn, sql, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        conn.execute(text(sql), rows[start:start + CHUNK_SIZE])
+
+
+def day_weights(days):
+    # Mùa vụ: cao điểm quý 4, thấp điểm đầu năm; chủ nhật gần như nghỉ, thứ bảy làm nửa ngày
+    months = np.array([d.month for d in days])
+    weekdays = np.array([d.weekday() for d in days])
+    season = 1 + 0.35 * np.sin(2 * np.pi * (months - 7) / 12)
+    weekday = np.select([weekdays == 6, weekdays == 5], [0.1, 0.5], 1.0)
+    weights = season * weekday
+    return weights / weights.sum()
+
+
+def random_times(rng, days, weights, size):
+    picked = rng.choice(len(days), size=size, p=weights)
+    seconds = rng.integers(7 * 3600, 19 * 3600, size=size)
+    base = np.array([np.datetime64(d) for d in days], dtype="datetime64[s]")
+    return base[picked] + seconds.astype("timedelta64[s]")
+
+
+def generate(engine, parts, machine_types, machines, positions, employees, movements, months, seed):
+    rng = np.random.default_rng(seed)
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = (end - timedelta(days=31 * months)).replace(day=1)
+    days = [start + timedelta(days=i) for i in range((end - start).days)]
+    weights = day_weights(days)
+
+    with engine.begin() as conn:
+        # group_mc.id trùng machine_type.id (trang xuất kho nối hai bảng theo id)
+        _insert(conn, "INSERT INTO machine_type (id, machine) VALUES (:id, :machine)",
+                [{"id": i, "machine": f"Loại máy {i:02d}"} for i in range(1, machine_types + 1)])
+        _insert(conn, "INSERT INTO group_mc (id, mc_name) VALUES (:id, :mc_name)",
+                [{"id": i, "mc_name": f"Nhóm máy {i:02d}"} for i in range(1, machine_types + 1)])
+
+        machine_groups = rng.integers(1, machine_types + 1, size=machines)
+        _insert(conn, "INSERT INTO machine (id, name, group_mc_id, dept_id) VALUES (:id, :name, :group_mc_id, 1)",
+                [{"id": i + 1, "name": f"MC-{i + 1:05d}", "group_mc_id": int(g)} for i, g in enumerate(machine_groups)])
+        # Nhãn vị trí lặp lại giữa các máy (P1..Pn) như dữ liệu thật: mc_pos không phải khóa duy nhất
+        pos_names = [f"P{p + 1}" for _ in range(machines) for p in range(positions)]
+        _insert(conn, "INSERT INTO machine_pos (id, mc_id, mc_pos) VALUES (:id, :mc_id, :mc_pos)",
+                [{"id": i + 1, "mc_id": i // positions + 1, "mc_pos": name} for i, name in enumerate(pos_names)])
+
+        empl_ids = [f"A{i:05d}" for i in range(1, employees + 1)]
+        _insert(conn, """
+            INSERT INTO employees (amann_id, name, title, level, active, birthday, start_date, address, phone_number, email, gender)
+            VALUES (:amann_id, :name, :title, :level, :active, :birthday, :start_date, 'Bình Dương', :phone, :email, :gender)
+        """, [{
+            "amann_id": empl_id,
+            "name": f"{FAMILY_NAMES[i % len(FAMILY_NAMES)]} {GIVEN_NAMES[(i * 7) % len(GIVEN_NAMES)]}",
+            "title": "Kỹ thuật viên" if i % 10 else "Tổ trưởng",
+            "level": ["Junior", "Senior", "Lead"][i % 3],
+            "active": "1" if i % 20 else "0",
+            "birthday": f"{1970 + i % 35}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+            "start_date": f"{2005 + i % 20}-{i % 12 + 1:02d}-01",
+            "phone": f"09{i:08d}",
+            "email": f"{empl_id.lower()}@example.com",
+            "gender": "Nam" if i % 3 else "Nữ",
+        } for i, empl_id in enumerate(empl_ids)])
+
+        material_nos = [f"{10_000_000 + i}" for i in range(parts)]
+        prices = np.round(rng.lognormal(3, 1.2, size=parts), 2)
+        part_types = rng.integers(1, machine_types + 1, size=parts)
+
+        n_exports = movements - movements // 10
+        # Phân phối Zipf: một số phụ tùng được xuất rất thường xuyên
+        export_part = (rng.zipf(1.3, size=n_exports) - 1) % parts
+        export_at = random_times(rng, days, weights, n_exports)
+        export_qty = rng.integers(1, 6, size=n_exports)
+        export_pos = rng.integers(0, len(pos_names), size=n_exports)
+        export_empl = rng.integers(0, employees, size=n_exports)
+        export_reason = rng.integers(0, len(EXPORT_REASONS), size=n_exports)
+
+        # Nhập kho: mỗi (phụ tùng, tháng) tối đa một dòng (bucket). Ngoài các lượt nhập ngẫu nhiên, tháng nào có
+        # xuất thì có một lượt nhập trước lượt xuất đầu tiên của tháng, đủ để tồn kho không bao giờ âm
+        # (lịch sử khớp với spare_parts.stock nên backfill_ledger không cần dòng 'adjust')
+        n_imports = movements // 10
+        import_at = random_times(rng, days, weights, n_imports)
+        import_part = rng.integers(0, parts, size=n_imports)
+        export_month = export_at.astype("datetime64[M]").astype(np.int64)
+        demand = pd.DataFrame({"part": export_part, "month": export_month, "at": export_at, "qty": export_qty})
+        demand = demand.groupby(["part", "month"]).agg(first=("at", "min"), qty=("qty", "sum"))
+        import_month = import_at.astype("datetime64[M]").astype(np.int64)
+        restock = pd.DataFrame({"part": import_part, "month": import_month, "at": import_at})
+        restock = restock.drop_duplicates(["part", "month"]).set_index(["part", "month"])
+        buckets = demand.join(restock, how="outer").sort_index()
+        before_first = buckets["at"] < buckets["first"]
+        buckets["at"] = buckets["at"].where(buckets["first"].isna() | before_first,
+                                            buckets["first"] - pd.Timedelta(hours=1))
+
+        # Nhập bù phần thiếu (tồn đầu tháng < tổng xuất trong tháng) cộng thêm lượng dự phòng ngẫu nhiên;
+        # các lượt xuất trong tháng đều sau lượt nhập nên tồn kho luôn >= 0
+        import_part = buckets.index.get_level_values("part").to_numpy()
+        month_demand = buckets["qty"].fillna(0).astype(int).to_numpy()
+        import_qty = rng.integers(20, 200, size=len(buckets))
+        stock = np.zeros(parts, dtype=int)
+        for i, (p, needed) in enumerate(zip(import_part, month_demand)):
+            import_qty[i] += max(needed - stock[p], 0)
+            stock[p] += import_qty[i] - needed
+        import_at = buckets["at"].to_numpy().astype("datetime64[s]")
+        import_month = import_at.astype("datetime64[M]")
+        # Bucket đã sắp theo (phụ tùng, tháng): giá trị cuối cùng của mỗi phụ tùng là lượt nhập gần nhất
+        last_import = {int(p): t for p, t in zip(import_part, import_at.astype(datetime))}
+
+        _insert(conn, """
+            INSERT INTO spare_parts (material_no, description, part_no, machine_type_id, bin, cost_center, price,
+                                     stock, safety_stock, safety_stock_check, import_date)
+            VALUES (:material_no, :description, :part_no, :machine_type_id, :bin, :cost_center, :price,
+                    :stock, :safety_stock, :safety_stock_check, :import_date)
+        """, [{
+            "material_no": material_nos[i],
+            "description": f"{PART_WORDS[i % len(PART_WORDS)]} {PART_SIZES[(i // 16) % len(PART_SIZES)]}",
+            "part_no": f"PN-{i * 7919 % 1_000_000:06d}",
+            "machine_type_id": int(part_types[i]),
+            "bin": f"K{i % 40:02d}-{i % 7}",
+            "cost_center": f"CC{i % 12:02d}",
+            "price": float(prices[i]),
+            "stock": int(stock[i]),
+            "safety_stock": int(5 + i % 20),
+            "safety_stock_check": "1" if i % 4 else "0",
+            "import_date": last_import.get(i),
+        } for i in range(parts)])
+
+        _insert(conn, """
+            INSERT INTO import_export (part_id, quantity, mc_pos_id, empl_id, date, reason, im_ex_flag, import_month)
+            VALUES (:part_id, :quantity, NULL, :empl_id, :date, 'Nhập kho', 1, :import_month)
+        """, [{
+            "part_id": material_nos[p],
+            "quantity": int(q),
+            "empl_id": empl_ids[int(p) % employees],
+            "date": t,
+            "import_month": m,
+        } for p, q, t, m in zip(import_part, import_qty, import_at.astype(datetime), import_month.astype(datetime))])
+
+        for start_row in range(0, n_exports, CHUNK_SIZE):
+            end_row = min(start_row + CHUNK_SIZE, n_exports)
+            conn.execute(text("""
+                INSERT INTO import_export (part_id, quantity, mc_pos_id, machine_pos_id, empl_id, date, reason, im_ex_flag)
+                VALUES (:part_id, :quantity, :mc_pos_id, :machine_pos_id, :empl_id, :date, :reason, 0)
+            """), [{
+                "part_id": material_nos[export_part[i]],
+                "quantity": int(export_qty[i]),
+                "mc_pos_id": pos_names[export_pos[i]],
+                "machine_pos_id": int(export_pos[i]) + 1,
+                "empl_id": empl_ids[export_empl[i]],
+                "date": export_at[i].astype(datetime),
+                "reason": EXPORT_REASONS[export_reason[i]],
+            } for i in range(start_row, end_row)])
+
+    return {"imports": len(import_part), "exports": n_exports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu kho giả lập")
+    parser.add_argument("--url", default=os.environ.get("WAREHOUSE_DB_URL"))
+    parser.add_argument("--parts", type=int, default=50_000)
+    parser.add_argument("--machine-types", type=int, default=30)
+    parser.add_argument("--machines", type=int, default=800)
+    parser.add_argument("--positions", type=int, default=4, help="Số vị trí mỗi máy")
+    parser.add_argument("--employees", type=int, default=300)
+    parser.add_argument("--movements", type=int, default=5_000_000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Xóa dữ liệu cũ trước khi sinh")
+    args = parser.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.gettempdir(), "warehouse_bench.db")
+    os.environ["WAREHOUSE_DB_URL"] = url
+
+    from database import get_engine
+    from migrations import upgrade
+    from stock_movements import rebuild_movement_monthly
+    from search_index import PARTS_CATALOG_VERSION
+    from stock_ledger import backfill_ledger, build_snapshots
+    from table_versions import bump
+
+    engine = get_engine()
+    upgrade(engine)
+
+    with engine.begin() as conn:
+        existing = conn.execute(text("SELECT COUNT(*) FROM spare_parts")).scalar()
+        if existing and not args.reset:
+            raise SystemExit(f"CSDL đã có {existing} phụ tùng; dùng --reset để xóa và sinh lại.")
+        for table in TABLES:
+            conn.execute(text(f"DELETE FROM {table}"))
+
+    started = time.perf_counter()
+    counts = generate(engine, args.parts, args.machine_types, args.machines, args.positions,
+                      args.employees, args.movements, args.months, args.seed)
+    rebuild_movement_monthly(engine)
+    backfill_ledger(engine)
+    build_snapshots(engine)
+    # Báo cho các tiến trình ứng dụng đang chạy tải lại cache
+    with engine.begin() as conn:
+        bump(conn, *TABLES, PARTS_CATALOG_VERSION)
+    print(f"Đã sinh {args.parts} phụ tùng, {args.machines} máy, {args.employees} nhân viên, "
+          f"{counts['imports']} dòng nhập, {counts['exports']} dòng xuất trong {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench/history_consistency.py
+# Kiểm tra bảng lịch sử nhập/xuất từng tháng không bị nhân dòng: số dòng bảng hiển thị phải bằng số dòng
+# import_export, tổng số lượng theo phụ tùng phải khớp sổ cái (stock_ledger), phân trang keyset phải ghép
+# lại đúng bằng cả tháng, và tên máy phải là máy của vị trí (machine_pos_id) ghi trên dòng xuất — kể cả khi
+# nhãn vị trí trùng giữa các máy như dữ liệu của bench.generate_data. Sai lệch thì exit 1.
+#   python -m bench.history_consistency --url sqlite:////tmp/warehouse_bench.db --months 6
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text
+
+LEDGER_KIND = {0: "export", 1: "import"}
+
+
+def _month_add(start, months):
+    index = start.year * 12 + start.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def check_month(engine, im_ex_flag, start, end, page_size):
+    from movement_history import fetch_history
+    from pages.export_stock import export_history_display
+
+    problems = []
+    df, _ = fetch_history(engine, im_ex_flag, start, end)
+    label = f"{start:%Y-%m} {LEDGER_KIND[im_ex_flag]}"
+
+    with engine.connect() as conn:
+        expected_rows = conn.execute(text("""
+            SELECT COUNT(*) FROM import_export ie JOIN spare_parts sp ON ie.part_id = sp.material_no
+            WHERE ie.im_ex_flag = :flag AND ie.date >= :start AND ie.date < :end
+        """), {"flag": im_ex_flag, "start": start, "end": end}).scalar()
+        ledger = dict(conn.execute(text("""
+            SELECT l.part_id, SUM(l.quantity) FROM stock_ledger l JOIN spare_parts sp ON l.part_id = sp.material_no
+            WHERE l.kind = :kind AND l.moved_at >= :start AND l.moved_at < :end
+            GROUP BY l.part_id
+        """), {"kind": LEDGER_KIND[im_ex_flag], "start": start, "end": end}).fetchall())
+        machines = dict(conn.execute(text("""
+            SELECT ie.id, m.name FROM import_export ie
+            JOIN machine_pos mp ON ie.machine_pos_id = mp.id
+            JOIN machine m ON mp.mc_id = m.id
+            WHERE ie.im_ex_flag = 0 AND ie.date >= :start AND ie.date < :end
+        """), {"start": start, "end": end}).fetchall())
+
+    if len(df) != expected_rows:
+        problems.append(f"{label}: {len(df)} dòng lịch sử, import_export có {expected_rows}")
+    if im_ex_flag == 0:
+        display = export_history_display(df)
+        if len(display) != len(df):
+            problems.append(f"{label}: bảng hiển thị {len(display)} dòng, lịch sử {len(df)} dòng")
+        if display["Số lượng"].sum() != df["quantity"].sum():
+            problems.append(f"{label}: tổng số lượng hiển thị khác lịch sử")
+        expected_machine = df["id"].map(machines)
+        wrong_machine = df[expected_machine.notna() & (df["machine_name"] != expected_machine)]
+        if not wrong_machine.empty:
+            problems.append(f"{label}: {len(wrong_machine)} dòng có tên máy không khớp vị trí")
+
+    history = df.groupby("part_id")["quantity"].sum().to_dict() if not df.empty else {}
+    mismatched = [p for p in set(history) | set(ledger) if int(history.get(p, 0)) != int(ledger.get(p, 0))]
+    if mismatched:
+        problems.append(f"{label}: {len(mismatched)} phụ tùng có tổng số lượng khác sổ cái (vd {sorted(mismatched)[:3]})")
+
+    # Ghép các trang keyset phải đúng bằng kết quả cả tháng
+    pages, cursor = [], None
+    while True:
+        page, cursor = fetch_history(engine, im_ex_flag, start, end, limit=page_size, cursor=cursor)
+        pages.append(page)
+        if cursor is None:
+            break
+    paged_ids = pd.concat(pages)["id"].tolist() if pages else []
+    if paged_ids != df["id"].tolist():
+        problems.append(f"{label}: phân trang ({len(paged_ids)} dòng) khác kết quả cả tháng ({len(df)} dòng)")
+    return len(df), problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra số dòng lịch sử nhập/xuất so với sổ cái")
+    parser.add_argument("--url", default=os.environ.get("WAREHOUSE_DB_URL"))
+    parser.add_argument("--months", type=int, default=6, help="Số tháng gần nhất cần kiểm tra")
+    parser.add_argument("--page-size", type=int, default=500)
+    args = parser.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.gettempdir(), "warehouse_bench.db")
+    os.environ["WAREHOUSE_DB_URL"] = url
+
+    from database import get_engine
+
+    engine = get_engine()
+    first_month = _month_add(datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+                             -(args.months - 1))
+
+    problems = []
+    for offset in range(args.months):
+        start, end = _month_add(first_month, offset), _month_add(first_month, offset + 1)
+        counts = []
+        for im_ex_flag in (1, 0):
+            rows, month_problems = check_month(engine, im_ex_flag, start, end, args.page_size)
+            counts.append(rows)
+            problems.extend(month_problems)
+        print(f"{start:%Y-%m}: {counts[0]:>7} dòng nhập  {counts[1]:>7} dòng xuất")
+
+    for problem in problems:
+        print("  " + problem)
+    if problems:
+        print(f"THẤT BẠI: {len(problems)} sai lệch")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# bench/import_budget.py
+# Đo thời gian import từng module trang trong tiến trình Python mới (streamlit đã được import sẵn,
+# giống như khi main.py gọi trang) và so với ngân sách trong bench/import_budget.json.
+#   python -m bench.import_budget            -> lỗi (exit 1) nếu trang nào vượt ngân sách
+#   python -m bench.import_budget --update   -> ghi lại ngân sách = số đo * hệ số dự phòng
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(REPO_ROOT, "bench", "import_budget.json")
+
+PAGE_MODULES = [
+    "pages.dashboard",
+    "pages.view_stock",
+    "pages.import_stock",
+    "pages.export_stock",
+    "pages.employees",
+    "pages.machine",
+    "pages.spare_parts",
+    "pages.login",
+]
+
+MEASURE_SCRIPT = """
+import sys, time
+sys.path.insert(0, {root!r})
+import streamlit
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+
+def measure(module, repeat):
+    # Lấy giá trị nhỏ nhất của nhiều lần đo để giảm nhiễu
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", MEASURE_SCRIPT.format(root=REPO_ROOT, module=module)],
+            capture_output=True, text=True, check=True, cwd=REPO_ROOT,
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra ngân sách thời gian import các trang")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--update", action="store_true", help="Ghi ngân sách mới từ số đo hiện tại")
+    parser.add_argument("--headroom", type=float, default=1.5, help="Hệ số dự phòng khi ghi ngân sách")
+    args = parser.parse_args()
+
+    budget = {}
+    if os.path.exists(BUDGET_FILE):
+        with open(BUDGET_FILE, encoding="utf-8") as f:
+            budget = json.load(f)
+
+    measured = {module: measure(module, args.repeat) for module in PAGE_MODULES}
+
+    failures = []
+    for module, seconds in measured.items():
+        limit = budget.get(module)
+        over = limit is not None and seconds > limit
+        if over:
+            failures.append(module)
+        limit_text = f"{limit * 1000:>7.0f} ms" if limit is not None else "      —"
+        print(f"{module:<20} {seconds * 1000:>7.0f} ms / ngân sách {limit_text}{'  <-- VƯỢT' if over else ''}")
+
+    if args.update:
+        # Sàn 50 ms để tránh ngân sách quá sát với nhiễu đo của các trang rất nhẹ
+        new_budget = {module: round(max(seconds * args.headroom, 0.05), 3) for module, seconds in measured.items()}
+        with open(BUDGET_FILE, "w", encoding="utf-8") as f:
+            json.dump(new_budget, f, indent=2)
+            f.write("\n")
+        print(f"Đã ghi ngân sách: {BUDGET_FILE}")
+        return
+
+    if failures:
+        print(f"THẤT BẠI: {len(failures)} trang vượt ngân sách import")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
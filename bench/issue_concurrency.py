@@ -0,0 +1,118 @@
+# bench/issue_concurrency.py
+# Bắn nhiều lượt xuất kho song song vào một phụ tùng và kiểm tra không bị xuất vượt tồn kho.
+#   python -m bench.issue_concurrency --url sqlite:////tmp/warehouse_bench.db --workers 32 --issues 300
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+BENCH_PART = "BENCH-CONCURRENCY"
+BENCH_POS = "BENCH-POS"
+
+SQLITE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS spare_parts (
+        material_no VARCHAR(50) PRIMARY KEY, description TEXT, stock INTEGER, price REAL,
+        import_date TIMESTAMP, export_date TIMESTAMP, version INTEGER NOT NULL DEFAULT 0)""",
+    """CREATE TABLE IF NOT EXISTS machine_pos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, mc_id INTEGER, mc_pos VARCHAR(50))""",
+    """CREATE TABLE IF NOT EXISTS import_export (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, part_id VARCHAR(50), quantity INTEGER, mc_pos_id VARCHAR(50),
+        machine_pos_id INTEGER, empl_id VARCHAR(50), date TIMESTAMP, reason TEXT, im_ex_flag SMALLINT,
+        import_month DATE)""",
+]
+
+
+def setup(engine, initial_stock):
+    from stock_ledger import ensure_stock_ledger
+    from stock_movements import MOVEMENT_TABLES, ensure_movement_monthly
+    from table_versions import bump, ensure_table_versions
+
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            for ddl in SQLITE_SCHEMA:
+                conn.execute(text(ddl))
+        ensure_movement_monthly(conn)
+        ensure_table_versions(conn)
+        ensure_stock_ledger(conn)
+
+        conn.execute(text("DELETE FROM import_export WHERE part_id = :p"), {"p": BENCH_PART})
+        conn.execute(text("DELETE FROM movement_monthly WHERE part_id = :p"), {"p": BENCH_PART})
+        conn.execute(text("DELETE FROM stock_ledger WHERE part_id = :p"), {"p": BENCH_PART})
+        conn.execute(text("DELETE FROM spare_parts WHERE material_no = :p"), {"p": BENCH_PART})
+        conn.execute(text("""
+            INSERT INTO spare_parts (material_no, description, stock, price)
+            VALUES (:p, 'Concurrency bench', :stock, 1)
+        """), {"p": BENCH_PART, "stock": initial_stock})
+
+        pos_id = conn.execute(text("SELECT id FROM machine_pos WHERE mc_pos = :pos"), {"pos": BENCH_POS}).scalar()
+        if pos_id is None:
+            conn.execute(text("INSERT INTO machine_pos (mc_id, mc_pos) VALUES (0, :pos)"), {"pos": BENCH_POS})
+            pos_id = conn.execute(text("SELECT id FROM machine_pos WHERE mc_pos = :pos"), {"pos": BENCH_POS}).scalar()
+        bump(conn, *MOVEMENT_TABLES, "machine_pos")
+    return pos_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra xuất kho đồng thời")
+    parser.add_argument("--url", default=os.environ.get("WAREHOUSE_DB_URL"))
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--issues", type=int, default=300)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--quantity", type=int, default=1)
+    args = parser.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.gettempdir(), "warehouse_concurrency.db")
+    os.environ["WAREHOUSE_DB_URL"] = url
+    os.environ.setdefault("DB_POOL_SIZE", str(args.workers))
+
+    from database import get_engine
+    from stock_movements import InsufficientStock, issue_stock
+
+    engine = get_engine()
+    pos_id = setup(engine, args.stock)
+
+    def one_issue(i):
+        try:
+            issue_stock(engine, BENCH_PART, args.quantity, pos_id, f"W{i % args.workers}", "bench")
+            return "ok"
+        except InsufficientStock:
+            return "conflict"
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        outcomes = list(pool.map(one_issue, range(args.issues)))
+    elapsed = time.perf_counter() - started
+
+    with engine.connect() as conn:
+        final_stock = conn.execute(
+            text("SELECT stock FROM spare_parts WHERE material_no = :p"), {"p": BENCH_PART}
+        ).scalar()
+        ledger_total = conn.execute(
+            text("SELECT COALESCE(SUM(quantity), 0) FROM import_export WHERE part_id = :p AND im_ex_flag = 0"),
+            {"p": BENCH_PART},
+        ).scalar()
+
+    issued = outcomes.count("ok") * args.quantity
+    print(f"{args.issues} lượt xuất, {args.workers} luồng, {elapsed:.2f}s: "
+          f"{outcomes.count('ok')} thành công, {outcomes.count('conflict')} bị từ chối, tồn cuối {final_stock}")
+
+    errors = []
+    if final_stock < 0:
+        errors.append("tồn kho âm")
+    if final_stock + issued != args.stock:
+        errors.append(f"tồn kho lệch: {final_stock} + {issued} != {args.stock}")
+    if ledger_total != issued:
+        errors.append(f"lịch sử xuất lệch: {ledger_total} != {issued}")
+
+    if errors:
+        print("THẤT BẠI: " + "; ".join(errors))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# bench/option_labels.py
+# So sánh dựng nhãn ô chọn bằng apply từng dòng với nối chuỗi theo cột (option_labels), và đo thời gian
+# LabelIndex.top() theo kích thước danh mục. top() tìm qua chỉ mục n-gram dựng trên đúng các cột của chỉ mục
+# phụ tùng dùng chung (search_index.PART_SEARCH_FIELDS); kết quả được đối chiếu với lọc toàn bộ danh mục:
+# sai lệch, nhãn khác cách cũ hoặc trả về quá --limit lựa chọn thì exit 1.
+#   python -m bench.option_labels --sizes 1000 10000 50000
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+KEYWORDS = ["", "vong bi", "VÒNG", "m0001", "m00123", "dây curoa", "zzz", "b1"]
+WORDS = ["Vòng bi", "Dây curoa", "Bánh răng", "Lò xo", "Ốc vít", "Cảm biến", "Kim", "Trục"]
+
+
+def make_parts(size, seed):
+    rng = np.random.default_rng(seed)
+    material_no = pd.Series([f"M{i:06d}" for i in range(size)])
+    return pd.DataFrame({
+        "material_no": material_no,
+        "description": [f"{WORDS[w]} {n}" for w, n in zip(rng.integers(0, len(WORDS), size), rng.integers(1, 999, size))],
+        "part_no": np.where(rng.random(size) < 0.1, None, "PN-" + material_no.str[1:]),
+        "bin": [f"B{n}" for n in rng.integers(1, 400, size)],
+        "cost_center": [f"CC{n:02d}" for n in rng.integers(0, 12, size)],
+        "stock": rng.integers(0, 500, size),
+    })
+
+
+def _timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def check_size(df, limit):
+    from option_labels import LABEL_FORMATS, build_label_index, columns_search
+    from search_index import FIELD_SEPARATOR, PART_SEARCH_FIELDS, normalize_text
+
+    problems = []
+    _, key, labeler, _ = LABEL_FORMATS["spare_parts_with_stock"]
+    old_labels, apply_ms = _timed(
+        lambda: df.apply(lambda x: f"{x['material_no']} - {x['description']} (Tồn: {x['stock']})", axis=1), repeat=1)
+    # Chỉ mục n-gram trong ứng dụng dựng theo phiên bản danh mục (get_parts_index), không theo mỗi lần dựng nhãn
+    searcher, index_ms = _timed(lambda: columns_search(*PART_SEARCH_FIELDS)(None, df, key), repeat=1)
+    index, build_ms = _timed(lambda: build_label_index(None, df, key, labeler, lambda *_: searcher), repeat=1)
+    if [index.label(k) for k in df[key]] != old_labels.tolist():
+        problems.append(f"{len(df)}: nhãn khác cách dựng cũ")
+
+    haystack = df[PART_SEARCH_FIELDS[0]].map(normalize_text)
+    for col in PART_SEARCH_FIELDS[1:]:
+        haystack = haystack + FIELD_SEPARATOR + df[col].map(normalize_text)
+    top_ms = []
+    for keyword in KEYWORDS:
+        result, ms = _timed(lambda: index.top(keyword, limit))
+        top_ms.append(ms)
+        kw = normalize_text(keyword)
+        expected = set(df.loc[haystack.str.contains(kw, regex=False), key]) if kw else set(df[key])
+        if len(result) != min(limit, len(expected)) or not set(result) <= expected:
+            problems.append(f"{len(df)} '{keyword}': {len(result)} kết quả, lọc toàn bộ có {len(expected)}")
+        elif kw and kw.upper() in set(df[key]) and result[0] != kw.upper():
+            problems.append(f"{len(df)} '{keyword}': mã trùng khớp không đứng đầu")
+    return apply_ms, build_ms, index_ms, max(top_ms), problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo dựng nhãn và tìm kiếm cho ô chọn phụ tùng")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    problems = []
+    for size in args.sizes:
+        apply_ms, build_ms, index_ms, top_ms, size_problems = check_size(make_parts(size, args.seed), args.limit)
+        problems.extend(size_problems)
+        print(f"{size:>7} phụ tùng  apply {apply_ms:>8.1f} ms  dựng nhãn {build_ms:>7.1f} ms (mỗi phiên bản spare_parts)  "
+              f"chỉ mục n-gram {index_ms:>7.1f} ms (mỗi phiên bản danh mục)  top {args.limit} chậm nhất {top_ms:>6.1f} ms")
+
+    for problem in problems:
+        print("  " + problem)
+    if problems:
+        print(f"THẤT BẠI: {len(problems)} sai lệch")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# bench/page_benchmark.py
+# Chạy từng trang bằng AppTest (không cần trình duyệt) và ghi lại thời gian, số truy vấn,
+# số dòng đọc từ CSDL (theo query_stats) và bộ nhớ đỉnh. Kết quả lưu dạng JSON để so sánh giữa các lần chạy.
+#   python -m bench.generate_data --url sqlite:////tmp/warehouse_bench.db
+#   python -m bench.page_benchmark --url sqlite:////tmp/warehouse_bench.db --runs 3
+#   python -m bench.page_benchmark --url ... --compare bench/results/<lần trước>.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+
+from sqlalchemy import event, text
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "bench", "results")
+
+# (tên, module, hàm hiển thị trang)
+PAGES = [
+    ("dashboard", "pages.dashboard", "show_dashboard"),
+    ("view_stock", "pages.view_stock", "show_view_stock"),
+    ("import_stock", "pages.import_stock", "show_material_page"),
+    ("export_stock", "pages.export_stock", "show_export_stock"),
+    ("employees", "pages.employees", "show_employees"),
+    ("machine", "pages.machine", "show_machine_page"),
+]
+
+# Chỉ số so sánh với lần chạy trước; vượt ngưỡng thì coi là chậm đi
+COMPARED_METRICS = ["warm_seconds", "queries", "rows"]
+# Bỏ qua chênh lệch thời gian nhỏ hơn mức này (nhiễu đo)
+MIN_SECONDS_DELTA = 0.05
+
+
+def render_page(repo_root, module_name, function_name):
+    # Chạy trong AppTest: mã nguồn hàm này được dùng làm script của trang
+    import importlib
+    import sys
+
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    getattr(importlib.import_module(module_name), function_name)()
+
+
+def add_sqlite_functions(engine):
+    if engine.dialect.name == "sqlite":
+        # Hàm MySQL mà các trang dùng, đăng ký cho bản SQLite thử cục bộ
+        @event.listens_for(engine, "connect")
+        def _mysql_functions(dbapi_conn, record):
+            dbapi_conn.create_function("CURDATE", 0, lambda: date.today().isoformat())
+            dbapi_conn.create_function("DATEDIFF", 2, lambda a, b: None if not a or not b else (
+                datetime.fromisoformat(str(a)[:10]) - datetime.fromisoformat(str(b)[:10])).days)
+
+        engine.dispose()
+
+
+def run_page(module_name, function_name, timeout):
+    import query_stats
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_function(render_page, args=(REPO_ROOT, module_name, function_name), default_timeout=timeout)
+    before = query_stats.totals()
+    tracemalloc.start()
+    started = time.perf_counter()
+    app.run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    after = query_stats.totals()
+
+    error = None
+    if app.exception:
+        error = str(app.exception[0].value).splitlines()[0][:200]
+    return {
+        "seconds": elapsed,
+        "queries": after["queries"] - before["queries"],
+        "rows": after["rows"] - before["rows"],
+        "db_seconds": after["seconds"] - before["seconds"],
+        "peak_mb": peak / 2 ** 20,
+        "error": error,
+    }
+
+
+def dataset_sizes(engine):
+    sizes = {}
+    with engine.connect() as conn:
+        for table in ["spare_parts", "import_export", "machine", "machine_pos", "employees"]:
+            sizes[table] = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+    return sizes
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(runs):
+    # Lần đầu là "cold" (cache rỗng); các lần sau lấy trung vị
+    warm = sorted(r["seconds"] for r in runs[1:]) or [runs[0]["seconds"]]
+    last = runs[-1]
+    return {
+        "db_seconds": round(last["db_seconds"], 4),
+        "cold_seconds": round(runs[0]["seconds"], 4),
+        "warm_seconds": round(warm[len(warm) // 2], 4),
+        "queries": last["queries"],
+        "rows": last["rows"],
+        "peak_mb": round(max(r["peak_mb"] for r in runs), 2),
+        "error": next((r["error"] for r in runs if r["error"]), None),
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for page, current in results["pages"].items():
+        previous = baseline.get("pages", {}).get(page)
+        if not previous:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            slower = change > threshold and not (metric.endswith("seconds") and new - old < MIN_SECONDS_DELTA)
+            marker = " <-- chậm hơn" if slower else ""
+            print(f"  {page:<14} {metric:<13} {old:>12} -> {new:>12} ({change:+.0%}){marker}")
+            if slower:
+                regressions.append((page, metric))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo hiệu năng các trang Streamlit")
+    parser.add_argument("--url", default=os.environ.get("WAREHOUSE_DB_URL"))
+    parser.add_argument("--runs", type=int, default=3, help="Số lần chạy mỗi trang (lần đầu là cold)")
+    parser.add_argument("--pages", nargs="*", default=[name for name, _, _ in PAGES])
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", default=None, help="File JSON kết quả (mặc định bench/results/<thời điểm>.json)")
+    parser.add_argument("--compare", default=None, help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Tỷ lệ chậm đi tối đa cho phép khi so sánh")
+    args = parser.parse_args()
+
+    url = args.url or "sqlite:///" + os.path.join(tempfile.gettempdir(), "warehouse_bench.db")
+    os.environ["WAREHOUSE_DB_URL"] = url
+    sys.path.insert(0, REPO_ROOT)
+
+    from database import get_engine
+
+    engine = get_engine()
+    add_sqlite_functions(engine)
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "dialect": engine.dialect.name,
+        "python": platform.python_version(),
+        "dataset": dataset_sizes(engine),
+        "runs": args.runs,
+        "pages": {},
+    }
+
+    for name, module_name, function_name in PAGES:
+        if name not in args.pages:
+            continue
+        runs = [run_page(module_name, function_name, args.timeout) for _ in range(max(args.runs, 1))]
+        summary = summarize(runs)
+        results["pages"][name] = summary
+        status = f"LỖI: {summary['error']}" if summary["error"] else ""
+        print(f"{name:<14} cold {summary['cold_seconds']:>7.2f}s  warm {summary['warm_seconds']:>7.2f}s  "
+              f"CSDL {summary['db_seconds']:>7.2f}s  {summary['queries']:>4} truy vấn  {summary['rows']:>9} dòng  {summary['peak_mb']:>8.1f} MB  {status}")
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Đã lưu kết quả: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"So sánh với {args.compare} (commit {baseline.get('commit')}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"THẤT BẠI: {len(regressions)} chỉ số vượt ngưỡng {args.threshold:.0%}")
+            sys.exit(1)
+        print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# bench/part_edits.py
+# Kiểm tra sửa phụ tùng có kiểm tra phiên bản dòng (stock_movements.update_part) trên CSDL tạm:
+# chỉ ghi cột đã đổi (kể cả cờ safety_stock_check lưu kiểu '1'/'0' như form thêm mới),
+# lượt xuất kho xen vào làm lần sửa sau báo xung đột thay vì ghi đè tồn kho,
+# hai người sửa cùng lúc thì chỉ một người lưu được, và refresh_rows chỉ thay đúng dòng vừa sửa trong cache.
+# Sai lệch thì exit 1.
+#   python -m bench.part_edits --parts 20000
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+PART = "EDIT-0000"
+
+
+def setup(engine, parts):
+    from migrations import upgrade
+    from table_versions import bump
+
+    upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO spare_parts (material_no, description, bin, price, stock, safety_stock, safety_stock_check)
+            VALUES (:material_no, :description, :bin, 1.5, 100, 5, :safety_stock_check)
+        """), [{"material_no": f"EDIT-{i:04d}", "description": f"Phụ tùng {i}", "bin": f"B{i % 50}",
+                "safety_stock_check": "1" if i % 2 == 0 else "0"}
+               for i in range(parts)])
+        conn.execute(text("INSERT INTO machine_pos (mc_id, mc_pos) VALUES (0, 'EDIT-POS')"))
+        bump(conn, "spare_parts", "machine_pos")
+        return conn.execute(text("SELECT id FROM machine_pos WHERE mc_pos = 'EDIT-POS'")).scalar()
+
+
+def cached_row(engine):
+    from reference_data import get_table
+
+    parts = get_table(engine, "spare_parts")
+    return parts[parts["material_no"] == PART].iloc[0].to_dict()
+
+
+def db_row(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(text("SELECT * FROM spare_parts WHERE material_no = :p"), {"p": PART}).mappings().one())
+
+
+def ledger_total(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COALESCE(SUM(delta), 0) FROM stock_ledger WHERE part_id = :p"),
+                            {"p": PART}).scalar()
+
+
+def run_checks(engine, pos_id):
+    from reference_data import _tables, discard_table, get_table, refresh_rows
+    from stock_movements import (PartEditConflict, changed_part_columns, issue_stock, issue_stock_batch,
+                                 safety_check_enabled, update_part)
+
+    problems = []
+
+    # Chỉ cột đã đổi được gửi đi
+    opened = cached_row(engine)
+    changes = changed_part_columns(opened, {"description": "Phụ tùng 0 (đã sửa)", "bin": opened["bin"],
+                                            "price": 1.5, "part_no": ""})
+    if changes != {"description": "Phụ tùng 0 (đã sửa)"}:
+        problems.append(f"cột thay đổi sai: {changes}")
+
+    # Cờ '1'/'0': để nguyên nút chọn mặc định (như pages/spare_parts.py) thì không đổi, bấm đổi thì giữ kiểu 1/0
+    for part_id, flipped in ((PART, "0"), ("EDIT-0001", "1")):
+        parts = get_table(engine, "spare_parts")
+        flag = parts.loc[parts["material_no"] == part_id, "safety_stock_check"].iloc[0]
+        radio = "Yes" if safety_check_enabled(flag) else "No"
+        untouched = changed_part_columns({"safety_stock_check": flag}, {"safety_stock_check": radio})
+        toggled = changed_part_columns({"safety_stock_check": flag},
+                                       {"safety_stock_check": "No" if radio == "Yes" else "Yes"})
+        if untouched or toggled != {"safety_stock_check": flipped}:
+            problems.append(f"cờ safety_stock_check {flag!r}: không đổi -> {untouched}, đổi -> {toggled}")
+
+    before = get_table(engine, "spare_parts")
+    new_version = update_part(engine, PART, opened["version"], changes)
+    started = time.perf_counter()
+    refresh_rows(engine, "spare_parts", "material_no", [PART], new_version)
+    refresh_ms = (time.perf_counter() - started) * 1000
+    after = get_table(engine, "spare_parts")
+    if after is before or cached_row(engine)["description"] != "Phụ tùng 0 (đã sửa)":
+        problems.append("refresh_rows không thay dòng vừa sửa trong cache")
+    elif not after.drop(columns=["description", "version"]).equals(before.drop(columns=["description", "version"])):
+        problems.append("refresh_rows làm đổi các dòng khác")
+    if len(after) != len(before) or list(after.dtypes) != list(before.dtypes):
+        problems.append("refresh_rows làm đổi số dòng hoặc kiểu cột")
+
+    # Lượt xuất kho xen vào giữa lúc mở form và lúc lưu: phải báo xung đột, không ghi đè tồn kho
+    opened = cached_row(engine)
+    issue_stock(engine, PART, 7, pos_id, None, "bench")
+    try:
+        update_part(engine, PART, opened["version"], {"bin": "B-NEW"}, new_stock=opened["stock"] + 1)
+        problems.append("không báo xung đột sau lượt xuất kho")
+    except PartEditConflict as e:
+        if e.current["stock"] != opened["stock"] - 7:
+            problems.append(f"xung đột báo tồn kho {e.current['stock']}, đúng ra {opened['stock'] - 7}")
+    row = db_row(engine)
+    if row["stock"] != opened["stock"] - 7 or row["bin"] == "B-NEW":
+        problems.append("lần sửa bị xung đột vẫn ghi vào CSDL")
+
+    # Đặt lại tồn kho với phiên bản mới nhất: chênh lệch được ghi vào sổ cái
+    ledger_before = ledger_total(engine)
+    update_part(engine, PART, row["version"], {}, new_stock=50)
+    ledger_delta = ledger_total(engine) - ledger_before
+    if db_row(engine)["stock"] != 50 or ledger_delta != 50 - row["stock"]:
+        problems.append(f"đặt lại tồn kho: stock {db_row(engine)['stock']}, sổ cái ghi {ledger_delta}")
+
+    # Hai người cùng mở form và cùng lưu: chỉ một người thành công
+    version = db_row(engine)["version"]
+    barrier = threading.Barrier(2)
+    outcomes = []
+
+    def editor(bin_value):
+        barrier.wait()
+        try:
+            update_part(engine, PART, version, {"bin": bin_value})
+            outcomes.append("ok")
+        except PartEditConflict:
+            outcomes.append("conflict")
+
+    threads = [threading.Thread(target=editor, args=(f"B-{i}",)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if sorted(outcomes) != ["conflict", "ok"]:
+        problems.append(f"hai người sửa đồng thời: {outcomes}")
+
+    # Giỏ xuất kho đổi A và B trong lúc đang sửa A: bản cache không được gắn phiên bản mới khi B còn cũ
+    other = "EDIT-0001"
+    get_table(engine, "spare_parts")
+    opened = cached_row(engine)
+    issue_stock_batch(engine, [
+        {"part_id": part_id, "quantity": 3, "mc_pos_id": pos_id, "empl_id": None, "reason": "bench", "is_foc": False}
+        for part_id in (PART, other)
+    ])
+    try:
+        update_part(engine, PART, opened["version"], {"bin": "B-CART"})
+        problems.append("không báo xung đột sau giỏ xuất kho")
+    except PartEditConflict:
+        discard_table("spare_parts")
+    for label in ("sau xung đột", "sau khi lưu lại"):
+        parts = get_table(engine, "spare_parts")
+        with engine.connect() as conn:
+            db_stock = conn.execute(text("SELECT stock FROM spare_parts WHERE material_no = :p"), {"p": other}).scalar()
+        cached_stock = parts.loc[parts["material_no"] == other, "stock"].iloc[0]
+        if cached_stock != db_stock:
+            problems.append(f"{label}: cache giữ tồn kho cũ của {other}: {cached_stock}, CSDL {db_stock}")
+        new_version = update_part(engine, PART, db_row(engine)["version"], {"bin": f"B-{label}"})
+        refresh_rows(engine, "spare_parts", "material_no", [PART], new_version)
+        if cached_row(engine)["bin"] != f"B-{label}":
+            problems.append(f"{label}: refresh_rows không vá dòng vừa sửa")
+
+    # So với tải lại cả bảng
+    _tables.pop("spare_parts", None)
+    started = time.perf_counter()
+    get_table(engine, "spare_parts")
+    reload_ms = (time.perf_counter() - started) * 1000
+    return refresh_ms, reload_ms, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra sửa phụ tùng có kiểm tra phiên bản dòng")
+    parser.add_argument("--parts", type=int, default=20000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), "warehouse_part_edits.db")
+    if os.path.exists(path):
+        os.remove(path)
+    os.environ["WAREHOUSE_DB_URL"] = "sqlite:///" + path
+
+    from database import get_engine
+
+    engine = get_engine()
+    pos_id = setup(engine, args.parts)
+    refresh_ms, reload_ms, problems = run_checks(engine, pos_id)
+    print(f"{args.parts} phụ tùng: refresh_rows {refresh_ms:.1f} ms, tải lại cả bảng {reload_ms:.1f} ms")
+
+    for problem in problems:
+        print("  " + problem)
+    if problems:
+        print(f"THẤT BẠI: {len(problems)} sai lệch")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
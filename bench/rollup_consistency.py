@@ -0,0 +1,106 @@
+# bench/rollup_consistency.py
+# Kiểm tra bảng tổng hợp movement_monthly ghi dần (nhập tay, nhập từ file, xuất kho, sửa đơn giá)
+# luôn bằng kết quả rebuild_movement_monthly trên CSDL tạm: cả hai đường tính giá trị theo đơn giá hiện tại.
+# Sai lệch thì exit 1.
+#   python -m bench.rollup_consistency --parts 200
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import text
+
+ROLLUP_QUERY = "SELECT month, part_id, im_ex_flag, quantity, value FROM movement_monthly"
+
+
+def setup(engine, parts):
+    from migrations import upgrade
+    from table_versions import bump
+
+    upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO spare_parts (material_no, description, price, stock)
+            VALUES (:material_no, :description, :price, 1000)
+        """), [{"material_no": f"ROLL-{i:04d}", "description": f"Phụ tùng {i}", "price": 1 + i % 7}
+               for i in range(parts)])
+        conn.execute(text("INSERT INTO machine_pos (mc_id, mc_pos) VALUES (0, 'ROLL-POS')"))
+        bump(conn, "spare_parts", "machine_pos")
+        return conn.execute(text("SELECT id FROM machine_pos WHERE mc_pos = 'ROLL-POS'")).scalar()
+
+
+def rollup(engine):
+    with engine.connect() as conn:
+        return {
+            (str(month)[:10], part_id, im_ex_flag): (quantity, round(value, 6))
+            for month, part_id, im_ex_flag, quantity, value in conn.execute(text(ROLLUP_QUERY))
+        }
+
+
+def run_movements(engine, pos_id, parts, rounds):
+    # Nhập/xuất qua đúng các hàm mà các trang gọi, rải trên nhiều tháng, đơn giá đổi sau mỗi lượt nhập
+    from stock_movements import apply_receipts, issue_stock_batch, receive_stock, record_import, update_part
+
+    rng = random.Random(7)
+    part_ids = [f"ROLL-{i:04d}" for i in range(parts)]
+    for n in range(rounds):
+        moved_at = datetime(2025, 1 + n % 12, 1 + n % 28, 8, 0)
+        part_id = rng.choice(part_ids)
+        with engine.begin() as conn:
+            record_import(conn, part_id, 20, None, moved_at)
+            receive_stock(conn, part_id, 20, round(rng.uniform(1, 50), 2), moved_at)
+
+        apply_receipts(engine, [(p, 10, round(rng.uniform(1, 50), 2) if rng.random() < 0.5 else None)
+                                for p in rng.sample(part_ids, 5)], None, moved_at)
+
+        issue_stock_batch(engine, [
+            {"part_id": p, "quantity": 2, "mc_pos_id": pos_id, "empl_id": None, "reason": "bench", "is_foc": False}
+            for p in rng.sample(part_ids, 3)
+        ], moved_at)
+
+        part_id = rng.choice(part_ids)
+        with engine.connect() as conn:
+            version = conn.execute(text("SELECT version FROM spare_parts WHERE material_no = :p"),
+                                   {"p": part_id}).scalar()
+        update_part(engine, part_id, version, {"price": round(rng.uniform(1, 50), 2)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra bảng tổng hợp ghi dần khớp với dựng lại")
+    parser.add_argument("--parts", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=300)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), "warehouse_rollup.db")
+    if os.path.exists(path):
+        os.remove(path)
+    os.environ["WAREHOUSE_DB_URL"] = "sqlite:///" + path
+
+    from database import get_engine
+    from stock_movements import rebuild_movement_monthly
+
+    engine = get_engine()
+    pos_id = setup(engine, args.parts)
+    run_movements(engine, pos_id, args.parts, args.rounds)
+    incremental = rollup(engine)
+    rebuild_movement_monthly(engine)
+    rebuilt = rollup(engine)
+
+    problems = [
+        f"{key}: ghi dần {incremental.get(key)}, dựng lại {rebuilt.get(key)}"
+        for key in sorted(set(incremental) | set(rebuilt))
+        if incremental.get(key) != rebuilt.get(key)
+    ]
+    print(f"{args.rounds} lượt, {len(rebuilt)} bucket tổng hợp")
+    for problem in problems[:20]:
+        print("  " + problem)
+    if problems:
+        print(f"THẤT BẠI: {len(problems)} sai lệch")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# bench/stock_as_of.py
+# Đo stock_as_of / stock_as_of_all với các độ dài lịch sử khác nhau (cùng mật độ nhập/xuất mỗi tháng):
+# nhờ ảnh chụp đầu tháng, thời gian truy vấn gần như không đổi khi lịch sử dài ra. Kết quả được
+# đối chiếu với cách cộng toàn bộ sổ cái; sai lệch hoặc tăng quá --max-growth lần thì exit 1.
+#   python -m bench.stock_as_of --months 12 48 192 --per-month 5000
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, text
+
+CHUNK_SIZE = 50_000
+
+
+def build_database(path, months, per_month, parts, seed):
+    from migrations import LEDGER_INDEXES, create_index
+    from stock_ledger import build_snapshots, ensure_stock_ledger
+
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine("sqlite:///" + path)
+    rng = np.random.default_rng(seed)
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=31 * months)
+    total = months * per_month
+
+    offsets = np.sort(rng.integers(0, int((end - start).total_seconds()), size=total))
+    part_ids = rng.integers(0, parts, size=total)
+    quantities = rng.integers(1, 20, size=total)
+    is_import = rng.random(size=total) < 0.4
+    # Lượt xuất vượt tồn kho hiện có được đổi thành lượt nhập: tồn kho của mỗi phụ tùng không bao giờ âm
+    balance = np.zeros(parts, dtype=np.int64)
+    for i in range(total):
+        if not is_import[i] and balance[part_ids[i]] < quantities[i]:
+            is_import[i] = True
+        balance[part_ids[i]] += quantities[i] if is_import[i] else -quantities[i]
+
+    with engine.begin() as conn:
+        ensure_stock_ledger(conn)
+        for name, table, columns in LEDGER_INDEXES:
+            create_index(conn, name, table, columns)
+        for chunk in range(0, total, CHUNK_SIZE):
+            conn.execute(text("""
+                INSERT INTO stock_ledger (part_id, moved_at, kind, quantity, delta)
+                VALUES (:part_id, :moved_at, :kind, :quantity, :delta)
+            """), [{
+                "part_id": f"P{int(part_ids[i]):05d}",
+                "moved_at": start + timedelta(seconds=int(offsets[i])),
+                "kind": "import" if is_import[i] else "export",
+                "quantity": int(quantities[i]),
+                "delta": int(quantities[i]) if is_import[i] else -int(quantities[i]),
+            } for i in range(chunk, min(chunk + CHUNK_SIZE, total))])
+
+    started = time.perf_counter()
+    build_snapshots(engine)
+    return engine, end, time.perf_counter() - started
+
+
+def full_scan(engine, part_id, moment):
+    with engine.connect() as conn:
+        return conn.execute(text("""
+            SELECT COALESCE(SUM(delta), 0) FROM stock_ledger WHERE part_id = :part_id AND moved_at <= :moment
+        """), {"part_id": part_id, "moment": moment}).scalar()
+
+
+def measure(engine, end, parts, samples, seed):
+    from stock_ledger import stock_as_of, stock_as_of_all
+
+    rng = random.Random(seed)
+    # Các ngày trong năm gần nhất: vị trí trong lịch sử như nhau với mọi độ dài lịch sử
+    points = [(f"P{rng.randrange(parts):05d}", (end - timedelta(days=rng.randrange(1, 365))).date())
+              for _ in range(samples)]
+
+    started = time.perf_counter()
+    values = [stock_as_of(engine, part_id, day) for part_id, day in points]
+    as_of_ms = (time.perf_counter() - started) * 1000 / samples
+
+    started = time.perf_counter()
+    expected = [full_scan(engine, part_id, datetime.combine(day, dt_time.max)) for part_id, day in points]
+    scan_ms = (time.perf_counter() - started) * 1000 / samples
+
+    day = (end - timedelta(days=45)).date()
+    started = time.perf_counter()
+    snapshot = stock_as_of_all(engine, day)
+    all_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        all_expected = dict(conn.execute(text("""
+            SELECT part_id, SUM(delta) FROM stock_ledger WHERE moved_at <= :moment GROUP BY part_id
+        """), {"moment": datetime.combine(day, dt_time.max)}).fetchall())
+    all_scan_ms = (time.perf_counter() - started) * 1000
+
+    mismatches = sum(1 for value, exp in zip(values, expected) if value != exp)
+    mismatches += sum(1 for part_id, stock in zip(snapshot["part_id"], snapshot["stock"])
+                      if stock != all_expected.get(part_id, 0))
+    return {"as_of_ms": as_of_ms, "scan_ms": scan_ms, "all_ms": all_ms, "all_scan_ms": all_scan_ms,
+            "mismatches": mismatches}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo tồn kho tại một thời điểm theo độ dài lịch sử")
+    parser.add_argument("--months", type=int, nargs="+", default=[12, 48, 192])
+    parser.add_argument("--per-month", type=int, default=5000, help="Số dòng sổ cái mỗi tháng")
+    parser.add_argument("--parts", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-growth", type=float, default=3.0,
+                        help="Tỷ lệ tối đa giữa thời gian stock_as_of của lịch sử dài nhất và ngắn nhất")
+    args = parser.parse_args()
+
+    results = {}
+    for months in sorted(args.months):
+        path = os.path.join(tempfile.gettempdir(), f"warehouse_ledger_{months}.db")
+        engine, end, snapshot_seconds = build_database(path, months, args.per_month, args.parts, args.seed)
+        result = measure(engine, end, args.parts, args.samples, args.seed)
+        results[months] = result
+        print(f"{months:>4} tháng {months * args.per_month:>9} dòng  ảnh chụp {snapshot_seconds:>6.2f}s  "
+              f"stock_as_of {result['as_of_ms']:>7.2f} ms  (cộng toàn bộ {result['scan_ms']:>7.2f} ms)  "
+              f"stock_as_of_all {result['all_ms']:>8.1f} ms  (cộng toàn bộ {result['all_scan_ms']:>8.1f} ms)  sai lệch {result['mismatches']}")
+        engine.dispose()
+
+    failed = False
+    if any(r["mismatches"] for r in results.values()):
+        print("THẤT BẠI: kết quả khác với cộng toàn bộ sổ cái")
+        failed = True
+    shortest, longest = results[min(results)], results[max(results)]
+    growth = longest["as_of_ms"] / shortest["as_of_ms"]
+    print(f"stock_as_of: lịch sử dài nhất / ngắn nhất = {growth:.2f} lần")
+    if growth > args.max_growth:
+        print(f"THẤT BẠI: chi phí tăng quá {args.max_growth} lần")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# bulk_receipts.py
+import io
+
+import numpy as np
+import pandas as pd
+
+from reference_data import get_table
+
+# Tên cột chấp nhận trong file nhà cung cấp -> tên cột chuẩn
+COLUMN_ALIASES = {
+    "material_no": "material_no",
+    "material no": "material_no",
+    "mã vật liệu": "material_no",
+    "ma vat lieu": "material_no",
+    "quantity": "quantity",
+    "qty": "quantity",
+    "số lượng": "quantity",
+    "so luong": "quantity",
+    "price": "price",
+    "unit price": "price",
+    "đơn giá": "price",
+    "don gia": "price",
+}
+
+REQUIRED_COLUMNS = ["material_no", "quantity"]
+
+
+def read_receipt_file(name, data):
+    # Đọc file CSV hoặc Excel, chuẩn hóa tên cột
+    if name.lower().endswith(".csv"):
+        df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_excel(io.BytesIO(data), dtype=str, keep_default_na=False)
+
+    df.columns = [COLUMN_ALIASES.get(str(col).strip().lower(), str(col).strip().lower()) for col in df.columns]
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"File thiếu cột bắt buộc: {', '.join(missing)}.")
+    if "price" not in df.columns:
+        df["price"] = ""
+    return df[["material_no", "quantity", "price"]]
+
+
+def load_part_catalog(engine):
+    return get_table(engine, "spare_parts")[["material_no", "description", "stock", "price"]]
+
+
+def validate_receipts(df, catalog):
+    # Kiểm tra toàn bộ dòng bằng phép toán vector; trả về bảng có cột 'error' (rỗng nếu hợp lệ)
+    result = pd.DataFrame({"line": np.arange(2, len(df) + 2)}, index=df.index)
+    result["material_no"] = df["material_no"].astype(str).str.strip()
+
+    quantity_raw = df["quantity"].astype(str).str.strip()
+    quantity = pd.to_numeric(quantity_raw, errors="coerce")
+    result["quantity"] = quantity
+
+    price_raw = df["price"].astype(str).str.strip().str.replace("$", "", regex=False).str.replace(" ", "", regex=False)
+    price = pd.to_numeric(price_raw, errors="coerce")
+    result["price"] = price
+
+    errors = pd.Series("", index=df.index)
+    errors = errors.mask(result["material_no"] == "", "Thiếu mã vật liệu")
+    errors = errors.mask(
+        (errors == "") & ~result["material_no"].isin(catalog["material_no"].astype(str)),
+        "Mã vật liệu không tồn tại"
+    )
+    errors = errors.mask((errors == "") & quantity.isna(), "Số lượng không hợp lệ")
+    errors = errors.mask((errors == "") & (quantity <= 0), "Số lượng phải lớn hơn 0")
+    errors = errors.mask((errors == "") & (quantity % 1 != 0), "Số lượng phải là số nguyên")
+    errors = errors.mask((errors == "") & (price_raw != "") & price.isna(), "Đơn giá không hợp lệ")
+    errors = errors.mask((errors == "") & (price < 0), "Đơn giá không được âm")
+    result["error"] = errors
+    return result
+
+
+def summarize_receipts(valid, catalog):
+    # Gộp theo mã vật liệu và so sánh với tồn kho/đơn giá hiện tại (bảng xem trước)
+    grouped = valid.groupby("material_no", sort=True).agg(
+        quantity=("quantity", "sum"),
+        price=("price", "last"),
+    ).reset_index()
+    grouped["quantity"] = grouped["quantity"].astype(int)
+
+    preview = grouped.merge(
+        catalog.rename(columns={"stock": "current_stock", "price": "current_price"}),
+        on="material_no",
+        how="left",
+    )
+    preview["current_stock"] = preview["current_stock"].fillna(0).astype(int)
+    preview["new_stock"] = preview["current_stock"] + preview["quantity"]
+    preview["new_price"] = preview["price"].fillna(preview["current_price"])
+    return preview[["material_no", "description", "current_stock", "quantity", "new_stock", "current_price", "new_price", "price"]]
+
+
+def receipts_from_preview(preview):
+    # Danh sách (part_id, quantity, price) cho stock_movements.apply_receipts
+    prices = preview["price"].astype(object).where(preview["price"].notna(), None)
+    return list(zip(preview["material_no"], preview["quantity"].astype(int).tolist(), prices.tolist()))
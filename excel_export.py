@@ -0,0 +1,93 @@
+# excel_export.py
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from table_versions import current_versions
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Số file Excel giữ trong cache của tiến trình
+CACHE_MAX_ENTRIES = 16
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def build_workbook(df, sheet_name):
+    # Ghi từng dòng ra file tạm với chế độ constant_memory của xlsxwriter (không dùng in_memory vì
+    # in_memory tắt constant_memory): bảng tính không nằm trọn trong bộ nhớ, chỉ file nén cuối cùng được đọc lại
+    import xlsxwriter
+
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    try:
+        workbook = xlsxwriter.Workbook(path, {
+            "constant_memory": True,
+            "default_date_format": "yyyy-mm-dd hh:mm",
+            "remove_timezone": True,
+        })
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, [str(col) for col in df.columns])
+        # Duyệt thẳng trên DataFrame, ô trống (NaN/NaT/None) ghi thành ô rỗng
+        for row_idx, row in enumerate(df.itertuples(index=False, name=None), start=1):
+            worksheet.write_row(row_idx, 0, [None if pd.isna(value) else value for value in row])
+        workbook.close()
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def get_workbook(cache_key, load_df, sheet_name):
+    with _cache_lock:
+        if cache_key in _cache:
+            _cache.move_to_end(cache_key)
+            return _cache[cache_key]
+
+    data = build_workbook(load_df(), sheet_name)
+    with _cache_lock:
+        _cache[cache_key] = data
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return data
+
+
+def excel_download(engine, name, filters, tables, load_df, file_name, sheet_name, label="📥 Download Excel"):
+    # Chỉ tạo file khi người dùng bấm nút; file được cache theo (bộ lọc, phiên bản các bảng nguồn trong
+    # table_versions) nên lần bấm sau với cùng dữ liệu không cần đọc lại CSDL
+    state_key = f"excel_export_{name}"
+    filter_hash = _digest([name, filters])
+
+    if st.button("📄 Tạo file Excel", key=f"{state_key}_prepare"):
+        versions = current_versions(engine)
+        cache_key = _digest([filter_hash, [versions.get(table, 0) for table in tables]])
+        get_workbook(cache_key, load_df, sheet_name)
+        st.session_state[state_key] = (filter_hash, cache_key)
+
+    prepared = st.session_state.get(state_key)
+    if not prepared or prepared[0] != filter_hash:
+        return
+
+    with _cache_lock:
+        data = _cache.get(prepared[1])
+    if data is None:
+        return
+
+    st.download_button(
+        label=label,
+        data=data,
+        file_name=file_name,
+        mime=XLSX_MIME,
+        key=f"{state_key}_download",
+    )
@@ -0,0 +1,62 @@
+# kpi.py
+import threading
+
+from sqlalchemy import text
+
+from table_versions import current_versions
+
+# Cache chỉ số tổng quan được tính lại khi một trong các bảng này đổi phiên bản
+KPI_TABLES = ("spare_parts", "import_export")
+
+KPI_QUERY = text("""
+    SELECT
+        s.stock_units,
+        s.stock_value,
+        m.import_units,
+        m.export_units,
+        m.export_value
+    FROM (
+        SELECT
+            COALESCE(SUM(stock), 0) AS stock_units,
+            COALESCE(SUM(stock * price), 0) AS stock_value
+        FROM spare_parts
+    ) s
+    CROSS JOIN (
+        SELECT
+            COALESCE(SUM(CASE WHEN ie.im_ex_flag = 1 THEN ie.quantity ELSE 0 END), 0) AS import_units,
+            COALESCE(SUM(CASE WHEN ie.im_ex_flag = 0 THEN ie.quantity ELSE 0 END), 0) AS export_units,
+            COALESCE(SUM(CASE WHEN ie.im_ex_flag = 0 THEN ie.quantity * sp.price ELSE 0 END), 0) AS export_value
+        FROM import_export ie
+        LEFT JOIN spare_parts sp ON ie.part_id = sp.material_no
+    ) m
+""")
+
+_cache = {"value": None, "version": None}
+_cache_lock = threading.Lock()
+
+
+def fetch_kpis(engine):
+    # Tính cả 5 chỉ số trong một lần truy vấn
+    with engine.connect() as conn:
+        row = conn.execute(KPI_QUERY).mappings().one()
+    return {
+        "stock_units": int(row["stock_units"] or 0),
+        "stock_value": float(row["stock_value"] or 0),
+        "import_units": int(row["import_units"] or 0),
+        "export_units": int(row["export_units"] or 0),
+        "export_value": float(row["export_value"] or 0),
+    }
+
+
+def get_kpis(engine):
+    versions = current_versions(engine)
+    version = tuple(versions.get(table, 0) for table in KPI_TABLES)
+    with _cache_lock:
+        if _cache["value"] is not None and _cache["version"] == version:
+            return _cache["value"]
+
+    value = fetch_kpis(engine)
+    with _cache_lock:
+        _cache["value"] = value
+        _cache["version"] = version
+    return value
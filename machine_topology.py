@@ -0,0 +1,92 @@
+# machine_topology.py
+# Cây nhóm máy -> máy -> vị trí máy (và loại máy -> các máy dùng được) giữ trong bộ nhớ.
+# Dựng một lần cho mỗi phiên bản của group_mc/machine/machine_pos (reference_data.get_derived),
+# dùng chung cho mọi phiên: chọn máy và vị trí không cần truy vấn CSDL. Chỉ đọc, không sửa.
+from collections import defaultdict
+
+from reference_data import get_derived, get_table
+
+TOPOLOGY_TABLES = ["group_mc", "machine", "machine_pos"]
+
+
+def _name_key(value):
+    # So khớp tên không phân biệt hoa thường và khoảng trắng hai đầu
+    return str(value).strip().lower()
+
+
+class MachineTopology:
+    def __init__(self, groups, machines, positions):
+        # groups: id, mc_name; machines: id, name, group_mc_id; positions: id, mc_id, mc_pos
+        self.groups = {}
+        self.group_ids_by_name = {}
+        for group_id, name in zip(groups["id"].tolist(), groups["mc_name"].tolist()):
+            self.groups[group_id] = name
+            self.group_ids_by_name[name] = group_id
+
+        self.machines = {}
+        self.machine_ids_by_name = defaultdict(list)
+        self.machines_by_group = defaultdict(list)
+        for machine_id, name, group_id in zip(machines["id"].tolist(), machines["name"].tolist(),
+                                              machines["group_mc_id"].tolist()):
+            name = str(name).strip()
+            self.machines[machine_id] = (name, group_id)
+            self.machine_ids_by_name[_name_key(name)].append(machine_id)
+            self.machines_by_group[group_id].append(machine_id)
+        for ids in self.machines_by_group.values():
+            ids.sort(key=lambda machine_id: self.machines[machine_id][0])
+
+        self.positions = {}
+        self.position_ids_by_name = {}
+        self.positions_by_machine = defaultdict(list)
+        for pos_id, machine_id, name in zip(positions["id"].tolist(), positions["mc_id"].tolist(),
+                                            positions["mc_pos"].tolist()):
+            self.positions[pos_id] = (name, machine_id)
+            self.position_ids_by_name[name] = pos_id
+            self.positions_by_machine[machine_id].append(pos_id)
+        for ids in self.positions_by_machine.values():
+            ids.sort(key=lambda pos_id: str(self.positions[pos_id][0]))
+
+    def __len__(self):
+        return len(self.machines)
+
+    def group_names(self):
+        return list(self.groups.values())
+
+    def machine_name(self, machine_id):
+        return self.machines[machine_id][0]
+
+    def machine_ids(self, group_id=None):
+        # Tất cả máy (hoặc máy của một nhóm), sắp theo tên
+        if group_id is not None:
+            return list(self.machines_by_group.get(group_id, []))
+        return sorted(self.machines, key=lambda machine_id: self.machines[machine_id][0])
+
+    def machines_for_type(self, machine_type_id):
+        # Loại máy của phụ tùng ứng với nhóm máy cùng id (quy ước sẵn có: group_mc.id = machine_type.id)
+        return self.machine_ids(machine_type_id)
+
+    def machines_named(self, name):
+        return list(self.machine_ids_by_name.get(_name_key(name), []))
+
+    def position_ids(self, machine_id):
+        return list(self.positions_by_machine.get(machine_id, []))
+
+    def position_id(self, name):
+        return self.position_ids_by_name.get(name)
+
+    def position_name(self, pos_id):
+        return self.positions[pos_id][0]
+
+    def position_machine(self, pos_id):
+        return self.positions[pos_id][1]
+
+
+def get_machine_topology(engine):
+    def build():
+        return MachineTopology(
+            get_table(engine, "group_mc"),
+            get_table(engine, "machine"),
+            get_table(engine, "machine_pos"),
+        )
+
+    return get_derived(engine, "machine_topology", TOPOLOGY_TABLES, build)
@@ -1,8 +1,11 @@
 import streamlit as st
 import streamlit.components.v1 as components
 
+import query_stats
+
 # --- Cấu hình trang ---
 st.set_page_config(page_title="Quản lý kho phụ tùng", page_icon="📦", layout="wide")
+query_stats.start_rerun()
 
 # --- Biến cấu hình ---
 ADMIN_PIN = "111222"
@@ -172,3 +175,25 @@ elif menu == "Quản lý hệ thống":
         st.session_state.selected_menu = "Quản lý kho"
         st.session_state.selected_sub_menu = "Xem tồn kho"
         st.rerun()
+
+# --- Bảng thời gian truy vấn của lượt chạy này (dành cho nhà phát triển) ---
+st.sidebar.markdown("---")
+if st.sidebar.toggle("⏱️ Thời gian truy vấn", key="show_query_stats"):
+    summary = query_stats.rerun_summary()
+    db_ms = summary["db_seconds"] * 1000
+    total_ms = summary["elapsed"] * 1000
+    st.sidebar.markdown(
+        f"Tổng **{total_ms:.0f} ms** · CSDL **{db_ms:.0f} ms** · Xử lý/hiển thị **{total_ms - db_ms:.0f} ms**  \n"
+        f"{summary['queries']} truy vấn, {summary['rows']:,} dòng"
+    )
+    st.sidebar.dataframe(
+        [{
+            "ms": round(entry["ms"], 1),
+            "lần": entry["calls"],
+            "dòng": entry["rows"],
+            "hàm": entry["caller"],
+            "câu lệnh": entry["statement"][:200],
+        } for entry in query_stats.top_statements(summary["records"])],
+        use_container_width=True,
+        hide_index=True,
+    )
@@ -0,0 +1,342 @@
+# migrations.py
+# Lược đồ CSDL kho có đánh số phiên bản, chạy được trên MySQL và SQLite (bản thử cục bộ).
+#   python migrations.py upgrade        -> áp dụng các phiên bản còn thiếu
+#   python migrations.py status         -> phiên bản hiện tại
+#   python migrations.py check-plans    -> EXPLAIN các truy vấn chính, lỗi nếu có quét toàn bảng
+import argparse
+import re
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, inspect, text
+
+from database import get_engine
+from movement_history import HISTORY_QUERY
+from stock_ledger import backfill_ledger, build_snapshots, ensure_stock_ledger
+from stock_movements import EXPORT_MERGE_SQL, migrate_import_buckets, rebuild_movement_monthly
+from table_versions import ensure_table_versions
+
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+"""
+
+# ---------------------- PHIÊN BẢN 1: CÁC BẢNG GỐC ------------------------
+# {id} là khóa chính tự tăng, khác cú pháp giữa MySQL và SQLite
+
+BASE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS machine_type (
+        id {id},
+        machine VARCHAR(100)
+    )""",
+    """CREATE TABLE IF NOT EXISTS group_mc (
+        id {id},
+        mc_name VARCHAR(100)
+    )""",
+    """CREATE TABLE IF NOT EXISTS machine (
+        id {id},
+        name VARCHAR(100),
+        group_mc_id INT,
+        dept_id INT
+    )""",
+    """CREATE TABLE IF NOT EXISTS machine_pos (
+        id {id},
+        mc_id INT,
+        mc_pos VARCHAR(50)
+    )""",
+    """CREATE TABLE IF NOT EXISTS employees (
+        amann_id VARCHAR(50) PRIMARY KEY,
+        name VARCHAR(100),
+        title VARCHAR(100),
+        level VARCHAR(50),
+        active VARCHAR(10),
+        birthday DATE,
+        start_date DATE,
+        address VARCHAR(255),
+        phone_number VARCHAR(20),
+        email VARCHAR(100),
+        gender VARCHAR(10)
+    )""",
+    """CREATE TABLE IF NOT EXISTS spare_parts (
+        material_no VARCHAR(50) PRIMARY KEY,
+        description VARCHAR(255),
+        part_no VARCHAR(100),
+        machine_type_id INT,
+        bin VARCHAR(50),
+        cost_center VARCHAR(50),
+        price DECIMAL(18, 2),
+        stock INT NOT NULL DEFAULT 0,
+        safety_stock INT,
+        safety_stock_check VARCHAR(10),
+        image_url VARCHAR(500),
+        import_date DATETIME,
+        export_date DATETIME
+    )""",
+    """CREATE TABLE IF NOT EXISTS import_export (
+        id {id},
+        part_id VARCHAR(50),
+        quantity INT,
+        mc_pos_id VARCHAR(50),
+        empl_id VARCHAR(50),
+        date DATETIME,
+        reason VARCHAR(255),
+        im_ex_flag SMALLINT
+    )""",
+]
+
+# ---------------------- PHIÊN BẢN 2: CHỈ MỤC CHO TRUY VẤN CHÍNH ------------------------
+# Cột dạng "reason(100)" là chỉ mục tiền tố trên MySQL (phòng khi cột là TEXT), SQLite bỏ qua độ dài
+
+HOT_INDEXES = [
+    ("ix_import_export_flag_date", "import_export", ["im_ex_flag", "date"]),
+    ("ix_import_export_part_date", "import_export", ["part_id", "date"]),
+    ("ix_import_export_export_merge", "import_export", ["part_id", "mc_pos_id", "empl_id", "reason(100)", "date"]),
+    ("ix_machine_pos_mc_id", "machine_pos", ["mc_id"]),
+    ("ix_machine_pos_mc_pos", "machine_pos", ["mc_pos"]),
+    ("ix_machine_group_mc_id", "machine", ["group_mc_id"]),
+    ("ix_spare_parts_machine_type_id", "spare_parts", ["machine_type_id"]),
+]
+
+
+def _is_mysql(conn):
+    return conn.dialect.name == "mysql"
+
+
+def _create_base_schema(engine):
+    with engine.begin() as conn:
+        id_column = "INT AUTO_INCREMENT PRIMARY KEY" if _is_mysql(conn) else "INTEGER PRIMARY KEY AUTOINCREMENT"
+        for ddl in BASE_TABLES:
+            conn.execute(text(ddl.format(id=id_column)))
+
+
+def create_index(conn, name, table, columns, unique=False):
+    # Bỏ qua nếu chỉ mục đã có (MySQL không hỗ trợ CREATE INDEX IF NOT EXISTS)
+    if name in {idx["name"] for idx in inspect(conn).get_indexes(table)}:
+        return False
+    if not _is_mysql(conn):
+        columns = [re.sub(r"\(\d+\)$", "", col) for col in columns]
+    conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})"))
+    return True
+
+
+def _create_hot_indexes(engine):
+    with engine.begin() as conn:
+        for name, table, columns in HOT_INDEXES:
+            create_index(conn, name, table, columns)
+
+
+def _create_table_versions(engine):
+    with engine.begin() as conn:
+        ensure_table_versions(conn)
+
+
+# ---------------------- PHIÊN BẢN 6: SỔ CÁI TỒN KHO ------------------------
+
+LEDGER_INDEXES = [
+    ("ix_stock_ledger_part_moved", "stock_ledger", ["part_id", "moved_at"]),
+    ("ix_stock_ledger_moved", "stock_ledger", ["moved_at"]),
+]
+
+
+def _create_stock_ledger(engine):
+    with engine.begin() as conn:
+        ensure_stock_ledger(conn)
+        for name, table, columns in LEDGER_INDEXES:
+            create_index(conn, name, table, columns)
+    backfill_ledger(engine)
+    build_snapshots(engine)
+
+
+# ---------------------- PHIÊN BẢN 7: DANH SÁCH MÁY PHÂN TRANG ------------------------
+# Phân trang keyset theo (name, id), có hoặc không lọc theo nhóm máy
+
+MACHINE_LISTING_INDEXES = [
+    ("ix_machine_name_id", "machine", ["name", "id"]),
+    ("ix_machine_group_name_id", "machine", ["group_mc_id", "name", "id"]),
+]
+
+
+def _create_machine_listing_indexes(engine):
+    with engine.begin() as conn:
+        for name, table, columns in MACHINE_LISTING_INDEXES:
+            create_index(conn, name, table, columns)
+
+
+# ---------------------- PHIÊN BẢN 8: PHIÊN BẢN DÒNG SPARE_PARTS ------------------------
+# Kiểm tra xung đột khi sửa phụ tùng (stock_movements.update_part)
+
+def _add_spare_parts_version(engine):
+    with engine.begin() as conn:
+        columns = {col["name"] for col in inspect(conn).get_columns("spare_parts")}
+        if "version" not in columns:
+            conn.execute(text("ALTER TABLE spare_parts ADD COLUMN version INT NOT NULL DEFAULT 0"))
+
+
+# ---------------------- PHIÊN BẢN 9: ID VỊ TRÍ MÁY TRÊN DÒNG XUẤT ------------------------
+# Nhãn machine_pos.mc_pos không duy nhất (nhiều máy cùng có P1, P2...), nên dòng xuất ghi thêm machine_pos_id
+# và lịch sử nối theo id. Dòng cũ chỉ được gán id khi nhãn của nó thuộc đúng một vị trí; nhãn trùng thì để NULL
+# (không đoán máy). Việc gộp dòng xuất đi theo ix_import_export_part_date nên chỉ mục gộp theo nhãn được bỏ.
+
+MACHINE_POS_BACKFILL_SQL = """
+    UPDATE import_export
+    SET machine_pos_id = (SELECT MIN(mp.id) FROM machine_pos mp WHERE mp.mc_pos = import_export.mc_pos_id)
+    WHERE im_ex_flag = 0
+      AND machine_pos_id IS NULL
+      AND mc_pos_id IN (SELECT mc_pos FROM machine_pos GROUP BY mc_pos HAVING COUNT(*) = 1)
+"""
+
+
+def _add_import_export_machine_pos(engine):
+    with engine.begin() as conn:
+        columns = {col["name"] for col in inspect(conn).get_columns("import_export")}
+        if "machine_pos_id" not in columns:
+            conn.execute(text("ALTER TABLE import_export ADD COLUMN machine_pos_id INT NULL"))
+        conn.execute(text(MACHINE_POS_BACKFILL_SQL))
+        if "ix_import_export_export_merge" in {idx["name"] for idx in inspect(conn).get_indexes("import_export")}:
+            on_table = " ON import_export" if _is_mysql(conn) else ""
+            conn.execute(text(f"DROP INDEX ix_import_export_export_merge{on_table}"))
+
+
+# ---------------------- PHIÊN BẢN 10: GIÁ TRỊ TỔNG HỢP THEO ĐƠN GIÁ HIỆN TẠI ------------------------
+# movement_monthly tính giá trị theo đơn giá hiện tại như rebuild_movement_monthly; đổi đơn giá thì
+# stock_movements.revalue_movements cập nhật các bucket của phụ tùng theo chỉ mục part_id.
+# Dựng lại một lần để bỏ các giá trị cũ tính theo đơn giá lúc nhập
+
+def _revalue_movement_monthly(engine):
+    with engine.begin() as conn:
+        create_index(conn, "ix_movement_monthly_part", "movement_monthly", ["part_id"])
+    rebuild_movement_monthly(engine)
+
+
+# (phiên bản, tên, hàm nhận engine); chỉ được thêm vào cuối, không sửa phiên bản đã phát hành
+MIGRATIONS = [
+    (1, "base schema", _create_base_schema),
+    (2, "hot path indexes", _create_hot_indexes),
+    (3, "movement_monthly rollup", rebuild_movement_monthly),
+    (4, "monthly import buckets", migrate_import_buckets),
+    (5, "table versions", _create_table_versions),
+    (6, "stock ledger and monthly snapshots", _create_stock_ledger),
+    (7, "machine listing indexes", _create_machine_listing_indexes),
+    (8, "spare_parts row version", _add_spare_parts_version),
+    (9, "import_export machine_pos_id", _add_import_export_machine_pos),
+    (10, "movement_monthly valued at current price", _revalue_movement_monthly),
+]
+
+
+def current_version(engine):
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA_VERSION_DDL))
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def upgrade(engine, target=None):
+    applied = []
+    version = current_version(engine)
+    for number, name, step in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        step(engine)
+        with engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {"version": number, "name": name, "applied_at": datetime.now()},
+            )
+        applied.append((number, name))
+    return applied
+
+
+# ---------------------- KIỂM TRA KẾ HOẠCH TRUY VẤN ------------------------
+
+def _plan_checks():
+    now = datetime.now()
+    month_start = datetime(now.year, now.month, 1)
+    day_start = datetime(now.year, now.month, now.day)
+    return [
+        ("lịch sử nhập/xuất theo tháng",
+         HISTORY_QUERY + " WHERE ie.im_ex_flag = :im_ex_flag AND ie.date >= :start AND ie.date < :end"
+                         " ORDER BY ie.date DESC, ie.id DESC LIMIT 50",
+         {"im_ex_flag": 0, "start": month_start, "end": now}),
+        ("lịch sử một phụ tùng",
+         "SELECT date, quantity, im_ex_flag FROM import_export WHERE part_id = :part_id AND date >= :start AND date < :end",
+         {"part_id": "", "start": month_start, "end": now}),
+        ("gộp dòng xuất kho cùng ngày",
+         EXPORT_MERGE_SQL,
+         {"part_ids": [""], "day_start": day_start, "day_end": day_start + timedelta(days=1)}),
+        ("vị trí của một máy",
+         "SELECT id, mc_pos FROM machine_pos WHERE mc_id = :mc_id",
+         {"mc_id": 0}),
+        ("máy của một nhóm",
+         "SELECT id, name FROM machine WHERE group_mc_id = :group_mc_id",
+         {"group_mc_id": 0}),
+        ("trang danh sách máy theo nhóm",
+         "SELECT id, name FROM machine WHERE group_mc_id = :group_mc_id"
+         " AND name >= :cursor_name AND (name > :cursor_name OR id > :cursor_id)"
+         " ORDER BY name, id LIMIT 100",
+         {"group_mc_id": 0, "cursor_name": "", "cursor_id": 0}),
+        ("phụ tùng theo loại máy",
+         "SELECT material_no FROM spare_parts WHERE machine_type_id = :machine_type_id",
+         {"machine_type_id": 0}),
+        ("tồn kho một phụ tùng tại một thời điểm",
+         "SELECT SUM(delta) FROM stock_ledger WHERE part_id = :part_id AND moved_at >= :start AND moved_at <= :end",
+         {"part_id": "", "start": month_start, "end": now}),
+        ("tính lại giá trị tổng hợp của một phụ tùng",
+         "SELECT month, im_ex_flag FROM movement_monthly WHERE part_id = :part_id",
+         {"part_id": ""}),
+        ("biểu đồ tổng hợp theo tháng",
+         "SELECT month, im_ex_flag, SUM(quantity) FROM movement_monthly"
+         " WHERE month >= :start AND month < :end GROUP BY month, im_ex_flag",
+         {"start": month_start.date(), "end": now.date()}),
+    ]
+
+
+def _full_scans(conn, sql, params):
+    # Trả về danh sách bảng bị quét toàn bộ trong kế hoạch thực thi; tham số kiểu list là danh sách IN
+    binds = [bindparam(name, expanding=True) for name, value in params.items() if isinstance(value, list)]
+    if _is_mysql(conn):
+        rows = conn.execute(text("EXPLAIN " + sql).bindparams(*binds), params).mappings().all()
+        return [row["table"] for row in rows if row["type"] in ("ALL", "index")]
+    rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql).bindparams(*binds), params).fetchall()
+    return [row[3].split()[1] for row in rows if row[3].startswith("SCAN ")]
+
+
+def check_query_plans(engine):
+    # MySQL có thể chọn quét toàn bảng khi bảng quá nhỏ: chạy trên dữ liệu thật hoặc dữ liệu sinh bởi bench
+    failures = []
+    with engine.connect() as conn:
+        for name, sql, params in _plan_checks():
+            scans = _full_scans(conn, sql, params)
+            if scans:
+                failures.append((name, scans))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quản lý lược đồ CSDL kho")
+    parser.add_argument("command", choices=["upgrade", "status", "check-plans"])
+    parser.add_argument("--target", type=int, default=None, help="Dừng ở phiên bản này")
+    args = parser.parse_args()
+    engine = get_engine()
+
+    if args.command == "upgrade":
+        applied = upgrade(engine, args.target)
+        for number, name in applied:
+            print(f"Đã áp dụng phiên bản {number}: {name}")
+        print(f"Phiên bản hiện tại: {current_version(engine)}")
+    elif args.command == "status":
+        version = current_version(engine)
+        pending = [number for number, _, _ in MIGRATIONS if number > version]
+        print(f"Phiên bản hiện tại: {version}; còn thiếu: {pending or 'không'}")
+    elif args.command == "check-plans":
+        failures = check_query_plans(engine)
+        for name, scans in failures:
+            print(f"QUÉT TOÀN BẢNG: {name} ({', '.join(scans)})")
+        if failures:
+            sys.exit(1)
+        print("OK: mọi truy vấn chính đều dùng chỉ mục")
+
+
+if __name__ == "__main__":
+    main()
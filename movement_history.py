@@ -0,0 +1,106 @@
+# movement_history.py
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import bindparam, text
+
+HISTORY_PAGE_SIZES = [50, 100, 200, 500]
+
+# Các bảng HISTORY_QUERY đọc (phiên bản dữ liệu cho cache, vd file Excel)
+HISTORY_TABLES = ("import_export", "spare_parts", "employees", "machine_pos", "machine")
+
+# Máy được lấy theo id vị trí đã ghi trên chính dòng xuất (machine_pos_id -> machine_pos -> machine).
+# Nối theo khóa chính vì nhãn mc_pos có thể trùng giữa các máy: mỗi dòng import_export cho đúng một dòng kết quả.
+# mc_pos là nhãn vị trí lúc xuất kho (import_export.mc_pos_id)
+HISTORY_QUERY = """
+    SELECT
+        ie.id,
+        ie.date,
+        sp.material_no AS part_id,
+        sp.description,
+        sp.bin,
+        ie.quantity,
+        ie.im_ex_flag,
+        e.name AS employee_name,
+        m.name AS machine_name,
+        ie.mc_pos_id AS mc_pos,
+        ie.reason
+    FROM import_export ie
+    JOIN spare_parts sp ON ie.part_id = sp.material_no
+    LEFT JOIN employees e ON ie.empl_id = e.amann_id
+    LEFT JOIN machine_pos mp ON ie.machine_pos_id = mp.id
+    LEFT JOIN machine m ON mp.mc_id = m.id
+"""
+
+
+def month_range(year, month):
+    # Khoảng nửa mở [đầu tháng, đầu tháng sau)
+    start = datetime(int(year), int(month), 1)
+    if start.month == 12:
+        return start, datetime(start.year + 1, 1, 1)
+    return start, datetime(start.year, start.month + 1, 1)
+
+
+def fetch_history(engine, im_ex_flag, start, end, part_ids=None, limit=None, cursor=None):
+    # Điều kiện so sánh trực tiếp trên cột date (dùng được index), phân trang keyset theo (date, id) giảm dần.
+    # part_ids=None: không lọc theo phụ tùng; cursor: (date, id) của dòng cuối trang trước.
+    # Trả về (DataFrame của trang, cursor trang sau hoặc None)
+    query = HISTORY_QUERY + " WHERE ie.im_ex_flag = :im_ex_flag AND ie.date >= :start AND ie.date < :end"
+    params = {"im_ex_flag": im_ex_flag, "start": start, "end": end}
+    stmt_binds = []
+
+    if part_ids is not None:
+        if not part_ids:
+            return pd.DataFrame(columns=["id", "date", "part_id", "description", "bin", "quantity",
+                                         "im_ex_flag", "employee_name", "machine_name", "mc_pos", "reason"]), None
+        query += " AND ie.part_id IN :part_ids"
+        params["part_ids"] = list(part_ids)
+        stmt_binds.append(bindparam("part_ids", expanding=True))
+
+    if cursor is not None:
+        query += " AND (ie.date < :cursor_date OR (ie.date = :cursor_date AND ie.id < :cursor_id))"
+        params["cursor_date"], params["cursor_id"] = cursor
+
+    query += " ORDER BY ie.date DESC, ie.id DESC"
+    if limit is not None:
+        # Lấy thêm một dòng để biết còn trang sau hay không
+        query += " LIMIT :limit"
+        params["limit"] = limit + 1
+
+    with engine.connect() as conn:
+        result = conn.execute(text(query).bindparams(*stmt_binds), params)
+        df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+    next_cursor = None
+    if limit is not None and len(df) > limit:
+        df = df.iloc[:limit]
+        last = df.iloc[-1]
+        next_cursor = (pd.Timestamp(last["date"]).to_pydatetime(), int(last["id"]))
+    return df, next_cursor
+
+
+def history_page_cursor(state_key, filters):
+    # Chồng cursor lưu trong session_state; đổi bộ lọc thì quay về trang đầu
+    cursors_key = f"{state_key}_cursors"
+    filters_key = f"{state_key}_filters"
+    if st.session_state.get(filters_key) != filters:
+        st.session_state[filters_key] = filters
+        st.session_state[cursors_key] = [None]
+    return st.session_state[cursors_key][-1]
+
+
+def history_pager(state_key, next_cursor, total_pages=None):
+    cursors = st.session_state[f"{state_key}_cursors"]
+    col_prev, col_info, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        if st.button("⬅️ Trang trước", key=f"{state_key}_prev", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+    with col_info:
+        page_text = f"Trang {len(cursors)}" + (f" / {total_pages}" if total_pages else "")
+        st.markdown(f"<p style='text-align: center;'>{page_text}</p>", unsafe_allow_html=True)
+    with col_next:
+        if st.button("Trang sau ➡️", key=f"{state_key}_next", disabled=next_cursor is None):
+            cursors.append(next_cursor)
+            st.rerun()
@@ -0,0 +1,130 @@
+# option_labels.py
+# Nhãn cho các ô chọn phụ tùng / nhân viên, dựng sẵn một lần cho mỗi phiên bản bảng (reference_data.get_derived)
+# bằng phép nối chuỗi theo cột, không apply từng dòng. Ô chọn gõ-để-tìm (typeahead) chỉ đưa tối đa
+# TYPEAHEAD_LIMIT kết quả khớp nhất vào selectbox, nên mỗi lần vẽ lại không còn gửi cả danh mục xuống trình duyệt.
+# Tìm kiếm đi qua chỉ mục n-gram của search_index (SearchIndex), chỉ xếp hạng các ứng viên chỉ mục trả về.
+import bisect
+import heapq
+
+import streamlit as st
+
+from reference_data import get_derived, get_table
+from search_index import SearchIndex, get_parts_index, normalize_series, normalize_text
+
+TYPEAHEAD_LIMIT = 50
+
+
+def join_columns(df, columns, sep=" - "):
+    # "a - b - c" cho từng dòng; giá trị trống thành chuỗi rỗng
+    label = df[columns[0]].fillna("").astype(str)
+    for col in columns[1:]:
+        label = label + sep + df[col].fillna("").astype(str)
+    return label
+
+
+def parts_search(engine, df, key):
+    # Chỉ mục phụ tùng dùng chung (search_index.get_parts_index): dựng lại theo phiên bản danh mục,
+    # không theo tồn kho, nên nhập/xuất kho chỉ dựng lại nhãn chứ không dựng lại chỉ mục
+    return lambda keyword: get_parts_index(engine).search(keyword)
+
+
+def columns_search(*columns):
+    # Chỉ mục n-gram riêng trên các cột của bảng (bảng nhỏ như employees), dựng cùng lúc với nhãn
+    def build(engine, df, key):
+        index = SearchIndex()
+        for doc_id, *fields in zip(df[key], *(df[col] for col in columns)):
+            index.add(doc_id, *fields)
+        return index.search
+    return build
+
+
+# tên nhãn -> (bảng, cột khóa, hàm dựng nhãn, hàm dựng tìm kiếm (engine, df, cột khóa) -> hàm từ khóa -> tập khóa)
+LABEL_FORMATS = {
+    "employees": (
+        "employees", "amann_id",
+        lambda df: join_columns(df, ["amann_id", "name"]),
+        columns_search("amann_id", "name"),
+    ),
+    "spare_parts": (
+        "spare_parts", "material_no",
+        lambda df: join_columns(df, ["material_no", "description"]),
+        parts_search,
+    ),
+    "spare_parts_by_part_no": (
+        "spare_parts", "material_no",
+        lambda df: join_columns(df, ["part_no", "material_no", "description"]),
+        parts_search,
+    ),
+    "spare_parts_with_stock": (
+        "spare_parts", "material_no",
+        lambda df: join_columns(df, ["material_no", "description"]) + " (Tồn: " + df["stock"].fillna(0).astype(int).astype(str) + ")",
+        parts_search,
+    ),
+}
+
+
+class LabelIndex:
+    def __init__(self, keys, labels, search):
+        # keys, labels: Series cùng thứ tự (thứ tự danh mục); search: hàm từ khóa -> tập khóa khớp
+        self.keys = keys.tolist()
+        self.labels = dict(zip(self.keys, labels.tolist()))
+        self._search = search
+        self._positions = {key: pos for pos, key in enumerate(self.keys)}
+        # (mã đã chuẩn hóa, vị trí) sắp theo mã: các mã bắt đầu bằng từ khóa là một đoạn liên tiếp
+        self._sorted_keys = sorted(zip(normalize_series(keys).tolist(), range(len(self.keys))))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.labels
+
+    def label(self, key):
+        return self.labels.get(key, str(key))
+
+    def top(self, keyword, limit=TYPEAHEAD_LIMIT):
+        # Tối đa `limit` khóa khớp từ khóa: trùng mã trước, rồi mã bắt đầu bằng từ khóa, rồi theo thứ tự danh mục.
+        # Chỉ các ứng viên của chỉ mục n-gram được xếp hạng; khóa không có trong bảng nhãn bị bỏ qua
+        kw = normalize_text(keyword)
+        if not kw:
+            return self.keys[:limit]
+        hits = {self._positions[k] for k in self._search(keyword) if k in self._positions}
+
+        lo = bisect.bisect_left(self._sorted_keys, (kw,))
+        hi = bisect.bisect_left(self._sorted_keys, (kw + "\U0010ffff",))
+        exact, prefixed = [], []
+        for normalized, pos in self._sorted_keys[lo:hi]:
+            if pos in hits:
+                (exact if normalized == kw else prefixed).append(pos)
+        ranked = sorted(exact) + heapq.nsmallest(limit, prefixed)
+        if len(ranked) < limit:
+            ranked += heapq.nsmallest(limit - len(ranked), hits.difference(exact, prefixed))
+        return [self.keys[pos] for pos in ranked[:limit]]
+
+
+def build_label_index(engine, df, key, labeler, searcher):
+    return LabelIndex(df[key], labeler(df), searcher(engine, df, key))
+
+
+def get_label_index(engine, name):
+    table, key, labeler, searcher = LABEL_FORMATS[name]
+    return get_derived(
+        engine,
+        f"option_labels.{name}",
+        [table],
+        lambda: build_label_index(engine, get_table(engine, table), key, labeler, searcher),
+    )
+
+
+# ---------------------- Ô CHỌN GÕ-ĐỂ-TÌM ------------------------
+
+def typeahead(label, index, key, query=None, limit=TYPEAHEAD_LIMIT, label_visibility="visible"):
+    # Trả về khóa đã chọn (material_no, amann_id...) hoặc None nếu không có kết quả.
+    # query: từ khóa từ ô tìm kiếm sẵn có của trang; None thì vẽ ô gõ riêng cho ô chọn này
+    if query is None:
+        query = st.text_input(f"🔎 {label}", key=f"{key}_query", placeholder="Gõ mã hoặc tên để tìm",
+                              label_visibility=label_visibility)
+    options = index.top(query, limit)
+    if not options:
+        return None
+    return st.selectbox(label, options, format_func=index.label, key=key, label_visibility=label_visibility)
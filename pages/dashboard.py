@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
-import altair as alt
+from sqlalchemy import text
 from database import get_engine
+from kpi import get_kpis
 import datetime
 datetime.datetime.now()
 
@@ -26,8 +27,18 @@ def transparent_theme():
         }
     }
 
-alt.themes.register('transparent', transparent_theme)
-alt.themes.enable('transparent')
+_theme_enabled = False
+
+
+def _altair():
+    # Import altair và bật theme ở lần vẽ biểu đồ đầu tiên thay vì lúc import trang
+    global _theme_enabled
+    import altair as alt
+    if not _theme_enabled:
+        alt.themes.register('transparent', transparent_theme)
+        alt.themes.enable('transparent')
+        _theme_enabled = True
+    return alt
 
 def show_dashboard():
     st.markdown(
@@ -48,44 +59,14 @@ def show_dashboard():
     st.markdown("<h1 style='text-align: center; color: white;'>Tổng quan kho phụ tùng</h1>", unsafe_allow_html=True)
 
     engine = get_engine()
-    with engine.begin() as conn:
-        # Lấy dữ liệu tồn kho
-        df_stock = pd.read_sql("""
-            SELECT material_no, description, stock, price, safety_stock,import_date
-            FROM spare_parts
-        """, conn)
-
-        # Tổng số lượng nhập kho
-        total_import = pd.read_sql("""
-            SELECT SUM(quantity) AS total_import 
-            FROM import_export 
-            WHERE im_ex_flag = 1
-        """, conn).iloc[0]['total_import']
-
-        # Tổng số lượng xuất kho
-        total_export = pd.read_sql("""
-            SELECT SUM(quantity) AS total_export 
-            FROM import_export 
-            WHERE im_ex_flag = 0
-        """, conn).iloc[0]['total_export']
-
-        # Tổng giá trị xuất kho
-        total_export_value_result = pd.read_sql("""
-            SELECT 
-                SUM(ie.quantity * sp.price) AS total_export_value
-            FROM import_export ie
-            JOIN spare_parts sp ON ie.part_id = sp.material_no
-            WHERE ie.im_ex_flag = 0
-        """, conn)
-
-        total_export_value = total_export_value_result['total_export_value'].iloc[0]
 
-    # Chuyển đổi các giá trị None về 0 nếu có
-    total_items_in_stock = int(df_stock['stock'].sum())
-    total_import = int(total_import) if total_import is not None else 0
-    total_export = int(total_export) if total_export is not None else 0
-    total_value_in_stock = float((df_stock['stock'] * df_stock['price']).sum())
-    total_export_value = float(total_export_value) if total_export_value is not None else 0
+    # Lấy 5 chỉ số tổng quan trong một truy vấn (có cache)
+    kpis = get_kpis(engine)
+    total_items_in_stock = kpis["stock_units"]
+    total_value_in_stock = kpis["stock_value"]
+    total_import = kpis["import_units"]
+    total_export = kpis["export_units"]
+    total_export_value = kpis["export_value"]
 
     # Hiển thị các chỉ số trong giao diện (ở đầu trang)
     col1, col2, col3, col4, col5 = st.columns(5)
@@ -111,6 +92,13 @@ def show_dashboard():
 
 
     # --- Phần biểu đồ phía dưới ---
+    # Lấy dữ liệu tồn kho
+    with engine.begin() as conn:
+        df_stock = pd.read_sql("""
+            SELECT material_no, description, stock, price, safety_stock,import_date
+            FROM spare_parts
+        """, conn)
+
     # Sắp xếp dữ liệu giảm dần theo tồn kho
     df_stock_sorted = df_stock.sort_values(by='stock', ascending=False)
 
@@ -122,6 +110,7 @@ def show_dashboard():
 
     st.markdown("<h4 style='text-align: center; color: white;'>Tồn kho hiện tại</h4>", unsafe_allow_html=True)
 
+    alt = _altair()
     bar_stock = alt.Chart(df_stock_sorted).mark_bar(
         cornerRadiusTopLeft=6,
         cornerRadiusTopRight=6,
@@ -200,23 +189,16 @@ def show_dashboard():
 
     # Hai cột song song (chia cột với biểu đồ nhập xuất)
     col1, col2, col3 = st.columns([1,1,1])
-# Lấy dữ liệu nhập xuất kho 1 lần duy nhất
+# Lấy khoảng tháng có dữ liệu (MIN/MAX trên khóa chính của movement_monthly)
     with engine.begin() as conn:
-        df_import_history = pd.read_sql("SELECT date, quantity FROM import_export WHERE im_ex_flag = 1", conn)
-        df_export_history = pd.read_sql("SELECT date, quantity FROM import_export WHERE im_ex_flag = 0", conn)
+        month_bounds = conn.execute(text("SELECT MIN(month), MAX(month) FROM movement_monthly")).fetchone()
 
-    # Chuyển cột date về datetime
-    df_import_history['date'] = pd.to_datetime(df_import_history['date'])
-    df_export_history['date'] = pd.to_datetime(df_export_history['date'])
+    if month_bounds is None or month_bounds[0] is None:
+        st.info("Chưa có dữ liệu nhập/xuất kho.")
+        return
 
-    # Tạo cột month theo định dạng 'YYYY-MM'
-    df_import_history['month'] = df_import_history['date'].dt.to_period('M').astype(str)
-    df_export_history['month'] = df_export_history['date'].dt.to_period('M').astype(str)
-
-    # Tạo danh sách tháng duy nhất (theo cả 2 bảng)
-    start_date = min(df_import_history['date'].min(), df_export_history['date'].min())
-    end_date = max(df_import_history['date'].max(), df_export_history['date'].max())
-    all_months = pd.period_range(start=start_date, end=end_date, freq='M').astype(str).tolist()
+    # Tạo danh sách tháng từ tháng đầu đến tháng cuối
+    all_months = pd.period_range(start=pd.to_datetime(month_bounds[0]), end=pd.to_datetime(month_bounds[1]), freq='M').astype(str).tolist()
     all_months_dates = [datetime.datetime.strptime(m, "%Y-%m").date() for m in all_months]
 
     # Slider chọn khoảng tháng dùng chung
@@ -228,16 +210,29 @@ def show_dashboard():
         format="YYYY-MM"
     )
 
-    start_month = start_month_date.strftime("%Y-%m")
-    end_month = end_month_date.strftime("%Y-%m")
+    # Khoảng nửa mở [tháng bắt đầu, tháng sau tháng kết thúc) để truy vấn dùng được chỉ mục
+    range_start = start_month_date.replace(day=1)
+    range_end = (pd.Timestamp(end_month_date.replace(day=1)) + pd.DateOffset(months=1)).date()
+
+    with engine.begin() as conn:
+        df_monthly = pd.read_sql(text("""
+            SELECT month, im_ex_flag, SUM(quantity) AS quantity, SUM(value) AS value
+            FROM movement_monthly
+            WHERE month >= :start AND month < :end
+            GROUP BY month, im_ex_flag
+            ORDER BY month
+        """), conn, params={"start": range_start, "end": range_end})
 
-    # Lọc dữ liệu theo khoảng tháng đã chọn
-    df_import_filtered = df_import_history[(df_import_history['month'] >= start_month) & (df_import_history['month'] <= end_month)]
-    df_export_filtered = df_export_history[(df_export_history['month'] >= start_month) & (df_export_history['month'] <= end_month)]
+    # Tạo cột month theo định dạng 'YYYY-MM'
+    df_monthly['month'] = pd.to_datetime(df_monthly['month']).dt.strftime('%Y-%m')
+    df_monthly['quantity'] = df_monthly['quantity'].astype(int)
+    df_monthly['value'] = df_monthly['value'].astype(float)
 
-    # Tổng hợp số lượng theo tháng
-    monthly_imports = df_import_filtered.groupby('month')['quantity'].sum().reset_index()
-    monthly_exports = df_export_filtered.groupby('month')['quantity'].sum().reset_index()
+    # Tổng hợp số lượng và giá trị theo tháng
+    monthly_imports = df_monthly[df_monthly['im_ex_flag'] == 1][['month', 'quantity']].reset_index(drop=True)
+    monthly_exports = df_monthly[df_monthly['im_ex_flag'] == 0][['month', 'quantity']].reset_index(drop=True)
+    monthly_import_value = df_monthly[df_monthly['im_ex_flag'] == 1][['month', 'value']].rename(columns={'value': 'import_value'}).reset_index(drop=True)
+    monthly_export_value = df_monthly[df_monthly['im_ex_flag'] == 0][['month', 'value']].rename(columns={'value': 'export_value'}).reset_index(drop=True)
 
     # Vẽ biểu đồ nhập kho và xuất kho theo tháng
     col1, col2 = st.columns(2)
@@ -291,22 +286,6 @@ def show_dashboard():
         )
 
         st.altair_chart(chart_exports + text_exports, use_container_width=True)
-        # =================== TẠO CỘT VÀ XỬ LÝ DỮ LIỆU ===================
-    # Chuyển đổi cột ngày
-    df_stock['import_date'] = pd.to_datetime(df_stock['import_date'])
-    df_stock['month'] = df_stock['import_date'].dt.strftime('%Y-%m')
-
-    # Lọc dữ liệu theo khoảng tháng được chọn
-    df_stock = df_stock[(df_stock['month'] >= start_month) & (df_stock['month'] <= end_month)]
-
-    # Tính ngày nhập gần nhất
-    df_last_inbound = df_stock.groupby('material_no')['import_date'].max().reset_index()
-    df_last_inbound.rename(columns={'import_date': 'last_inbound_date'}, inplace=True)
-    df_stock = df_stock.merge(df_last_inbound, on='material_no', how='left')
-
-    # Lọc phụ tùng còn tồn kho
-    df_stock_filtered = df_stock[df_stock['stock'] > 0]
-
     # =================== TẠO GIAO DIỆN 2 CỘT ===================
     col1, col2 = st.columns(2)
 
@@ -314,27 +293,6 @@ def show_dashboard():
     with col1:
         st.markdown("<h3 style='text-align: center; color: white;'>Giá trị nhập kho theo tháng</h3>", unsafe_allow_html=True)
 
-        with engine.begin() as conn:
-            df_import_value = pd.read_sql("""
-                SELECT 
-                    ie.date, 
-                    ie.quantity, 
-                    sp.price
-                FROM import_export ie
-                JOIN spare_parts sp ON ie.part_id = sp.material_no
-                WHERE ie.im_ex_flag = 1
-            """, conn)
-
-        df_import_value['date'] = pd.to_datetime(df_import_value['date'])
-        df_import_value['month'] = df_import_value['date'].dt.strftime('%Y-%m')
-        df_import_value['import_value'] = df_import_value['quantity'] * df_import_value['price']
-
-        df_import_value = df_import_value[
-            (df_import_value['month'] >= start_month) & (df_import_value['month'] <= end_month)
-        ]
-
-        monthly_import_value = df_import_value.groupby('month')['import_value'].sum().reset_index()
-
         chart_import = alt.Chart(monthly_import_value).mark_bar(
             color='#008080',
             opacity=0.8,
@@ -364,27 +322,6 @@ def show_dashboard():
     with col2:
         st.markdown("<h3 style='text-align: center; color: white;'>Giá trị xuất kho theo tháng</h3>", unsafe_allow_html=True)
 
-        with engine.begin() as conn:
-            df_export_value = pd.read_sql("""
-                SELECT 
-                    ie.date, 
-                    ie.quantity, 
-                    sp.price
-                FROM import_export ie
-                JOIN spare_parts sp ON ie.part_id = sp.material_no
-                WHERE ie.im_ex_flag = 0
-            """, conn)
-
-        df_export_value['date'] = pd.to_datetime(df_export_value['date'])
-        df_export_value['month'] = df_export_value['date'].dt.strftime('%Y-%m')
-        df_export_value['export_value'] = df_export_value['quantity'] * df_export_value['price']
-
-        df_export_value = df_export_value[
-            (df_export_value['month'] >= start_month) & (df_export_value['month'] <= end_month)
-        ]
-
-        monthly_export_value = df_export_value.groupby('month')['export_value'].sum().reset_index()
-
         chart_export = alt.Chart(monthly_export_value).mark_bar(
             color='#008080',
             opacity=0.8,
@@ -2,14 +2,24 @@ import streamlit as st
 import pandas as pd
 from sqlalchemy import text
 from database import get_engine  # Ensure you have a database.py with get_engine()
+from reference_data import get_derived, get_table
+from search_index import add_search_column, match_keyword
+from table_versions import bump
 import datetime
-import plotly.express as px
 
-# Load employee data from the database
+# Load employee data from the shared reference cache (copy: the page modifies columns)
 def load_employees():
+    return get_table(get_engine(), "employees").copy()
+
+# Cột tìm kiếm (tên / mã đã chuẩn hóa) dựng một lần cho mỗi phiên bản bảng employees, cùng chỉ số dòng với get_table
+def load_employee_search_keys():
     engine = get_engine()
-    with engine.begin() as conn:
-        return pd.read_sql("SELECT amann_id, name, title, level, active, birthday, start_date, address, phone_number, email, gender FROM employees", conn)
+    return get_derived(
+        engine,
+        "employees.search_key",
+        ["employees"],
+        lambda: add_search_column(get_table(engine, "employees")[['name', 'amann_id']].copy(), ['name', 'amann_id']),
+    )
 
 
 
@@ -33,6 +43,7 @@ def show_employees():
 
     # Create 3 equal-width columns
     col1, col2 = st.columns(2)
+    import plotly.express as px  # import tại chỗ dùng để không làm chậm lúc khởi động
 
    # --- Biểu đồ Cột: Số lượng nhân viên theo chức vụ ---
     with col1:
@@ -159,9 +170,9 @@ def show_employees():
                 email_keyword = st.text_input("Từ khóa trong Email").lower().strip()
 
             if search_term.strip():
-                search_lower = search_term.strip().lower()
-                employees = employees[employees['name'].str.lower().str.contains(search_lower, na=False) |
-                                    employees['amann_id'].str.lower().str.contains(search_lower, na=False)]
+                # So khớp không phân biệt dấu trên cột tên/mã đã chuẩn hóa
+                matched = match_keyword(load_employee_search_keys(), search_term)
+                employees = employees[matched.reindex(employees.index, fill_value=False)]
 
             if status_filter == "Đang làm":
                 employees = employees[employees["active"] == "1"]
@@ -210,6 +221,7 @@ def show_employees():
                             "active": "1" if active == "Đang làm" else "0",
                             "amann_id": employee_id
                         })
+                        bump(conn, "employees")
                         conn.commit()
                         st.success(f"✅ Đã cập nhật thông tin nhân viên '{name}' thành công!")
                 except Exception as e:
@@ -291,6 +303,7 @@ def show_employees():
                                     "email": email.strip(),
                                     "gender": gender
                                 })
+                                bump(conn, "employees")
                                 conn.commit()
                                 st.success("✅ Đã thêm nhân viên mới thành công!")
                     except Exception as e:
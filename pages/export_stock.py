@@ -3,35 +3,24 @@ import pandas as pd
 from datetime import datetime
 from sqlalchemy import text
 from database import get_engine
-import matplotlib.pyplot as plt
-import seaborn as sns
-from datetime import timedelta
-import io
-# Hàm lấy dữ liệu lịch sử nhập/xuất kho
-def fetch_import_export_history(engine, year=None, quarter=None):
-    with engine.connect() as conn:
-        query = """
-            SELECT 
-                ie.date, 
-                sp.material_no as part_id, 
-                sp.description, 
-                ie.quantity, 
-                ie.im_ex_flag,
-                e.name as employee_name, 
-                mp.mc_pos, 
-                ie.reason
-            FROM import_export ie
-            JOIN spare_parts sp ON ie.part_id = sp.material_no
-            LEFT JOIN employees e ON ie.empl_id = e.amann_id
-            LEFT JOIN machine_pos mp ON ie.mc_pos_id = mp.mc_pos
-            WHERE 1=1
-        """
-        params = {}
-
-        
-        result = conn.execute(text(query), params)
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
-        return df
+from excel_export import excel_download
+from reference_data import get_table
+from machine_topology import get_machine_topology
+from stock_movements import InsufficientStock, StockError, issue_stock, issue_stock_batch
+from search_index import get_parts_index
+from option_labels import get_label_index, typeahead
+from movement_history import HISTORY_PAGE_SIZES, HISTORY_TABLES, fetch_history, history_page_cursor, history_pager, month_range
+# Hàm lấy dữ liệu lịch sử xuất kho trong khoảng [start, end), chỉ trả về trang đang hiển thị
+def fetch_import_export_history(engine, start, end, part_ids=None, limit=None, cursor=None):
+    return fetch_history(engine, 0, start, end, part_ids=part_ids, limit=limit, cursor=cursor)
+
+
+# Bảng hiển thị lịch sử xuất kho: tên máy đã có sẵn trong kết quả truy vấn, một dòng xuất là một dòng bảng
+def export_history_display(df_export):
+    df_display = df_export[['date', 'part_id', 'description', 'quantity', 'bin', 'employee_name', 'machine_name', 'mc_pos']].copy()
+    df_display.insert(4, 'Type', 'Xuất kho')
+    df_display.columns = ['Ngày', 'Mã phụ tùng', 'Mô tả', 'Số lượng', 'Loại', 'Vị trí lưu (BIN)', 'Nhân viên', 'Tên máy', 'Vị trí máy']
+    return df_display
 
 
 def show_export_stock():
@@ -39,20 +28,15 @@ def show_export_stock():
     engine = get_engine()
 
     # ====== Load dữ liệu cơ bản ======
-    with engine.begin() as conn:
-        spare_parts = pd.read_sql('SELECT material_no, description, stock, price FROM spare_parts', conn)
-        employees = pd.read_sql('SELECT amann_id, name FROM employees', conn)
-        machine_data = pd.read_sql(''' 
-            SELECT m.name AS machine_name, mp.mc_pos AS mc_pos_id, mp.mc_pos 
-            FROM machine m 
-            JOIN machine_pos mp ON m.group_mc_id = mp.mc_id
-        ''', conn)
+    topology = get_machine_topology(engine)
 
    # Khởi tạo state nếu chưa có
     if 'selected_year' not in st.session_state:
         st.session_state.selected_year = datetime.today().year
     if 'selected_month' not in st.session_state:
         st.session_state.selected_month = datetime.today().month
+    if 'issue_cart' not in st.session_state:
+        st.session_state.issue_cart = []
 
     # Danh sách năm và tháng
     years = list(range(2020, 2031))
@@ -99,18 +83,14 @@ def show_export_stock():
     with col2:
         selected_month = st.selectbox("Chọn tháng", months, index=st.session_state.selected_month - 1)
         st.session_state.selected_month = selected_month
-    # Tính ngày bắt đầu và kết thúc của tháng được chọn
-    start_date = datetime(selected_year, st.session_state.selected_month, 1)
-    # Lấy ngày cuối cùng của tháng (chuyển sang tháng kế tiếp rồi trừ 1 ngày)
-    if st.session_state.selected_month == 12:
-        end_date = datetime(selected_year, 12, 31)
-    else:
-        end_date = datetime(selected_year, st.session_state.selected_month + 1, 1) - timedelta(days=1)
+    # Khoảng nửa mở [đầu tháng, đầu tháng sau): giữ cả các dòng xuất trong ngày cuối tháng
+    start_date, end_date = month_range(selected_year, st.session_state.selected_month)
 
     # ====== Lấy dữ liệu xuất kho và chi phí xuất kho theo khoảng thời gian ======
     def fetch_export_data():
-        with engine.begin() as conn:
-            export_stats = pd.read_sql(''' 
+        params = {"start": start_date, "end": end_date}
+        with engine.connect() as conn:
+            export_stats = pd.read_sql(text(''' 
                 SELECT 
                     ie.part_id, 
                     sp.material_no, 
@@ -119,11 +99,11 @@ def show_export_stock():
                 FROM import_export ie
                 JOIN spare_parts sp ON ie.part_id = sp.material_no
                 WHERE ie.im_ex_flag = 0
-                AND ie.date BETWEEN %s AND %s
+                AND ie.date >= :start AND ie.date < :end
                 GROUP BY ie.part_id, sp.material_no, sp.description
-            ''', conn, params=(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
+            '''), conn, params=params)
 
-            cost_data = pd.read_sql(''' 
+            cost_data = pd.read_sql(text(''' 
                 SELECT 
                     DATE(ie.date) AS export_day,
                     ie.part_id,
@@ -132,10 +112,10 @@ def show_export_stock():
                 FROM import_export ie
                 JOIN spare_parts sp ON ie.part_id = sp.material_no
                 WHERE ie.im_ex_flag = 0
-                AND ie.date BETWEEN %s AND %s
+                AND ie.date >= :start AND ie.date < :end
                 GROUP BY export_day, ie.part_id, sp.price
                 ORDER BY export_day
-            ''', conn, params=(start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')))
+            '''), conn, params=params)
 
         return export_stats, cost_data
 
@@ -211,29 +191,16 @@ def show_export_stock():
 
 
     # ====== Tìm kiếm linh kiện ======
-    query = "SELECT material_no, description, stock, bin FROM spare_parts"
-    spare_parts = pd.read_sql_query(text(query), engine)
+    spare_parts = get_table(engine, "spare_parts")
 
     st.markdown('<p style="color:white; margin-bottom:4px;">🔍 Tìm linh kiện theo Mã / Mô tả / Vị trí (BIN)</p>', unsafe_allow_html=True)
     search = st.text_input("", key="search_input", label_visibility="hidden")
 
-    # Lọc linh kiện theo Material_No, Description hoặc Bin
-    parts = spare_parts[
-        spare_parts['description'].str.contains(search, case=False, na=False) |
-        spare_parts['material_no'].str.contains(search, case=False, na=False) |
-        spare_parts['bin'].astype(str).str.contains(search, case=False, na=False)
-    ] if search else spare_parts
-
-    if not parts.empty:
-        # Hiển thị danh sách linh kiện để chọn
-        part_choice = st.selectbox(
-            "", 
-            parts.apply(lambda x: f"{x['material_no']} - {x['description']} (Tồn: {x['stock']})", axis=1),
-            key="part_choice",
-            label_visibility="hidden"
-        )
-        part_id = part_choice.split(' - ')[0]  # Lấy mã vật liệu được chọn
+    # Chỉ các linh kiện khớp nhất theo Material_No, Description hoặc Bin được đưa vào ô chọn
+    part_id = typeahead("", get_label_index(engine, "spare_parts_with_stock"), key="part_choice",
+                        query=search, label_visibility="hidden")
 
+    if part_id is not None:
         # ====== Hiển thị vị trí BIN của linh kiện đã chọn ======
         bin_location = spare_parts.loc[spare_parts['material_no'] == part_id, 'bin'].values
         if bin_location.size > 0:
@@ -247,130 +214,53 @@ def show_export_stock():
 
 
     # ====== Chọn nhân viên ======
-    if not employees.empty:
+    employee_labels = get_label_index(engine, "employees")
+    empl_id = None
+    if len(employee_labels):
         st.markdown('<p style="color:white; margin-bottom:4px;">Người thực hiện</p>', unsafe_allow_html=True)
-        empl_choice = st.selectbox(
-            "",
-            employees.apply(lambda x: f"{x['amann_id']} - {x['name']}", axis=1),
-            key="empl_choice",
-            label_visibility="hidden"
-        )
-        empl_id = empl_choice.split(' - ')[0]
+        empl_id = typeahead("", employee_labels, key="empl_choice", label_visibility="hidden")
     else:
         st.markdown('<p style="color:white;">⚠️ Không có dữ liệu nhân viên.</p>', unsafe_allow_html=True)
 
 
-    if not machine_data.empty:
-        # Bước 1: chọn mã vật liệu
-        def load_machine_data(engine):
-            query = """
-            SELECT 
-                sp.material_no,
-                mt.id AS machine_type_id,
-                mt.machine AS group_mc_name,
-                m.id AS machine_id,
-                m.name AS machine_name,
-                mp.mc_pos,
-                mp.id AS mc_pos_id
-            FROM spare_parts sp
-            JOIN machine_type mt ON sp.machine_type_id = mt.id
-            JOIN group_mc g ON g.id = mt.id            -- giả sử group_mc.id = machine_type.id để nối tiếp
-            JOIN machine m ON m.group_mc_id = g.id
-            LEFT JOIN machine_pos mp ON mp.mc_id = m.id
-            ORDER BY m.name
-            """
-            df = pd.read_sql_query(text(query), engine)
-            return df
-
-
-        machine_data = load_machine_data(engine)
-
-    # Giả sử machine_data có cột 'machine_name' và 'mc_pos' như bạn mô tả
-    # ====== Định nghĩa hàm load_machines bên ngoài ======
-    def load_machines(engine, selected_group, selected_pos, search_name):
-        query = """
-        SELECT m.name AS machine_name, g.mc_name AS group_mc_name,
-            mp.mc_pos AS machine_pos, mp.id AS mc_pos_id
-        FROM machine m
-        JOIN group_mc g ON m.group_mc_id = g.id
-        LEFT JOIN machine_pos mp ON m.group_mc_id = mp.mc_id
-        WHERE (:group_name = 'Tất cả' OR g.mc_name = :group_name)
-        AND (:pos = 'Tất cả' OR mp.mc_pos = :pos)
-        AND (:search_name = '' OR m.name LIKE :search_name)
-        ORDER BY m.name DESC
-        LIMIT 1000
-        """
-        df = pd.read_sql_query(text(query), engine, params={
-            "group_name": selected_group,
-            "pos": selected_pos,
-            "search_name": f"%{search_name}%"
-        })
-        return df
-
-
-
-    # ====== Phần UI và logic chọn máy, vị trí ======
+    # ====== Phần UI và logic chọn máy, vị trí (tra trong cây máy đã cache, không truy vấn CSDL) ======
 
     mc_pos_id = None  # Đặt mặc định
+    pos_selected = None
+    machine_selected = None
 
-    if not machine_data.empty and part_id is not None:
-        # Lọc máy theo linh kiện
-        filtered_data = machine_data[machine_data['material_no'] == part_id].copy()
-        filtered_data['machine_name'] = filtered_data['machine_name'].astype(str).str.strip()
-
-        machine_names = sorted(filtered_data['machine_name'].unique())
+    if len(topology) and part_id is not None:
+        # Lọc máy theo loại máy của linh kiện
+        machine_type_id = spare_parts.loc[spare_parts['material_no'] == part_id, 'machine_type_id'].iloc[0]
+        machine_ids = topology.machines_for_type(machine_type_id) if pd.notna(machine_type_id) else []
         st.markdown('<p style="color:white; margin-bottom:4px;">Chọn tên máy (theo linh kiện)</p>', unsafe_allow_html=True)
-        machine_selected = st.selectbox("", machine_names, key="machine_selected_filtered", label_visibility="hidden")
-
-        # Lấy vị trí máy theo máy được chọn
-        pos_df = load_machines(engine, selected_group='Tất cả', selected_pos='Tất cả', search_name=machine_selected)
+        machine_id = st.selectbox("", machine_ids, format_func=topology.machine_name,
+                                  key="machine_selected_filtered", label_visibility="hidden")
 
-    elif not machine_data.empty:
-        machine_names = sorted(machine_data['machine_name'].astype(str).str.strip().unique())
+    elif len(topology):
         st.markdown('<p style="color:white; margin-bottom:4px;">Chọn máy</p>', unsafe_allow_html=True)
-        machine_selected = st.selectbox("", machine_names, key="machine_selected_all", label_visibility="hidden")
-
-        pos_df = load_machines(engine, selected_group='Tất cả', selected_pos='Tất cả', search_name=machine_selected)
+        machine_id = st.selectbox("", topology.machine_ids(), format_func=topology.machine_name,
+                                  key="machine_selected_all", label_visibility="hidden")
 
     else:
         st.markdown('<p style="color:white;">⚠️ Không có dữ liệu máy.</p>', unsafe_allow_html=True)
-        pos_df = pd.DataFrame()
-        machine_selected = None
-
-    # ====== Chọn vị trí nếu có dữ liệu vị trí và máy được chọn ======
+        machine_id = None
 
-    if not pos_df.empty and machine_selected:
-        # Chuẩn hóa dữ liệu để so sánh không phân biệt hoa thường và khoảng trắng
-        pos_df['machine_name_clean'] = pos_df['machine_name'].astype(str).str.strip().str.lower()
-        pos_df['machine_pos_clean'] = pos_df['machine_pos'].astype(str).str.strip().str.lower()
-        machine_selected_clean = machine_selected.strip().lower()
+    # ====== Chọn vị trí của máy được chọn ======
 
-        pos_options = pos_df[pos_df['machine_name_clean'] == machine_selected_clean]['machine_pos'].unique()
-        pos_options = sorted(pos_options)
+    if machine_id is not None:
+        machine_selected = topology.machine_name(machine_id)
+        pos_options = topology.position_ids(machine_id)
 
         if pos_options:
             st.markdown('<p style="color:white; margin-bottom:4px;">Chọn vị trí máy</p>', unsafe_allow_html=True)
-            pos_selected = st.selectbox("", pos_options, key="pos_selected", label_visibility="hidden")
-
-            pos_selected_clean = pos_selected.strip().lower()
-
-            mc_pos_row = pos_df[
-                (pos_df['machine_name_clean'] == machine_selected_clean) &
-                (pos_df['machine_pos_clean'] == pos_selected_clean)
-            ]
-
-            if not mc_pos_row.empty:
-                # Chuyển mc_pos_id sang string để thống nhất kiểu dữ liệu (tránh lỗi so sánh)
-                mc_pos_id = str(mc_pos_row.iloc[0]['mc_pos_id'])
-                
-            else:
-                st.warning("❌ Không tìm thấy ID vị trí máy tương ứng.")
-                mc_pos_id = None
+            pos_id = st.selectbox("", pos_options, format_func=topology.position_name,
+                                  key="pos_selected", label_visibility="hidden")
+            pos_selected = topology.position_name(pos_id)
+            # Chuyển mc_pos_id sang string để thống nhất kiểu dữ liệu (tránh lỗi so sánh)
+            mc_pos_id = str(pos_id)
         else:
             st.warning("❌ Không có vị trí máy phù hợp để chọn.")
-            mc_pos_id = None
-    else:
-        mc_pos_id = None
 
 
     # ====== Giao diện xuất kho (luôn hiện nếu có part_id) ======
@@ -394,6 +284,8 @@ def show_export_stock():
                 st.markdown('<p style="color:white;">❌ Bạn phải nhập lý do xuất kho!</p>', unsafe_allow_html=True)
             elif mc_pos_id is None:
                 st.markdown('<p style="color:white;">❌ Vui lòng chọn đúng vị trí máy!</p>', unsafe_allow_html=True)
+            elif empl_id is None:
+                st.markdown('<p style="color:white;">❌ Vui lòng chọn người thực hiện!</p>', unsafe_allow_html=True)
             else:
                 try:
                     mc_pos_id_int = int(mc_pos_id)
@@ -401,150 +293,91 @@ def show_export_stock():
                     st.markdown('<p style="color:white;">❌ Vị trí máy không hợp lệ!</p>', unsafe_allow_html=True)
                     return
 
-                with engine.begin() as conn:
-                    # Lấy đúng giá trị mc_pos (khóa chính thật sự) từ machine_pos theo id
-                    mc_pos_value = conn.execute(
-                        text("SELECT mc_pos FROM machine_pos WHERE id = :id"),
-                        {"id": mc_pos_id_int}
-                    ).scalar()
-
-                    if mc_pos_value is None:
-                        st.markdown(f'<p style="color:white;">❌ Vị trí máy với ID {mc_pos_id_int} không tồn tại!</p>', unsafe_allow_html=True)
-                        return
-
-                    stock = conn.execute(
-                        text("SELECT stock FROM spare_parts WHERE material_no = :material_no"),
-                        {"material_no": part_id}
-                    ).scalar()
-
-                    if stock is None:
-                        st.markdown('<p style="color:white;">❌ Không tìm thấy phụ tùng trong kho!</p>', unsafe_allow_html=True)
-                        return
-
-                    elif not is_foc and quantity > stock:
-                        st.markdown(f'<p style="color:white;">❌ Không đủ hàng trong kho! Tồn kho hiện tại: {stock}</p>', unsafe_allow_html=True)
-                        return
-
-                    now = datetime.now()
-                    today_str = now.strftime('%Y-%m-%d')
-
-                    existing_row = conn.execute(text("""
-                        SELECT id FROM import_export 
-                        WHERE 
-                            part_id = :part_id AND 
-                            mc_pos_id = :mc_pos_id AND 
-                            empl_id = :empl_id AND 
-                            reason = :reason AND 
-                            DATE(date) = :today AND
-                            im_ex_flag = 0
-                    """), {
-                        "part_id": part_id,
-                        "mc_pos_id": mc_pos_value,    # Dùng giá trị đúng
-                        "empl_id": empl_id,
-                        "reason": reason,
-                        "today": today_str
-                    }).fetchone()
-
-                    if existing_row:
-                        conn.execute(text("""
-                            UPDATE import_export
-                            SET quantity = quantity + :add_quantity
-                            WHERE id = :row_id
-                        """), {
-                            "add_quantity": quantity,
-                            "row_id": existing_row[0]
-                        })
-                    else:
-                        conn.execute(text("""
-                            INSERT INTO import_export (date, part_id, quantity, im_ex_flag, empl_id, mc_pos_id, reason)
-                            VALUES (:date, :part_id, :quantity, 0, :empl_id, :mc_pos_id, :reason)
-                        """), {
-                            "date": now,
-                            "part_id": part_id,
-                            "quantity": quantity,
-                            "empl_id": empl_id,
-                            "mc_pos_id": mc_pos_value,  # Dùng giá trị đúng
-                            "reason": reason
-                        })
-
-                    if not is_foc:
-                        # Giảm tồn kho khi không phải FOC
-                        conn.execute(text("""
-                            UPDATE spare_parts
-                            SET stock = stock - :quantity
-                            WHERE material_no = :part_id
-                        """), {
-                            "quantity": quantity,
-                            "part_id": part_id
-                        })
-
-                    # Cập nhật export_date dù có FOC hay không
-                    conn.execute(text("""
-                        UPDATE spare_parts
-                        SET export_date = :export_date
-                        WHERE material_no = :part_id
-                    """), {
-                        "export_date": now,
-                        "part_id": part_id
-                    })
-
-
-
-
-                    st.success("✅ Xuất kho thành công!")
-
-
-
-
-    # ====== Lịch sử xuất kho ======
-    df_history = fetch_import_export_history(engine, year=selected_year, quarter=selected_month)
+                # Trừ tồn kho có điều kiện, ghi lịch sử và bảng tổng hợp trong một giao dịch
+                try:
+                    issue_stock(engine, part_id, quantity, mc_pos_id_int, empl_id, reason, is_foc=is_foc)
+                except InsufficientStock as e:
+                    st.markdown(f'<p style="color:white;">❌ Không đủ hàng trong kho! Tồn kho hiện tại: {e.available}</p>', unsafe_allow_html=True)
+                    return
+                except StockError as e:
+                    st.markdown(f'<p style="color:white;">❌ {e}</p>', unsafe_allow_html=True)
+                    return
 
-    if not df_history.empty:
-        # Lọc bản ghi xuất kho (im_ex_flag == 0)
-        df_export = df_history[df_history['im_ex_flag'] == 0].copy()
-        df_export['Type'] = 'Xuất kho'
+                st.success("✅ Xuất kho thành công!")
 
-        # Đọc bảng spare_parts lấy cột material_no và bin
-        query_spare_parts = "SELECT material_no, bin FROM spare_parts"
-        df_spare_parts = pd.read_sql_query(query_spare_parts, engine)
+        # Thêm dòng hiện tại vào giỏ xuất kho (chưa ghi vào CSDL)
+        if st.button("🛒 Thêm vào giỏ xuất kho"):
+            if not reason and not is_foc:
+                st.markdown('<p style="color:white;">❌ Bạn phải nhập lý do xuất kho!</p>', unsafe_allow_html=True)
+            elif mc_pos_id is None:
+                st.markdown('<p style="color:white;">❌ Vui lòng chọn đúng vị trí máy!</p>', unsafe_allow_html=True)
+            elif empl_id is None:
+                st.markdown('<p style="color:white;">❌ Vui lòng chọn người thực hiện!</p>', unsafe_allow_html=True)
+            else:
+                st.session_state.issue_cart.append({
+                    "part_id": part_id,
+                    "description": spare_parts.loc[spare_parts['material_no'] == part_id, 'description'].iloc[0],
+                    "quantity": int(quantity),
+                    "machine": machine_selected,
+                    "mc_pos": pos_selected,
+                    "mc_pos_id": mc_pos_id,
+                    "empl_id": empl_id,
+                    "reason": reason,
+                    "is_foc": bool(is_foc),
+                })
+
+    # ====== Giỏ xuất kho: ghi tất cả các dòng trong một giao dịch ======
+    if st.session_state.issue_cart:
+        st.markdown('<hr style="border-top: 1px solid white;"/>', unsafe_allow_html=True)
+        st.markdown(f'<p style="color:white; font-weight:bold;">🛒 Giỏ xuất kho ({len(st.session_state.issue_cart)} dòng)</p>', unsafe_allow_html=True)
+        df_cart = pd.DataFrame(st.session_state.issue_cart)
+        st.dataframe(
+            df_cart[['part_id', 'description', 'quantity', 'machine', 'mc_pos', 'empl_id', 'reason', 'is_foc']].rename(columns={
+                'part_id': 'Mã phụ tùng', 'description': 'Mô tả', 'quantity': 'Số lượng', 'machine': 'Tên máy',
+                'mc_pos': 'Vị trí máy', 'empl_id': 'Nhân viên', 'reason': 'Lý do', 'is_foc': 'FOC'
+            }),
+            use_container_width=True
+        )
 
-        # Merge df_export với df_spare_parts theo 'part_id' = 'material_no'
-        df_export = df_export.merge(df_spare_parts, left_on='part_id', right_on='material_no', how='left')
-        
+        col_cart_1, col_cart_2 = st.columns(2)
+        with col_cart_1:
+            if st.button("✅ Xuất toàn bộ giỏ"):
+                try:
+                    issue_stock_batch(engine, st.session_state.issue_cart)
+                except InsufficientStock as e:
+                    st.markdown(f'<p style="color:white;">❌ Không đủ hàng cho {e.part_id}: cần {e.requested}, tồn kho hiện tại {e.available}. Giỏ chưa được xuất.</p>', unsafe_allow_html=True)
+                except StockError as e:
+                    st.markdown(f'<p style="color:white;">❌ {e}</p>', unsafe_allow_html=True)
+                else:
+                    st.session_state.issue_cart = []
+                    st.success("✅ Đã xuất kho toàn bộ giỏ!")
+                    st.rerun()
+        with col_cart_2:
+            if st.button("🗑️ Xóa giỏ"):
+                st.session_state.issue_cart = []
+                st.rerun()
 
-        st.markdown('<span style="color:white; font-weight:bold;">Tìm kiếm theo Mã phụ tùng / Mô tả</span>', unsafe_allow_html=True)
-        search_keyword_export = st.text_input("", key="search", placeholder="Nhập Mã phụ tùng hoặc Mô tả")
 
-        # Nếu có từ khóa tìm kiếm, lọc dữ liệu theo part_id hoặc description
-        if search_keyword_export.strip() != "":
-            mask_export = (
-                df_export['part_id'].str.contains(search_keyword_export, case=False, na=False) |
-                df_export['description'].str.contains(search_keyword_export, case=False, na=False)
-            )
-            df_export = df_export[mask_export]
 
 
-        # Chuẩn bị dataframe để hiển thị
-        # Trước khi merge, làm sạch cột machine_name:
-        machine_data['machine_name'] = machine_data['machine_name'].astype(str).str.strip()
+    # ====== Lịch sử xuất kho ======
+    st.markdown('<span style="color:white; font-weight:bold;">Tìm kiếm theo Mã phụ tùng / Mô tả</span>', unsafe_allow_html=True)
+    search_keyword_export = st.text_input("", key="search", placeholder="Nhập Mã phụ tùng hoặc Mô tả")
+    page_size = st.selectbox("Số dòng mỗi trang", HISTORY_PAGE_SIZES, key="export_history_page_size")
 
-        # Thực hiện merge để thêm cột machine_name vào df_export theo key part_id <-> material_no
-        df_export = df_export.merge(machine_data[['material_no', 'machine_name']], 
-                                    left_on='part_id', right_on='material_no', how='left')
+    # Khoảng thời gian của tháng đã chọn; từ khóa được tra trong chỉ mục phụ tùng
+    history_start, history_end = month_range(selected_year, selected_month)
+    part_ids = get_parts_index(engine).search(search_keyword_export) if search_keyword_export.strip() != "" else None
 
-        # Giờ df_export có thêm cột 'machine_name'
-        # Bạn có thể tạo df_display như mong muốn:
-        df_display = df_export[['date', 'part_id', 'description', 'quantity', 'Type', 'bin', 'employee_name', 'machine_name','mc_pos']].copy()
-        df_display.columns = ['Ngày', 'Mã phụ tùng', 'Mô tả', 'Số lượng', 'Loại', 'Vị trí lưu (BIN)', 'Nhân viên','Tên máy', 'Vị trí máy']
+    cursor = history_page_cursor("export_history", [selected_year, selected_month, search_keyword_export, page_size])
+    df_history, next_cursor = fetch_import_export_history(
+        engine, history_start, history_end, part_ids, limit=page_size, cursor=cursor
+    )
 
+    if not df_history.empty:
         st.markdown(" Lịch sử xuất kho")
-        st.dataframe(df_display)
-
-        # Tạo file Excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df_display.to_excel(writer, sheet_name='Export_History', index=False)
-        output.seek(0)
+        st.dataframe(export_history_display(df_history))
+        history_pager("export_history", next_cursor)
 
         # Style cho nút tải Excel
         st.markdown("""
@@ -561,11 +394,16 @@ def show_export_stock():
         </style>
         """, unsafe_allow_html=True)
 
-        st.download_button(
-            label="⬇️ Tải Excel",
-            data=output,
+        # Tạo file Excel khi người dùng yêu cầu
+        excel_download(
+            engine,
+            "export_history",
+            [selected_year, selected_month, search_keyword_export],
+            HISTORY_TABLES,
+            lambda: export_history_display(fetch_import_export_history(engine, history_start, history_end, part_ids)[0]),
             file_name=f"Export_History_{selected_year}_{selected_month}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            sheet_name="Export_History",
+            label="⬇️ Tải Excel",
         )
     else:
         st.info("Không có dữ liệu xuất kho trong tháng đã chọn.")
@@ -1,29 +1,23 @@
+import hashlib
 import pandas as pd
 import streamlit as st
 from sqlalchemy import text
 from database import get_engine
+from excel_export import excel_download
+from reference_data import get_table
+from search_index import PARTS_CATALOG_VERSION, get_parts_index, refresh_parts_index
+from option_labels import get_label_index, typeahead
+from movement_history import HISTORY_PAGE_SIZES, HISTORY_TABLES, fetch_history, history_page_cursor, history_pager, month_range
+from stock_movements import MOVEMENT_TABLES, apply_receipts, receive_stock, record_import
+from table_versions import bump
+from bulk_receipts import load_part_catalog, read_receipt_file, receipts_from_preview, summarize_receipts, validate_receipts
 from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 # ---------------------- TẢI DỮ LIỆU TỪ DATABASE ------------------------
 
+# Danh mục lấy từ cache dùng chung (reference_data), không sửa trực tiếp các DataFrame này
 def load_machine_types(engine):
-    query = "SELECT id, machine FROM machine_type"
-    return pd.read_sql_query(text(query), engine)
-
-def load_spare_parts(engine):
-    query = """
-        SELECT sp.material_no, sp.description, mt.machine, sp.part_no, sp.bin, sp.cost_center,
-               sp.price, sp.stock, sp.safety_stock, sp.safety_stock_check
-        FROM spare_parts sp
-        JOIN machine_type mt ON sp.machine_type_id = mt.id
-    """
-    return pd.read_sql_query(text(query), engine)
-
-def load_employees(engine):
-    query = "SELECT amann_id, name FROM employees"
-    return pd.read_sql_query(text(query), engine)
+    return get_table(engine, "machine_type")
 
 def load_import_stock_data(engine):
     query = """
@@ -36,53 +30,17 @@ def load_import_stock_data(engine):
     return pd.read_sql_query(text(query), engine)
 
 # ---------------------- GIAO DIỆN TRANG VẬT LIỆU ------------------------
-def fetch_import_history(engine, year=None, quarter=None):
-    with engine.connect() as conn:
-        query = """
-            SELECT 
-                ie.date, 
-                sp.material_no as part_id, 
-                sp.description, 
-                ie.quantity, 
-                ie.im_ex_flag,
-                e.name as employee_name, 
-                mp.mc_pos, 
-                ie.reason
-            FROM import_export ie
-            JOIN spare_parts sp ON ie.part_id = sp.material_no
-            LEFT JOIN employees e ON ie.empl_id = e.amann_id
-            LEFT JOIN machine_pos mp ON ie.mc_pos_id = mp.mc_pos
-            WHERE ie.im_ex_flag = 1  -- chỉ lấy nhập kho
-        """
-        params = {}
-
-        if year:
-            query += " AND YEAR(ie.date) = :year"
-            params['year'] = year
-
-        if quarter:
-            quarter_map = {'Q1': 1, 'Q2': 2, 'Q3': 3, 'Q4': 4}
-            quarter_num = quarter_map.get(quarter)
-            if quarter_num is None:
-                raise ValueError(f"Quarter '{quarter}' không hợp lệ. Phải là Q1, Q2, Q3 hoặc Q4.")
-            start_month = (quarter_num - 1) * 3 + 1
-            end_month = start_month + 2
-            query += " AND MONTH(ie.date) BETWEEN :start_month AND :end_month"
-            params['start_month'] = start_month
-            params['end_month'] = end_month
-
-        query += " ORDER BY ie.date DESC"
-
-        result = conn.execute(text(query), params)
-        df = pd.DataFrame(result.fetchall(), columns=result.keys())
-        return df
+def fetch_import_history(engine, start, end, part_ids=None, limit=None, cursor=None):
+    # Lịch sử nhập kho trong khoảng [start, end), chỉ trả về trang đang hiển thị
+    return fetch_history(engine, 1, start, end, part_ids=part_ids, limit=limit, cursor=cursor)
+
 def show_material_page():
     st.markdown("<h1 style='text-align: center;'>Nhập kho</h1>", unsafe_allow_html=True)
     engine = get_engine()
 
-    spare_parts = load_spare_parts(engine)
     machine_types = load_machine_types(engine)
-    employees = load_employees(engine)
+    employee_labels = get_label_index(engine, "employees")
+    part_labels = get_label_index(engine, "spare_parts_by_part_no")
     import_stock_data = load_import_stock_data(engine)
 
     def plot_import_chart(import_stock_data):
@@ -214,16 +172,12 @@ def show_material_page():
             
             safety_check = st.radio("Có kiểm tra tồn kho an toàn không?", ("Có", "Không"))
 
-            selected_employee = st.selectbox(
-                "Người thực hiện thao tác", 
-                employees.apply(lambda x: f"{x['amann_id']} - {x['name']}", axis=1).tolist(), 
-                key="employee_select"
-            )
+            selected_employee = typeahead("Người thực hiện thao tác", employee_labels, key="employee_select")
 
             if st.button("✅ Xác nhận thêm mới"):
-                if new_material_no and new_description and machine_type_id:
+                if new_material_no and new_description and machine_type_id and selected_employee:
                     part_no = new_part_no if new_part_no else "Không có"
-                    empl_id = selected_employee.split(" - ")[0]
+                    empl_id = selected_employee
                     current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
                     with engine.begin() as conn:
@@ -250,16 +204,12 @@ def show_material_page():
 
                         # Nếu có tồn kho ban đầu thì ghi nhận vào lịch sử nhập kho
                         if new_stock > 0:
-                            conn.execute(text("""
-                                INSERT INTO import_export (part_id, quantity, mc_pos_id, empl_id, date, reason, im_ex_flag)
-                                VALUES (:part_id, :quantity, NULL, :empl_id, :date, 'Thêm vật liệu mới', 1)
-                            """), {
-                                "part_id": new_material_no,
-                                "quantity": new_stock,
-                                "empl_id": empl_id,
-                                "date": current_time
-                            })
+                            record_import(conn, new_material_no, new_stock, empl_id, current_time,
+                                          reason='Thêm vật liệu mới')
 
+                        bump(conn, *MOVEMENT_TABLES, PARTS_CATALOG_VERSION)
+
+                    refresh_parts_index(engine, [new_material_no])
                     st.success(f"✅ Đã thêm vật liệu **{new_material_no}** và ghi nhận lịch sử nhập kho.")
                     st.rerun()
                 else:
@@ -271,105 +221,95 @@ def show_material_page():
         st.subheader("Nhập kho linh kiện")
         with st.expander("Form nhập kho"):
             keyword = st.text_input("🔎 Tìm kiếm linh kiện (Material No hoặc Mô tả)")
-            filtered = spare_parts[
-                spare_parts['material_no'].str.contains(keyword, case=False, na=False) |
-                spare_parts['description'].str.contains(keyword, case=False, na=False)
-            ] if keyword else spare_parts
-
-            if not filtered.empty:
-                part_options = filtered.apply(
-                    lambda x: f"{x['part_no']} - {x['material_no']} - {x['description']}", axis=1
-                ).tolist()
-                selected_part = st.selectbox("Chọn linh kiện để nhập", part_options, key="part_select")
-            else:
+            # Chỉ các kết quả khớp nhất được đưa vào ô chọn (nhãn dựng sẵn theo phiên bản spare_parts)
+            selected_part = typeahead("Chọn linh kiện để nhập", part_labels, key="part_select", query=keyword)
+            if selected_part is None:
                 st.warning("⚠️ Không tìm thấy linh kiện phù hợp.")
-                selected_part = None
             quantity = st.number_input("Số lượng nhập", min_value=1, key="quantity_input")
             input_price = st.number_input("Đơn giá ($)", min_value=0.0, step=0.01, key="input_price_input")
 
 
-            import_employee = st.selectbox(
-                "Người thực hiện thao tác", 
-                employees.apply(lambda x: f"{x['amann_id']} - {x['name']}", axis=1).tolist(), 
-                key="import_employee_select"
-            )
+            import_employee = typeahead("Người thực hiện thao tác", employee_labels, key="import_employee_select")
             if st.button("📥 Xác nhận nhập kho"):
-                if selected_part and quantity > 0:
-                    part_id = selected_part.split(" - ")[1].strip()
-                    empl_id = import_employee.split(" - ")[0].strip()
+                if selected_part and import_employee and quantity > 0:
+                    part_id = selected_part
+                    empl_id = import_employee
                     current_time = datetime.now()
                     current_time_str = current_time.strftime('%Y-%m-%d %H:%M:%S')
 
                     with engine.begin() as conn:
-                        # Kiểm tra đã có bản ghi nhập kho trong tháng hiện tại cho part_id chưa
-                        existing_record = conn.execute(text("""
-                            SELECT id, quantity FROM import_export
-                            WHERE part_id = :part_id
-                            AND EXTRACT(YEAR FROM date) = :year
-                            AND EXTRACT(MONTH FROM date) = :month
-                            AND im_ex_flag = 1
-                            LIMIT 1
-                        """), {
-                            "part_id": part_id,
-                            "year": current_time.year,
-                            "month": current_time.month
-                        }).fetchone()
-
-                        if existing_record:
-                            # Cộng dồn số lượng và cập nhật lại thời gian nhập kho
-                            record_id = existing_record.id
-                            conn.execute(text("""
-                                UPDATE import_export
-                                SET quantity = quantity + :quantity,
-                                    date = :date
-                                WHERE id = :id
-                            """), {
-                                "quantity": quantity,
-                                "date": current_time_str,
-                                "id": record_id
-                            })
-                        else:
-                            # Thêm bản ghi mới nếu chưa có
-                            conn.execute(text("""
-                                INSERT INTO import_export (part_id, quantity, mc_pos_id, empl_id, date, reason, im_ex_flag)
-                                VALUES (:part_id, :quantity, NULL, :empl_id, :date, 'Nhập kho', 1)
-                            """), {
-                                "part_id": part_id,
-                                "quantity": quantity,
-                                "empl_id": empl_id,
-                                "date": current_time_str
-                            })
-
-                        # Cập nhật tồn kho spare_parts
-                        result = conn.execute(text("""
-                            UPDATE spare_parts
-                            SET stock = COALESCE(stock, 0) + :quantity,
-                                price = :price,
-                                import_date = :import_date
-                            WHERE material_no = :part_id
-                        """), {
-                            "quantity": quantity,
-                            "price": input_price,
-                            "part_id": part_id,
-                            "import_date": current_time_str
-                        })
+                        # Cộng dồn vào bucket nhập kho của tháng (một câu upsert theo chỉ mục duy nhất)
+                        record_import(conn, part_id, quantity, empl_id, current_time_str)
 
-                        if result.rowcount == 0:
-                            conn.execute(text("""
-                                INSERT INTO spare_parts (material_no, stock, price, import_date)
-                                VALUES (:part_id, :quantity, :price, :import_date)
-                            """), {
-                                "part_id": part_id,
-                                "quantity": quantity,
-                                "price": input_price,
-                                "import_date": current_time_str
-                            })
+                        # Cập nhật tồn kho và đơn giá spare_parts
+                        receive_stock(conn, part_id, quantity, input_price, current_time_str)
+                        bump(conn, *MOVEMENT_TABLES)
 
+                    refresh_parts_index(engine, [part_id])
                     st.success("✅ Nhập kho thành công và đã cập nhật đơn giá.")
                     st.rerun()
                 else:
                     st.error("Vui lòng chọn phụ tùng và nhập số lượng hợp lệ.")
 
+    # ---------------------- NHẬP KHO HÀNG LOẠT TỪ FILE ------------------------
+    st.subheader("Nhập kho hàng loạt")
+    with st.expander("Tải file Excel/CSV (cột: material_no, quantity, price)"):
+        # Sau khi nhập xong, ô tải file được đổi key để xóa file đã nhập; mã băm của các file đã nhập
+        # được giữ lại để bấm lặp (hoặc tải lại đúng file đó) không nhập kho lần hai
+        if "bulk_receipt_upload" not in st.session_state:
+            st.session_state.bulk_receipt_upload = 0
+        if "bulk_receipt_applied" not in st.session_state:
+            st.session_state.bulk_receipt_applied = set()
+        if "bulk_receipt_done" in st.session_state:
+            st.success(st.session_state.pop("bulk_receipt_done"))
+
+        uploaded_file = st.file_uploader("Chọn file phiếu nhập", type=["xlsx", "csv"],
+                                         key=f"bulk_receipt_file_{st.session_state.bulk_receipt_upload}")
+        bulk_employee = typeahead("Người thực hiện thao tác", employee_labels, key="bulk_employee_select")
+
+        receipt_df = None
+        if uploaded_file is not None:
+            file_bytes = uploaded_file.getvalue()
+            file_hash = hashlib.sha1(file_bytes).hexdigest()
+            if file_hash in st.session_state.bulk_receipt_applied:
+                st.warning("⚠️ File này đã được nhập kho. Tải file khác nếu muốn nhập tiếp.")
+            else:
+                try:
+                    receipt_df = read_receipt_file(uploaded_file.name, file_bytes)
+                except ValueError as e:
+                    st.error(f"⚠️ {e}")
+
+            if receipt_df is not None:
+                catalog = load_part_catalog(engine)
+                checked = validate_receipts(receipt_df, catalog)
+                invalid = checked[checked['error'] != ""]
+                valid = checked[checked['error'] == ""]
+
+                if not invalid.empty:
+                    st.error(f"⚠️ Có {len(invalid)} dòng không hợp lệ. Vui lòng sửa file rồi tải lại.")
+                    st.dataframe(invalid.rename(columns={
+                        'line': 'Dòng', 'material_no': 'Mã vật liệu', 'quantity': 'Số lượng',
+                        'price': 'Đơn giá', 'error': 'Lỗi'
+                    }), use_container_width=True)
+                elif valid.empty:
+                    st.warning("⚠️ File không có dòng nào.")
+                else:
+                    preview = summarize_receipts(valid, catalog)
+                    st.markdown(f"**Xem trước:** {len(valid)} dòng, {len(preview)} mã vật liệu, tổng {int(preview['quantity'].sum()):,} cái")
+                    st.dataframe(preview.drop(columns=['price']).rename(columns={
+                        'material_no': 'Mã vật liệu', 'description': 'Mô tả', 'current_stock': 'Tồn hiện tại',
+                        'quantity': 'Nhập thêm', 'new_stock': 'Tồn sau nhập',
+                        'current_price': 'Đơn giá hiện tại', 'new_price': 'Đơn giá mới'
+                    }), use_container_width=True)
+
+                    if st.button("📥 Xác nhận nhập kho từ file", disabled=bulk_employee is None):
+                        empl_id = bulk_employee
+                        apply_receipts(engine, receipts_from_preview(preview), empl_id)
+                        st.session_state.bulk_receipt_applied.add(file_hash)
+                        st.session_state.bulk_receipt_upload += 1
+                        st.session_state.bulk_receipt_done = f"✅ Đã nhập kho {len(preview)} mã vật liệu từ file."
+                        st.rerun()
+
 
 
 
@@ -379,51 +319,24 @@ def show_material_page():
     # Thêm ô nhập liệu tìm kiếm theo material_no hoặc description
     search_keyword = st.text_input("Tìm kiếm theo Mã phụ tùng/Mô tả", "")
 
-    # Lấy dữ liệu nhập kho từ DB
-    import_history_df = fetch_import_history(engine)
-
-    # Đảm bảo cột date dạng datetime
-    import_history_df['date'] = pd.to_datetime(import_history_df['date'], errors='coerce')
-    import_history_df['year'] = import_history_df['date'].dt.year
-    import_history_df['month'] = import_history_df['date'].dt.month
-
-    # Lấy bảng spare_parts có material_no và bin
-    query_spare_part = "SELECT material_no, bin FROM spare_parts"
-    spare_part_df = pd.read_sql(query_spare_part, engine)
+    page_size = st.selectbox("Số dòng mỗi trang", HISTORY_PAGE_SIZES, key="import_history_page_size")
 
-    # Chuẩn hóa dữ liệu dạng string, loại bỏ khoảng trắng thừa
-    import_history_df['part_id'] = import_history_df['part_id'].astype(str).str.strip()
-    spare_part_df['material_no'] = spare_part_df['material_no'].astype(str).str.strip()
+    # Khoảng thời gian của tháng đã chọn; từ khóa được tra trong chỉ mục phụ tùng
+    start, end = month_range(st.session_state.selected_year, st.session_state.selected_month)
+    part_ids = get_parts_index(engine).search(search_keyword) if search_keyword.strip() != "" else None
 
-    # Merge để lấy thông tin bin
-    import_history_df = import_history_df.merge(
-        spare_part_df[['material_no', 'bin']],
-        left_on='part_id',
-        right_on='material_no',
-        how='left'
+    cursor = history_page_cursor(
+        "import_history",
+        [st.session_state.selected_year, st.session_state.selected_month, search_keyword, page_size]
     )
+    filtered_data, next_cursor = fetch_import_history(engine, start, end, part_ids, limit=page_size, cursor=cursor)
 
-    # Xóa cột thừa và thay thế NaN
-    import_history_df.drop(columns=['material_no'], inplace=True)
-    import_history_df['bin'] = import_history_df['bin'].fillna('Chưa xác định')
-
-    # Lọc theo tháng và năm người dùng chọn
-    filtered_data = import_history_df[
-        (import_history_df['year'] == st.session_state.selected_year) &
-        (import_history_df['month'] == st.session_state.selected_month)
-    ]
-
-    # Nếu có từ khóa tìm kiếm, lọc thêm theo material_no hoặc description
-    if search_keyword.strip() != "":
-        mask = (
-            filtered_data['part_id'].str.contains(search_keyword, case=False, na=False) |
-            filtered_data['description'].str.contains(search_keyword, case=False, na=False)
-        )
-        filtered_data = filtered_data[mask]
+    columns_to_show = ['Ngày nhập kho', 'Mã phụ tùng', 'Mô tả', 'Số lượng', 'Loại', 'Vị trí lưu (BIN)', 'Nhân viên', 'Lý do']
 
-    if not filtered_data.empty:
+    def to_display(df):
+        df['bin'] = df['bin'].fillna('Chưa xác định')
         # Đổi tên cột để hiển thị
-        display_df = filtered_data.rename(columns={
+        display_df = df.rename(columns={
             'date': 'Ngày nhập kho',
             'part_id': 'Mã phụ tùng',
             'description': 'Mô tả',
@@ -436,13 +349,12 @@ def show_material_page():
 
         # Định dạng ngày tháng đầy đủ
         display_df['Ngày nhập kho'] = pd.to_datetime(display_df['Ngày nhập kho']).dt.strftime("%Y-%m-%d %H:%M")
+        return display_df[[col for col in columns_to_show if col in display_df.columns]]
 
-        # Chọn cột hiển thị
-        columns_to_show = ['Ngày nhập kho', 'Mã phụ tùng', 'Mô tả', 'Số lượng', 'Loại', 'Vị trí lưu (BIN)', 'Nhân viên', 'Lý do']
-        columns_to_show = [col for col in columns_to_show if col in display_df.columns]
-
-        # Hiển thị bảng dữ liệu
-        st.dataframe(display_df[columns_to_show].sort_values(by='Ngày nhập kho', ascending=False), use_container_width=True)
+    if not filtered_data.empty:
+        # Hiển thị bảng dữ liệu (đã sắp xếp mới nhất trước trong truy vấn)
+        st.dataframe(to_display(filtered_data), use_container_width=True)
+        history_pager("import_history", next_cursor)
 
         # 💅 CSS tùy chỉnh cho nút tải xuống
         st.markdown("""
@@ -459,18 +371,16 @@ def show_material_page():
             </style>
             """, unsafe_allow_html=True)
 
-        # ✅ Nút xuất Excel
-        from io import BytesIO
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            display_df[columns_to_show].to_excel(writer, index=False, sheet_name='Lich_su_nhap_kho')
-        output.seek(0)
-
-        st.download_button(
-            label="📤 Tải xuống Excel",
-            data=output,
+        # ✅ Nút xuất Excel (chỉ tạo file khi người dùng yêu cầu)
+        excel_download(
+            engine,
+            "import_history",
+            [st.session_state.selected_year, st.session_state.selected_month, search_keyword],
+            HISTORY_TABLES,
+            lambda: to_display(fetch_import_history(engine, start, end, part_ids)[0]),
             file_name=f"Lich_su_nhap_kho_{st.session_state.selected_month}_{st.session_state.selected_year}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            sheet_name="Lich_su_nhap_kho",
+            label="📤 Tải xuống Excel",
         )
 
     else:
@@ -1,41 +1,75 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
 from sqlalchemy import text
 from database import get_engine
-
-def load_machines(engine, selected_group, selected_pos, search_name):
-    query = """
-    SELECT g.mc_name AS group_mc_name,
-           m.name AS machine_name,
+from machine_topology import get_machine_topology
+from movement_history import HISTORY_PAGE_SIZES, history_page_cursor, history_pager
+from table_versions import bump
+
+def _machine_conditions(group_id, search_name):
+    # Chỉ thêm các điều kiện đang dùng để CSDL chọn được chỉ mục phù hợp
+    conditions, params = [], {}
+    if group_id is not None:
+        conditions.append("m.group_mc_id = :group_id")
+        params["group_id"] = group_id
+    if search_name.strip():
+        conditions.append("m.name LIKE :search_name")
+        params["search_name"] = f"%{search_name.strip()}%"
+    return conditions, params
+
+
+def count_machines(engine, group_id=None, search_name=""):
+    conditions, params = _machine_conditions(group_id, search_name)
+    query = "SELECT COUNT(*) FROM machine m"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    with engine.connect() as conn:
+        return conn.execute(text(query), params).scalar()
+
+
+def load_machines(engine, group_id=None, search_name="", limit=100, cursor=None):
+    # Một trang máy sắp theo (name, id), kèm nhóm và các vị trí của từng máy (mỗi vị trí một dòng).
+    # cursor: (name, id) của máy cuối trang trước. Trả về (DataFrame, cursor trang sau hoặc None)
+    conditions, params = _machine_conditions(group_id, search_name)
+    if cursor is not None:
+        conditions.append("m.name >= :cursor_name AND (m.name > :cursor_name OR m.id > :cursor_id)")
+        params["cursor_name"], params["cursor_id"] = cursor
+    page_query = "SELECT m.id, m.name, m.group_mc_id FROM machine m"
+    if conditions:
+        page_query += " WHERE " + " AND ".join(conditions)
+    # Lấy thêm một máy để biết còn trang sau hay không
+    page_query += " ORDER BY m.name, m.id LIMIT :limit"
+    params["limit"] = limit + 1
+
+    query = f"""
+    SELECT p.id AS machine_id,
+           g.mc_name AS group_mc_name,
+           p.name AS machine_name,
            mp.mc_pos AS machine_pos
-    FROM machine m
-    JOIN group_mc g ON m.group_mc_id = g.id
-    LEFT JOIN machine_pos mp ON m.group_mc_id = mp.mc_id
-    WHERE (:group_name = 'Tất cả' OR g.mc_name = :group_name)
-      AND (:pos = 'Tất cả' OR mp.mc_pos = :pos)
-      AND (:search_name = '' OR m.name LIKE :search_name)
-    ORDER BY m.name DESC
-    LIMIT 1000
+    FROM ({page_query}) p
+    LEFT JOIN group_mc g ON p.group_mc_id = g.id
+    LEFT JOIN machine_pos mp ON mp.mc_id = p.id
+    ORDER BY p.name, p.id, mp.mc_pos
     """
-    df = pd.read_sql_query(text(query), engine, params={
-        "group_name": selected_group,
-        "pos": selected_pos,
-        "search_name": f"%{search_name}%"
-    })
-    return df
+    with engine.connect() as conn:
+        df = pd.read_sql_query(text(query), conn, params=params)
+
+    next_cursor = None
+    machine_ids = df['machine_id'].drop_duplicates().tolist()
+    if len(machine_ids) > limit:
+        df = df[df['machine_id'] != machine_ids[-1]]
+        last = df.iloc[-1]
+        next_cursor = (last['machine_name'], int(last['machine_id']))
+    return df.drop(columns=['machine_id']).reset_index(drop=True), next_cursor
 
 def show_machine_page():
     st.markdown("<h1 style='text-align: center;'>Quản lý máy móc</h1>", unsafe_allow_html=True)
     engine = get_engine()
 
-    with engine.connect() as conn:
-        group_list = conn.execute(text("SELECT mc_name FROM group_mc")).scalars().all()
-        pos_list = conn.execute(text("SELECT DISTINCT mc_pos FROM machine_pos WHERE mc_pos IS NOT NULL")).scalars().all()
-
-        group_data = conn.execute(text("SELECT id, mc_name FROM group_mc")).fetchall()
-        group_name_to_id = {g.mc_name: g.id for g in group_data}
+    # Nhóm máy tra trong cây máy dùng chung (cache theo phiên bản dữ liệu)
+    topology = get_machine_topology(engine)
+    group_list = topology.group_names()
+    group_name_to_id = topology.group_ids_by_name
 
     # ======== State mặc định ========
     if 'search_name' not in st.session_state:
@@ -79,13 +113,18 @@ def show_machine_page():
     if st.session_state.reload_machines:
         st.session_state.reload_machines = False
 
-    # ======== Lấy danh sách máy ========
-    df = load_machines(engine, selected_group, "Tất cả", search_name)
+    # ======== Lấy danh sách máy (phân trang keyset, đổi bộ lọc thì về trang đầu) ========
+    group_id = group_name_to_id.get(selected_group)
+    page_size = st.selectbox("Số máy mỗi trang", HISTORY_PAGE_SIZES, index=1, key="machine_page_size")
+    total = count_machines(engine, group_id, search_name)
+    cursor = history_page_cursor("machine_list", [selected_group, search_name.strip(), page_size])
+    df, next_cursor = load_machines(engine, group_id, search_name, limit=page_size, cursor=cursor)
 
-    st.subheader("📋 Danh sách máy")
+    st.subheader(f"📋 Danh sách máy ({total:,} máy)")
     if not df.empty:
         # Hiển thị dữ liệu dưới dạng bảng
         st.dataframe(df)  # Hiển thị bảng dữ liệu với cột máy và vị trí
+        history_pager("machine_list", next_cursor, total_pages=max(1, -(-total // page_size)))
 
         
        
@@ -165,6 +204,7 @@ def show_machine_page():
                             "mc_id": machine_id,
                             "mc_pos": new_pos.strip()
                         })
+                        bump(conn, "machine", "machine_pos")
 
                     st.success(f"✅ Đã thêm máy: {new_name} với vị trí: {new_pos}")
                     st.session_state.reload_machines = True
@@ -1,31 +1,25 @@
-import streamlit as st
 import pandas as pd
-from sqlalchemy import text
+import streamlit as st
 from database import get_engine
-import altair as alt
-
-# Hàm load các loại máy từ cơ sở dữ liệu
+from reference_data import discard_table, get_table, refresh_rows
+from option_labels import get_label_index, typeahead
+from search_index import refresh_parts_index
+from stock_movements import PartEditConflict, changed_part_columns, safety_check_enabled, update_part
+from table_versions import mark_stale
+from datetime import datetime
+
+# Hàm load các loại máy (cache dùng chung)
 def load_machine_types():
-    engine = get_engine()
-    return pd.read_sql("SELECT id, machine FROM machine_type", engine)
+    return get_table(get_engine(), "machine_type")
 
-# Hàm load dữ liệu spare parts từ cơ sở dữ liệu
+# Hàm load dữ liệu spare parts (cache dùng chung cho mọi phiên, không giữ bản riêng trong session_state)
 def load_spare_parts():
-    engine = get_engine()
-    return pd.read_sql("SELECT * FROM spare_parts", engine)
+    return get_table(get_engine(), "spare_parts")
 
 def manage_spare_parts():
     st.title("Quản lý linh kiện")
 
-    # Kiểm tra và cập nhật dữ liệu spare_parts nếu cần
-    if "reload_parts_data" not in st.session_state:
-        st.session_state.reload_parts_data = True
-
-    if "parts_data" not in st.session_state or st.session_state.reload_parts_data:
-        st.session_state.parts_data = load_spare_parts()
-        st.session_state.reload_parts_data = False
-
-    parts = st.session_state.parts_data
+    parts = load_spare_parts()
     machine_types = load_machine_types()
     machine_type_dict = {f"{row['id']} - {row['machine']}": row['id'] for _, row in machine_types.iterrows()}
 
@@ -104,17 +98,21 @@ def manage_spare_parts():
     # ------------ CẬP NHẬT ------------ 
     with tab3:
         st.subheader("Cập nhật vật liệu")
-        selected_part = st.selectbox(
-            "Chọn vật liệu",
-            parts.apply(lambda x: f"{x['material_no']} - {x['description']}", axis=1),
-            key="edit_part_selector"
-        )
-        selected_material_no = selected_part.split(" - ")[0]
-        selected_data = parts[parts['material_no'] == selected_material_no].iloc[0]
+        selected_material_no = typeahead("Chọn vật liệu", get_label_index(get_engine(), "spare_parts"), key="edit_part_selector")
+        if selected_material_no is None:
+            st.warning("Không tìm thấy vật liệu.")
+            return
+        # Bản ghi lúc mở form (giữ qua các lần chạy lại): giá trị mặc định của form và phiên bản dòng để phát hiện
+        # thay đổi đồng thời; chỉ đọc lại khi chọn vật liệu khác hoặc sau khi lưu
+        loaded = st.session_state.get("edit_part_loaded")
+        if loaded is None or loaded["material_no"] != selected_material_no:
+            loaded = parts[parts['material_no'] == selected_material_no].iloc[0].to_dict()
+            st.session_state.edit_part_loaded = loaded
+        selected_data = loaded
 
         col1, col2 = st.columns(2)
         with col1:
-            material_no = st.text_input("Material No", selected_data['material_no'], key="edit_material_no")
+            material_no = st.text_input("Material No", selected_data['material_no'], key="edit_material_no", disabled=True)
             description = st.text_input("Description", selected_data['description'], key="edit_description")
             part_no = st.text_input("Part No", selected_data['part_no'] or "", key="edit_part_no")
             bin_val = st.text_input("Bin", selected_data['bin'] or "", key="edit_bin")
@@ -126,58 +124,60 @@ def manage_spare_parts():
             cost_center = st.text_input("Cost Center", selected_data['cost_center'] or "", key="edit_cost_center")
             price = st.number_input("Price", min_value=0.0, value=selected_data['price'] or 0.0, key="edit_price")
             stock = st.number_input("Stock", min_value=0, value=selected_data['stock'] or 0, key="edit_stock")
-            safety_stock = st.number_input("Safety Stock", min_value=0, value=selected_data.get('safety_stock', 0), key="edit_safety_stock")
+            # safety_stock có thể NULL (cột thành float trong DataFrame): đưa về số nguyên cho number_input
+            safety_stock_value = selected_data.get('safety_stock')
+            safety_stock = st.number_input("Safety Stock", min_value=0,
+                                           value=int(safety_stock_value) if pd.notna(safety_stock_value) else 0,
+                                           key="edit_safety_stock")
             safety_stock_check = st.radio("Kiểm tra tồn kho an toàn", ["Yes", "No"],
-                                          index=0 if selected_data.get('safety_stock_check', "Yes") == "Yes" else 1,
+                                          index=0 if safety_check_enabled(selected_data.get('safety_stock_check')) else 1,
                                           key="edit_safety_check")
             # Thêm chức năng xuất kho
             quantity_out = st.number_input("Số lượng xuất kho", min_value=0, max_value=int(stock), value=0)
 
         if st.button("Lưu cập nhật", key="btn_update_part"):
+            # Kiểm tra số lượng xuất kho
+            if quantity_out > stock:
+                st.warning("❌ Số lượng xuất kho không thể lớn hơn số lượng tồn kho.")
+                return
+
+            # Chỉ gửi các cột đã đổi; tồn kho chỉ ghi khi người dùng sửa hoặc xuất kho ở form này
+            changes = changed_part_columns(selected_data, {
+                "description": description,
+                "part_no": part_no,
+                "machine_type_id": machine_type_id,
+                "bin": bin_val,
+                "cost_center": cost_center,
+                "price": price,
+                "safety_stock": safety_stock,
+                "safety_stock_check": safety_stock_check,
+            })
+            new_stock = stock - quantity_out
+            if new_stock == (selected_data['stock'] or 0):
+                new_stock = None
+            if not changes and new_stock is None:
+                st.info("Không có thay đổi nào để lưu.")
+                return
+
+            engine = get_engine()
             try:
-                # Kiểm tra số lượng xuất kho
-                if quantity_out > stock:
-                    st.warning("❌ Số lượng xuất kho không thể lớn hơn số lượng tồn kho.")
-                    return
-
-                # Cập nhật thông tin vật liệu và trừ số lượng xuất kho
-                with get_engine().begin() as conn:
-                    # Cập nhật dữ liệu trong cơ sở dữ liệu
-                    conn.execute(text(""" 
-                        UPDATE spare_parts
-                        SET material_no = :material_no,
-                            description = :description,
-                            part_no = :part_no,
-                            machine_type_id = :machine_type_id,
-                            bin = :bin,
-                            cost_center = :cost_center,
-                            price = :price,
-                            stock = :stock,
-                            safety_stock = :safety_stock,
-                            safety_stock_check = :safety_stock_check
-                        WHERE material_no = :material_no
-                    """), {
-                        "material_no": material_no,
-                        "description": description,
-                        "part_no": part_no,
-                        "machine_type_id": machine_type_id,
-                        "bin": bin_val,
-                        "cost_center": cost_center,
-                        "price": price,
-                        "stock": stock - quantity_out,  # Giảm số lượng tồn kho khi xuất kho
-                        "safety_stock": safety_stock,
-                        "safety_stock_check": safety_stock_check
-                    })
-
-                # Cập nhật lại parts_data sau khi thay đổi
-                st.session_state.reload_parts_data = True
-                st.success("✅ Cập nhật thành công.")
-            
+                new_version = update_part(engine, material_no, selected_data['version'], changes,
+                                          new_stock=new_stock, moved_at=datetime.now())
+            except PartEditConflict as e:
+                # Giao dịch đã rollback, không biết bên kia đã sửa những dòng nào: bỏ bản cache của cả bảng
+                # và bản ghi lúc mở form, lần chạy sau form hiện dữ liệu mới nhất để kiểm tra và lưu lại
+                st.session_state.edit_part_loaded = None
+                mark_stale()
+                discard_table("spare_parts")
+                st.error(f"⚠️ {e} Tồn kho hiện tại: {e.current['stock']}. Dữ liệu mới nhất đã được tải lại, vui lòng kiểm tra và lưu lại.")
+                return
             except Exception as e:
                 st.error(f"❌ Cập nhật thất bại: {e}")
-                st.session_state.reload_parts_data = True  # Reload data in case of failure
-
-        # Đảm bảo làm mới dữ liệu sau khi cập nhật
-        if st.session_state.reload_parts_data:
-            st.session_state.parts_data = load_spare_parts()  # Tải lại dữ liệu spare parts từ cơ sở dữ liệu
-            st.write(st.session_state.parts_data)  # In ra để kiểm tra dữ liệu đã được tải lại chưa
+                return
+
+            # Chỉ đọc lại dòng vừa sửa vào bản cache dùng chung, không tải lại cả bảng
+            st.session_state.edit_part_loaded = None
+            refresh_rows(engine, "spare_parts", "material_no", [material_no], new_version)
+            if changes:
+                refresh_parts_index(engine, [material_no])
+            st.success("✅ Cập nhật thành công.")
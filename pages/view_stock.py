@@ -1,188 +1,241 @@
 import streamlit as st
 import pandas as pd
-import io
+from sqlalchemy import bindparam, text
 from database import get_engine
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
-from st_aggrid.shared import JsCode
-import plotly.express as px
-import plotly.graph_objects as go
+from excel_export import excel_download
+from reference_data import get_table
+from search_index import get_parts_index
+
+STOCK_COLUMNS = """
+    sp.material_no, sp.part_no, sp.description,
+    mt.machine AS machine_type,
+    sp.bin, sp.cost_center,
+    sp.price, sp.stock, sp.safety_stock,
+    sp.safety_stock_check, sp.image_url,
+    sp.import_date, sp.export_date,
+    DATEDIFF(IFNULL(sp.export_date, CURDATE()), sp.import_date) AS storage_days
+"""
+
+# Cột cho phép sắp xếp (tên hiển thị -> biểu thức SQL)
+SORT_COLUMNS = {
+    "material_no": "sp.material_no",
+    "part_no": "sp.part_no",
+    "description": "sp.description",
+    "machine_type": "mt.machine",
+    "bin": "sp.bin",
+    "cost_center": "sp.cost_center",
+    "price": "sp.price",
+    "stock": "sp.stock",
+    "safety_stock": "sp.safety_stock",
+    "import_date": "sp.import_date",
+    "export_date": "sp.export_date",
+}
+
+PAGE_SIZES = [25, 50, 100, 200]
+
+
+def build_stock_filters(part_ids, min_stock, max_stock, selected_machine):
+    # Chuyển bộ lọc trên giao diện thành mệnh đề WHERE + tham số
+    # part_ids: tập mã vật tư khớp từ khóa (None nếu không tìm kiếm)
+    conditions = ["sp.stock >= :min_stock", "sp.stock <= :max_stock"]
+    params = {"min_stock": min_stock, "max_stock": max_stock}
+
+    if part_ids is not None:
+        if part_ids:
+            conditions.append("sp.material_no IN :part_ids")
+            params["part_ids"] = sorted(part_ids)
+        else:
+            conditions.append("1 = 0")
+
+    if selected_machine != 'Tất cả':
+        conditions.append("mt.machine = :machine")
+        params["machine"] = selected_machine
+
+    return " AND ".join(conditions), params
+
+
+def _stock_text(query, params):
+    stmt = text(query)
+    if "part_ids" in params:
+        stmt = stmt.bindparams(bindparam("part_ids", expanding=True))
+    return stmt
+
+
+def fetch_stock_totals(engine, where, params):
+    query = f"""
+        SELECT
+            COUNT(*) AS total_items,
+            COALESCE(SUM(sp.stock), 0) AS total_stock,
+            COALESCE(SUM(sp.stock * sp.price), 0) AS total_value,
+            COALESCE(SUM(CASE WHEN sp.stock < sp.safety_stock THEN 1 ELSE 0 END), 0) AS low_stock_filtered,
+            (SELECT COUNT(*) FROM spare_parts WHERE stock < safety_stock) AS low_stock_all
+        FROM spare_parts sp
+        JOIN machine_type mt ON sp.machine_type_id = mt.id
+        WHERE {where}
+    """
+    with engine.connect() as conn:
+        return conn.execute(_stock_text(query, params), params).mappings().one()
+
+
+def fetch_stock_page(engine, where, params, sort_col, ascending, page_size, page):
+    order = f"{SORT_COLUMNS[sort_col]} {'ASC' if ascending else 'DESC'}, sp.material_no"
+    query = f"""
+        SELECT {STOCK_COLUMNS}
+        FROM spare_parts sp
+        JOIN machine_type mt ON sp.machine_type_id = mt.id
+        WHERE {where}
+        ORDER BY {order}
+        LIMIT :limit OFFSET :offset
+    """
+    page_params = dict(params, limit=page_size, offset=(page - 1) * page_size)
+    with engine.connect() as conn:
+        return pd.read_sql(_stock_text(query, page_params), conn, params=page_params)
+
+
+def fetch_stock_rows(engine, where, params, extra_condition=None):
+    # Toàn bộ dòng thỏa bộ lọc (dùng cho bảng mã thiếu và file Excel)
+    if extra_condition:
+        where = f"{where} AND {extra_condition}"
+    query = f"""
+        SELECT {STOCK_COLUMNS}
+        FROM spare_parts sp
+        JOIN machine_type mt ON sp.machine_type_id = mt.id
+        WHERE {where}
+        ORDER BY sp.material_no
+    """
+    with engine.connect() as conn:
+        return pd.read_sql(_stock_text(query, params), conn, params=params)
+
 
 def show_view_stock():
     st.markdown("<h1 style='text-align: center;'>Tồn kho</h1>", unsafe_allow_html=True)
 
     # Kết nối cơ sở dữ liệu
     engine = get_engine()
-    with engine.begin() as conn:
-        df_stock = pd.read_sql(''' 
-        SELECT 
-            sp.material_no, sp.part_no, sp.description, 
-            mt.machine AS machine_type, 
-            sp.bin, sp.cost_center, 
-            sp.price, sp.stock, sp.safety_stock, 
-            sp.safety_stock_check, sp.image_url,
-            sp.import_date, sp.export_date,
-            DATEDIFF(IFNULL(sp.export_date, CURDATE()), sp.import_date) AS storage_days
-        FROM spare_parts sp
-        JOIN machine_type mt ON sp.machine_type_id = mt.id
-        ''', conn)
-        
-        # Tính tổng tồn kho và tổng giá trị của tồn kho
-        total_stock = int(df_stock['stock'].sum())
-        total_value = int((df_stock['stock'] * df_stock['price']).sum())
+    machine_type_list = get_table(engine, "machine_type")['machine'].dropna().unique().tolist()
 
-        
+    # --- Thanh lọc dữ liệu ---
+    st.markdown("""
+        <style>
+        /* Đổi màu chữ trong ô input và select box thành trắng */
+        input, select, textarea {
+            color: white !important;
+            background-color: #2a2a2a !important;
+        }
 
+        /* Placeholder (gợi ý nhập liệu) màu xám nhạt cho dễ nhìn */
+        ::placeholder {
+            color: #cccccc !important;
+            opacity: 1;
+        }
 
-    # --- Thanh lọc dữ liệu ---
-       
-        st.markdown("""
-            <style>
-            /* Đổi màu chữ trong ô input và select box thành trắng */
-            input, select, textarea {
-                color: white !important;
-                background-color: #2a2a2a !important;
-            }
+        /* Label (nhãn như "Tìm kiếm", "Tồn kho tối thiểu"...) */
+        label {
+            color: white !important;
+        }
+        </style>
+    """, unsafe_allow_html=True)
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        keyword = st.text_input("Tìm kiếm", placeholder="Nhập mã, mô tả, cost center...")
+
+    with col2:
+        min_stock_str = st.text_input("Tồn kho tối thiểu", placeholder="VD: 0")
+
+    with col3:
+        max_stock_str = st.text_input("Tồn kho tối đa", placeholder="VD: 100000")
+
+    with col4:
+        machine_types = ['Tất cả'] + sorted(machine_type_list)
+        selected_machine = st.selectbox("Loại máy", machine_types)
+
+    # --- Chuyển đổi kiểu số ---
+    try:
+        min_stock = int(min_stock_str) if min_stock_str else 0
+    except ValueError:
+        min_stock = 0
+        st.warning("⚠️ Tồn kho tối thiểu không hợp lệ.")
+
+    try:
+        max_stock = int(max_stock_str) if max_stock_str else 100000
+    except ValueError:
+        max_stock = 100000
+        st.warning("⚠️ Tồn kho tối đa không hợp lệ.")
+
+    # --- Lọc dữ liệu (thực hiện trong CSDL) ---
+    # Từ khóa được tra trong chỉ mục tìm kiếm dựng sẵn thay vì quét từng cột
+    part_ids = get_parts_index(engine).search(keyword) if keyword.strip() else None
+    where, params = build_stock_filters(part_ids, min_stock, max_stock, selected_machine)
+
+    # --- Tính toán thống kê bằng một truy vấn tổng hợp ---
+    totals = fetch_stock_totals(engine, where, params)
+    total_items = int(totals["total_items"])
+    total_stock = int(totals["total_stock"])
+    total_value = float(totals["total_value"])
+    low_stock_count = int(totals["low_stock_all"])
+
+    # --- Hiển thị thẻ thông tin ---
+
+    col1, col2, col3, col4 = st.columns(4)
+
+
+    def styled_card(title, value, icon="📦", color="#83c5be"):
+        return f"""
+            <div style="
+                background-color:{color};
+                color:white;
+                padding:15px;
+                border-radius:12px;
+                text-align:center;
+                max-width:220px;
+                margin:0 auto;
+                box-shadow: 2px 2px 8px rgba(0,0,0,0.2);
+            ">
+                <div style="font-size:14px;">{icon} <b>{title}</b></div>
+                <div style="font-size:22px; font-weight:bold;">{value}</div>
+            </div>
+        """
 
-            /* Placeholder (gợi ý nhập liệu) màu xám nhạt cho dễ nhìn */
-            ::placeholder {
-                color: #cccccc !important;
-                opacity: 1;
-            }
+    with col1:
+        st.markdown(styled_card("Số lượng vật tư", f"{total_items} loại", ""), unsafe_allow_html=True)
 
-            /* Label (nhãn như "Tìm kiếm", "Tồn kho tối thiểu"...) */
-            label {
-                color: white !important;
-            }
-            </style>
-        """, unsafe_allow_html=True)
+    with col2:
+        st.markdown(styled_card("Tổng số lượng tồn kho hiện tại", f"{total_stock} cái", ""), unsafe_allow_html=True)
+
+    with col3:
+        st.markdown(styled_card("Tổng giá trị tồn kho", f"${total_value:,.0f}", "") , unsafe_allow_html=True)
 
-        col1, col2, col3, col4 = st.columns(4)
-
-        with col1:
-            keyword = st.text_input("Tìm kiếm", placeholder="Nhập mã, mô tả, cost center...")
-
-        with col2:
-            min_stock_str = st.text_input("Tồn kho tối thiểu", placeholder="VD: 0")
-
-        with col3:
-            max_stock_str = st.text_input("Tồn kho tối đa", placeholder="VD: 100000")
-
-        with col4:
-            machine_types = df_stock['machine_type'].dropna().unique()
-            machine_types = ['Tất cả'] + sorted(machine_types.tolist())
-            selected_machine = st.selectbox("Loại máy", machine_types)
-
-        # --- Chuyển đổi kiểu số ---
-        try:
-            min_stock = int(min_stock_str) if min_stock_str else 0
-        except ValueError:
-            min_stock = 0
-            st.warning("⚠️ Tồn kho tối thiểu không hợp lệ.")
-
-        try:
-            max_stock = int(max_stock_str) if max_stock_str else 100000
-        except ValueError:
-            max_stock = 100000
-            st.warning("⚠️ Tồn kho tối đa không hợp lệ.")
-
-        # --- Lọc dữ liệu ---
-        df_filtered = df_stock.copy()
-
-        if keyword.strip():
-            kw = keyword.strip().lower()
-            df_filtered = df_filtered[
-                df_filtered['material_no'].astype(str).str.lower().str.contains(kw, na=False) |
-                df_filtered['part_no'].astype(str).str.lower().str.contains(kw, na=False) |
-                df_filtered['description'].astype(str).str.lower().str.contains(kw, na=False) |
-                df_filtered['bin'].astype(str).str.lower().str.contains(kw, na=False) |
-                df_filtered['cost_center'].astype(str).str.lower().str.contains(kw, na=False)
-            ]
-
-        df_filtered = df_filtered[
-            (df_filtered['stock'] >= min_stock) & (df_filtered['stock'] <= max_stock)
-        ]
-
-        if selected_machine != 'Tất cả':
-            df_filtered = df_filtered[df_filtered['machine_type'] == selected_machine]
-
-        # --- Tính toán thống kê ---
-        total_stock = df_filtered['stock'].sum()
-        total_value = (df_filtered['stock'] * df_filtered['price']).sum()
-        low_stock_items = df_stock[df_stock['stock'] < df_stock['safety_stock']]
-        total_items = len(df_filtered)
-        machine_count = df_filtered['machine_type'].nunique()
-        try:
-            max_stock_item = df_filtered.loc[df_filtered['stock'].idxmax()]['material_no']
-        except:
-            max_stock_item = "N/A"
-
-        # --- Hiển thị thẻ thông tin (6 ô) ---
-
-        col1, col2, col3, col4 = st.columns(4)
-
-
-        def styled_card(title, value, icon="📦", color="#83c5be"):
-            return f"""
-                <div style="
-                    background-color:{color};
-                    color:white;
-                    padding:15px;
-                    border-radius:12px;
-                    text-align:center;
-                    max-width:220px;
-                    margin:0 auto;
-                    box-shadow: 2px 2px 8px rgba(0,0,0,0.2);
-                ">
-                    <div style="font-size:14px;">{icon} <b>{title}</b></div>
-                    <div style="font-size:22px; font-weight:bold;">{value}</div>
-                </div>
-            """
-
-        with col1:
-            st.markdown(styled_card("Số lượng vật tư", f"{total_items} loại", ""), unsafe_allow_html=True)
-
-        with col2:
-            st.markdown(styled_card("Tổng số lượng tồn kho hiện tại", f"{total_stock} cái", ""), unsafe_allow_html=True)
-
-        with col3:
-            st.markdown(styled_card("Tổng giá trị tồn kho", f"${total_value:,.0f}", "") , unsafe_allow_html=True)
-
-        with col4:
-            st.markdown(styled_card("Số mã vật tư dưới mức an toàn", len(low_stock_items), "", "#83c5be"), unsafe_allow_html=True)
-
-        
-
-
-        
+    with col4:
+        st.markdown(styled_card("Số mã vật tư dưới mức an toàn", low_stock_count, "", "#83c5be"), unsafe_allow_html=True)
 
     st.markdown("<div style='margin-top:30px'></div>", unsafe_allow_html=True)  # khoảng cách 30px
- 
 
+    # ==== PHÂN TRANG VÀ SẮP XẾP ====
+    col_size, col_sort, col_dir, col_page = st.columns(4)
 
-    # Lọc dữ liệu
-    df_filtered = df_stock.copy()
+    with col_size:
+        page_size = st.selectbox("Số dòng mỗi trang", PAGE_SIZES, index=1, key="stock_page_size")
 
-    if keyword.strip():
-        kw = keyword.strip().lower()
-        df_filtered = df_filtered[
-            df_filtered['material_no'].astype(str).str.lower().str.contains(kw, na=False) |
-            df_filtered['part_no'].astype(str).str.lower().str.contains(kw, na=False) |
-            df_filtered['description'].astype(str).str.lower().str.contains(kw, na=False) |
-            df_filtered['bin'].astype(str).str.lower().str.contains(kw, na=False) |
-            df_filtered['cost_center'].astype(str).str.lower().str.contains(kw, na=False)
-        ]
+    with col_sort:
+        sort_col = st.selectbox("Sắp xếp theo", list(SORT_COLUMNS.keys()), key="stock_sort_col")
 
-    df_filtered = df_filtered[
-        (df_filtered['stock'] >= min_stock) & (df_filtered['stock'] <= max_stock)
-    ]
+    with col_dir:
+        sort_dir = st.selectbox("Thứ tự", ["Tăng dần", "Giảm dần"], key="stock_sort_dir")
 
-    if selected_machine != 'Tất cả':
-        df_filtered = df_filtered[df_filtered['machine_type'] == selected_machine]
+    page_count = max(1, -(-total_items // page_size))
+    with col_page:
+        page = st.number_input(f"Trang (1 - {page_count})", min_value=1, max_value=page_count, value=1, step=1, key="stock_page")
+    page = min(int(page), page_count)
 
-# ==== LỌC DANH SÁCH MÃ THIẾU TỪ df_filtered ====
-    low_stock_filtered = df_filtered[df_filtered['stock'] < df_filtered['safety_stock']]
+    df_filtered = fetch_stock_page(engine, where, params, sort_col, sort_dir == "Tăng dần", page_size, page)
 
     # ==== CẤU HÌNH BẢNG AGGRID ====
+    # Import tại chỗ dùng để không làm chậm lúc khởi động
+    from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
+    from st_aggrid.shared import JsCode
+
     gb = GridOptionsBuilder.from_dataframe(df_filtered)
 
     gb.configure_column("image_url", hide=True)
@@ -190,7 +243,7 @@ def show_view_stock():
     gb.configure_column("storage_days", hide=True)
 
     gb.configure_default_column(
-        filter=False, sortable=True, editable=False, resizable=True,
+        filter=False, sortable=False, editable=False, resizable=True,
         cellStyle=JsCode(""" 
             function(params) { 
                 return { 
@@ -221,17 +274,19 @@ def show_view_stock():
     )
 
     # ==== HIỂN THỊ CẢNH BÁO VÀ BẢNG MÃ THIẾU ====
-    if not low_stock_filtered.empty:
+    low_stock_filtered_count = int(totals["low_stock_filtered"])
+    if low_stock_filtered_count > 0:
         st.markdown(
             f"""
             <div style='background-color: #ff4d4d; padding: 20px; font-size: 20px;
                         color: white; font-weight: bold; text-align: center; border-radius: 10px;'>
-                ⚠️ Cảnh báo! Có {len(low_stock_filtered)} vật tư có tồn kho thấp hơn mức an toàn! Kiểm tra và bổ sung ngay!
+                ⚠️ Cảnh báo! Có {low_stock_filtered_count} vật tư có tồn kho thấp hơn mức an toàn! Kiểm tra và bổ sung ngay!
             </div>
             """,
             unsafe_allow_html=True
         )
         with st.expander("Xem chi tiết mã thiếu"):
+            low_stock_filtered = fetch_stock_rows(engine, where, params, "sp.stock < sp.safety_stock")
             st.dataframe(
                 low_stock_filtered[[
                     'material_no', 'part_no', 'description', 'stock', 'safety_stock',
@@ -328,11 +383,8 @@ def show_view_stock():
         # Hiển thị bảng theo dạng dọc
         st.markdown(detail_df.to_html(escape=False, index=False), unsafe_allow_html=True)
 
-    # Nút tải Excel
-    if not df_filtered.empty:
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            df_filtered.to_excel(writer, index=False, sheet_name='Stock')
+    # Nút tải Excel (toàn bộ dòng thỏa bộ lọc, chỉ tạo khi người dùng yêu cầu)
+    if total_items > 0:
         st.markdown("""
         <style>
         div.stDownloadButton > button:first-child {
@@ -346,11 +398,14 @@ def show_view_stock():
         }
         </style>
         """, unsafe_allow_html=True)
-        st.download_button(
-            label="📥 Download Excel",
-            data=excel_buffer.getvalue(),
+        excel_download(
+            engine,
+            "stock_view",
+            {"where": where, "params": params},
+            ["spare_parts", "machine_type"],
+            lambda: fetch_stock_rows(engine, where, params),
             file_name="stock_view.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            sheet_name="Stock",
         )
     else:
         st.warning("⚠️ Không tìm thấy kết quả phù hợp.")
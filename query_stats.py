@@ -0,0 +1,191 @@
+# query_stats.py
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+# --- Cấu hình (biến môi trường) ---
+# DB_QUERY_STATS=0 để tắt; SLOW_QUERY_MS: ngưỡng ghi log (ms); SLOW_QUERY_LOG: đường dẫn file log
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(REPO_ROOT, "pages")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", os.path.join(REPO_ROOT, "slow_queries.log"))
+
+_local = threading.local()
+_totals = {"queries": 0, "rows": 0, "seconds": 0.0}
+_totals_lock = threading.Lock()
+
+_slow_logger = None
+_slow_logger_lock = threading.Lock()
+
+
+def enabled():
+    return os.environ.get("DB_QUERY_STATS", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _get_slow_logger():
+    global _slow_logger
+    if _slow_logger is None:
+        with _slow_logger_lock:
+            if _slow_logger is None:
+                logger = logging.getLogger("warehouse.slow_queries")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                handler = logging.FileHandler(SLOW_QUERY_LOG, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                logger.addHandler(handler)
+                _slow_logger = logger
+    return _slow_logger
+
+
+def _caller():
+    # Hàm của trang đang chạy truy vấn; nếu không có thì hàm đầu tiên trong mã của repo
+    frame = sys._getframe(2)
+    first_repo_frame = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PAGES_DIR):
+            return f"pages.{os.path.splitext(os.path.basename(filename))[0]}.{frame.f_code.co_name}"
+        if first_repo_frame is None and filename.startswith(REPO_ROOT) and filename != __file__:
+            first_repo_frame = frame
+        frame = frame.f_back
+    if first_repo_frame is None:
+        return "?"
+    module = os.path.splitext(os.path.basename(first_repo_frame.f_code.co_filename))[0]
+    return f"{module}.{first_repo_frame.f_code.co_name}"
+
+
+def _normalize_statement(statement):
+    return re.sub(r"\s+", " ", statement).strip()
+
+
+def _add_rows(record, count):
+    record["rows"] += count
+    with _totals_lock:
+        _totals["rows"] += count
+
+
+def _finish(record):
+    with _totals_lock:
+        _totals["seconds"] += record["seconds"]
+    if record["seconds"] * 1000 >= SLOW_QUERY_MS:
+        _get_slow_logger().info(
+            "%.0fms rows=%d caller=%s %s",
+            record["seconds"] * 1000, record["rows"], record["caller"], record["statement"][:2000],
+        )
+
+
+class _CountingCursor:
+    # Bọc con trỏ DBAPI: cộng thời gian và số dòng đọc ra vào bản ghi của truy vấn
+    def __init__(self, cursor, record):
+        self._cursor = cursor
+        self._record = record
+        self._finished = False
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        self._record["seconds"] += time.perf_counter() - started
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None:
+            _add_rows(self._record, 1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._fetch(self._cursor.fetchmany, *args)
+        _add_rows(self._record, len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        _add_rows(self._record, len(rows))
+        return rows
+
+    def close(self):
+        if not self._finished:
+            self._finished = True
+            _finish(self._record)
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def install(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        record = {
+            "statement": _normalize_statement(statement),
+            "seconds": elapsed,
+            "rows": 0,
+            "caller": _caller(),
+        }
+        with _totals_lock:
+            _totals["queries"] += 1
+        records = getattr(_local, "records", None)
+        if records is not None:
+            records.append(record)
+
+        if context is not None and cursor.description is not None:
+            # Câu SELECT: số dòng và thời gian đọc được tính khi con trỏ được đọc/đóng
+            context.cursor = _CountingCursor(cursor, record)
+        else:
+            _add_rows(record, max(cursor.rowcount, 0))
+            _finish(record)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+# ---------------------- THỐNG KÊ THEO LƯỢT CHẠY (RERUN) ------------------------
+# Mỗi phiên Streamlit chạy script trong luồng riêng nên dữ liệu được giữ theo luồng
+
+def start_rerun():
+    _local.records = []
+    _local.started = time.perf_counter()
+
+
+def rerun_summary():
+    records = getattr(_local, "records", [])
+    elapsed = time.perf_counter() - getattr(_local, "started", time.perf_counter())
+    db_seconds = sum(r["seconds"] for r in records)
+    return {
+        "elapsed": elapsed,
+        "db_seconds": db_seconds,
+        "queries": len(records),
+        "rows": sum(r["rows"] for r in records),
+        "records": records,
+    }
+
+
+def top_statements(records, limit=10):
+    # Gộp theo (hàm gọi, câu lệnh), sắp xếp theo tổng thời gian
+    grouped = {}
+    for record in records:
+        key = (record["caller"], record["statement"])
+        entry = grouped.setdefault(key, {"caller": key[0], "statement": key[1], "calls": 0, "ms": 0.0, "rows": 0})
+        entry["calls"] += 1
+        entry["ms"] += record["seconds"] * 1000
+        entry["rows"] += record["rows"]
+    return sorted(grouped.values(), key=lambda e: e["ms"], reverse=True)[:limit]
+
+
+def totals():
+    # Số liệu cộng dồn cho cả tiến trình (dùng trong bench)
+    with _totals_lock:
+        return dict(_totals)
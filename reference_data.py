@@ -0,0 +1,106 @@
+# reference_data.py
+# Cache dữ liệu danh mục dùng chung cho mọi phiên của tiến trình (chỉ đọc).
+# Mỗi mục được gắn với phiên bản bảng trong table_versions lúc tải; bảng đổi (kể cả do tiến trình
+# khác ghi) thì lần đọc sau sẽ tải lại. DataFrame trả về được chia sẻ giữa các phiên: muốn sửa thì .copy() trước.
+import threading
+from collections import defaultdict
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from table_versions import current_versions
+
+REFERENCE_QUERIES = {
+    "employees": """
+        SELECT amann_id, name, title, level, active, birthday, start_date, address, phone_number, email, gender
+        FROM employees
+    """,
+    "machine_type": "SELECT id, machine FROM machine_type",
+    "group_mc": "SELECT id, mc_name FROM group_mc",
+    "machine": "SELECT id, name, group_mc_id, dept_id FROM machine",
+    "machine_pos": "SELECT id, mc_id, mc_pos FROM machine_pos",
+    "spare_parts": """
+        SELECT material_no, description, part_no, machine_type_id, bin, cost_center, price, stock,
+               safety_stock, safety_stock_check, image_url, import_date, export_date, version
+        FROM spare_parts
+    """,
+}
+
+_tables = {}
+_derived = {}
+_lock = threading.Lock()
+_load_locks = defaultdict(threading.Lock)
+
+
+def _cached(store, key, version):
+    with _lock:
+        entry = store.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    return None
+
+
+def _load(store, key, version, build):
+    value = _cached(store, key, version)
+    if value is not None:
+        return value
+    # Mỗi khóa chỉ một luồng tải, các phiên khác chờ và dùng lại kết quả
+    with _load_locks[key]:
+        value = _cached(store, key, version)
+        if value is None:
+            value = build()
+            with _lock:
+                store[key] = (version, value)
+    return value
+
+
+def get_table(engine, table):
+    def build():
+        with engine.connect() as conn:
+            return pd.read_sql(text(REFERENCE_QUERIES[table]), conn)
+
+    return _load(_tables, table, current_versions(engine).get(table, 0), build)
+
+
+def get_derived(engine, name, tables, build):
+    # Dữ liệu dựng từ các bảng danh mục (ghép bảng, cột tìm kiếm...), dựng lại khi một trong các bảng đổi
+    versions = current_versions(engine)
+    return _load(_derived, name, tuple(versions.get(table, 0) for table in tables), build)
+
+
+def discard_table(table):
+    # Bỏ bản cache của một bảng: lần đọc sau tải lại cả bảng
+    with _lock:
+        _tables.pop(table, None)
+
+
+def refresh_rows(engine, table, key_column, keys, version):
+    # Đọc lại chỉ các dòng vừa sửa và thay vào bản cache. version là phiên bản bảng do chính giao dịch
+    # vừa commit tạo ra (bump trả về qua read_version): chỉ vá khi bản cache là phiên bản ngay trước đó,
+    # nếu không (có thay đổi khác xen vào) thì để lần đọc sau tải lại cả bảng.
+    # Bản cache cũ vẫn có thể đang được phiên khác đọc nên thay bằng bản sao, không sửa tại chỗ.
+    keys = list(keys)
+    if not keys:
+        return
+    stmt = text(f"SELECT * FROM ({REFERENCE_QUERIES[table]}) t WHERE {key_column} IN :keys")
+    stmt = stmt.bindparams(bindparam("keys", expanding=True))
+    with _load_locks[table]:
+        with _lock:
+            entry = _tables.get(table)
+        if entry is None or entry[0] != version - 1:
+            return
+        with engine.connect() as conn:
+            fresh = pd.read_sql(stmt, conn, params={"keys": keys}).set_index(key_column, drop=False)
+
+        df = entry[1]
+        # Dòng đã bị xóa thì bỏ, dòng còn lại giữ nguyên vị trí, dòng mới thêm vào cuối
+        df = df[df[key_column].isin(fresh.index) | ~df[key_column].isin(keys)].copy()
+        mask = df[key_column].isin(fresh.index)
+        for col in df.columns:
+            df.loc[mask, col] = fresh.loc[df.loc[mask, key_column], col].to_numpy()
+        added = fresh[~fresh.index.isin(df[key_column])]
+        if len(added):
+            df = pd.concat([df, added.reset_index(drop=True)], ignore_index=True)
+        with _lock:
+            if _tables.get(table) is entry:
+                _tables[table] = (version, df)
@@ -0,0 +1,164 @@
+# search_index.py
+import threading
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from table_versions import version
+
+# Ký tự phân tách giữa các trường, không bao giờ xuất hiện trong từ khóa tìm kiếm
+FIELD_SEPARATOR = "\x1f"
+
+
+def normalize_text(value):
+    # Bỏ dấu tiếng Việt, chữ thường, gộp khoảng trắng: "Vòng  Bi" -> "vong bi"
+    if value is None:
+        return ""
+    value = str(value).lower().replace("đ", "d")
+    value = unicodedata.normalize("NFD", value)
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return " ".join(value.split())
+
+
+_normalize_cached = lru_cache(maxsize=200_000)(normalize_text)
+
+
+def normalize_series(series):
+    # Mỗi giá trị chỉ chuẩn hóa một lần, các lần sau lấy từ cache
+    return series.map(lambda v: _normalize_cached(v) if isinstance(v, str) else ("" if pd.isna(v) else normalize_text(v)))
+
+
+def add_search_column(df, columns, name="search_key"):
+    # Thêm cột chuẩn hóa ghép từ các cột cần tìm kiếm
+    key = normalize_series(df[columns[0]])
+    for col in columns[1:]:
+        key = key + FIELD_SEPARATOR + normalize_series(df[col])
+    df[name] = key
+    return df
+
+
+def match_keyword(df, keyword, name="search_key"):
+    # Mặt nạ lọc các dòng chứa từ khóa (không phân biệt dấu, hoa thường)
+    kw = normalize_text(keyword)
+    if not kw:
+        return pd.Series(True, index=df.index)
+    return df[name].str.contains(kw, regex=False, na=False)
+
+
+class SearchIndex:
+    # Chỉ mục n-gram: n-gram -> tập id dòng; tìm kiếm là phép giao các tập này
+
+    def __init__(self, ngram=3):
+        self.ngram = ngram
+        self._docs = {}
+        self._postings = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def _grams(self, value):
+        n = self.ngram
+        return {value[i:i + n] for i in range(len(value) - n + 1)}
+
+    def _remove_locked(self, doc_id):
+        old = self._docs.pop(doc_id, None)
+        if old is None:
+            return
+        for gram in self._grams(old):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def add(self, doc_id, *fields):
+        doc = FIELD_SEPARATOR.join(normalize_text(f) for f in fields)
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._docs[doc_id] = doc
+            for gram in self._grams(doc):
+                self._postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def search(self, keyword):
+        kw = normalize_text(keyword)
+        if not kw:
+            return set(self._docs)
+
+        with self._lock:
+            grams = self._grams(kw)
+            if not grams:
+                # Từ khóa ngắn hơn n-gram: quét chuỗi đã chuẩn hóa
+                return {doc_id for doc_id, doc in self._docs.items() if kw in doc}
+
+            postings = sorted((self._postings.get(g, set()) for g in grams), key=len)
+            candidates = set(postings[0])
+            for ids in postings[1:]:
+                candidates &= ids
+                if not candidates:
+                    return set()
+            # Loại bỏ kết quả trùng n-gram nhưng không chứa nguyên chuỗi
+            return {doc_id for doc_id in candidates if kw in self._docs[doc_id]}
+
+    def __len__(self):
+        return len(self._docs)
+
+
+# ---------------------- CHỈ MỤC PHỤ TÙNG DÙNG CHUNG ------------------------
+
+PART_SEARCH_FIELDS = ("material_no", "part_no", "description", "bin", "cost_center")
+
+# Phiên bản riêng cho các cột tìm kiếm của spare_parts: nhập/xuất kho chỉ đổi tồn kho nên không
+# làm chỉ mục phải dựng lại; thêm hoặc sửa phụ tùng thì bump thêm tên này
+PARTS_CATALOG_VERSION = "spare_parts_catalog"
+
+_parts_index = None
+_parts_index_version = None
+_parts_index_lock = threading.Lock()
+
+
+def _load_part_rows(conn, material_nos=None):
+    query = f"SELECT {', '.join(PART_SEARCH_FIELDS)} FROM spare_parts"
+    if material_nos is None:
+        return conn.execute(text(query)).fetchall()
+    stmt = text(query + " WHERE material_no IN :ids").bindparams(bindparam("ids", expanding=True))
+    return conn.execute(stmt, {"ids": list(material_nos)}).fetchall()
+
+
+def get_parts_index(engine):
+    # Dựng chỉ mục một lần cho cả tiến trình; dựng lại khi danh mục bị sửa từ tiến trình khác
+    global _parts_index, _parts_index_version
+    current = version(engine, PARTS_CATALOG_VERSION)
+    if _parts_index is None or _parts_index_version != current:
+        with _parts_index_lock:
+            if _parts_index is None or _parts_index_version != current:
+                index = SearchIndex()
+                with engine.connect() as conn:
+                    for row in _load_part_rows(conn):
+                        index.add(row[0], *row)
+                _parts_index = index
+                _parts_index_version = current
+    return _parts_index
+
+
+def refresh_parts_index(engine, material_nos):
+    # Cập nhật các phụ tùng vừa thay đổi (gọi sau khi giao dịch đã commit)
+    global _parts_index_version
+    if _parts_index is None or not material_nos:
+        return
+    material_nos = set(material_nos)
+    with engine.connect() as conn:
+        rows = _load_part_rows(conn, material_nos)
+    for row in rows:
+        _parts_index.add(row[0], *row)
+    for missing in material_nos - {row[0] for row in rows}:
+        _parts_index.remove(missing)
+    # Chỉ có lần ghi vừa rồi thì giữ chỉ mục; có thêm thay đổi khác thì lần sau dựng lại
+    current = version(engine, PARTS_CATALOG_VERSION)
+    with _parts_index_lock:
+        if _parts_index_version is not None and current == _parts_index_version + 1:
+            _parts_index_version = current
@@ -0,0 +1,240 @@
+# stock_ledger.py
+# Sổ cái tồn kho chỉ ghi thêm (append-only) và ảnh chụp tồn kho đầu mỗi tháng.
+#   stock_ledger:   mỗi lượt nhập/xuất/điều chỉnh là một dòng, không bao giờ sửa hay gộp;
+#                   delta là số lượng làm thay đổi tồn kho (xuất FOC có delta = 0)
+#   stock_snapshot: tồn kho của từng phụ tùng tại đầu tháng `month` (tổng delta có moved_at < month)
+# Tồn kho tại một thời điểm = ảnh chụp gần nhất trước đó + tổng delta từ đầu tháng đó đến thời điểm cần tính,
+# nên chi phí không phụ thuộc độ dài lịch sử.
+#   python stock_ledger.py snapshot            -> tạo các ảnh chụp tháng còn thiếu (chạy định kỳ, vd đầu tháng)
+#   python stock_ledger.py as-of 2026-03-31    -> in tồn kho cuối ngày của mọi phụ tùng
+import argparse
+from datetime import date, datetime, time
+
+import pandas as pd
+from sqlalchemy import text
+
+STOCK_LEDGER_DDL = """
+    CREATE TABLE IF NOT EXISTS stock_ledger (
+        id {id},
+        part_id VARCHAR(50) NOT NULL,
+        moved_at DATETIME NOT NULL,
+        kind VARCHAR(10) NOT NULL,
+        quantity INT NOT NULL,
+        delta INT NOT NULL,
+        empl_id VARCHAR(50) NULL,
+        mc_pos VARCHAR(50) NULL,
+        reason VARCHAR(255) NULL
+    )
+"""
+
+STOCK_SNAPSHOT_DDL = """
+    CREATE TABLE IF NOT EXISTS stock_snapshot (
+        month DATE NOT NULL,
+        part_id VARCHAR(50) NOT NULL,
+        stock BIGINT NOT NULL,
+        PRIMARY KEY (month, part_id)
+    )
+"""
+
+
+def _is_mysql(conn):
+    return conn.dialect.name == "mysql"
+
+
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def _as_of_moment(as_of):
+    # Ngày -> cuối ngày đó; datetime giữ nguyên (tính cả các dòng đúng thời điểm này)
+    if isinstance(as_of, str):
+        as_of = datetime.fromisoformat(as_of) if " " in as_of or "T" in as_of else date.fromisoformat(as_of)
+    if not isinstance(as_of, datetime):
+        as_of = datetime.combine(as_of, time.max)
+    return as_of
+
+
+def ensure_stock_ledger(conn):
+    id_column = "INT AUTO_INCREMENT PRIMARY KEY" if _is_mysql(conn) else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    conn.execute(text(STOCK_LEDGER_DDL.format(id=id_column)))
+    conn.execute(text(STOCK_SNAPSHOT_DDL))
+
+
+# ---------------------- GHI SỔ CÁI ------------------------
+
+def append_ledger(conn, entries):
+    # Ghi cùng giao dịch với thay đổi tồn kho; entries: danh sách dict
+    # part_id, moved_at, kind ('import' | 'export' | 'adjust'), quantity, delta, empl_id, mc_pos, reason
+    if not entries:
+        return
+    conn.execute(text("""
+        INSERT INTO stock_ledger (part_id, moved_at, kind, quantity, delta, empl_id, mc_pos, reason)
+        VALUES (:part_id, :moved_at, :kind, :quantity, :delta, :empl_id, :mc_pos, :reason)
+    """), [
+        {"empl_id": None, "mc_pos": None, "reason": None, **entry}
+        for entry in entries
+    ])
+
+    # Dòng ghi lùi ngày (trước tháng hiện tại) làm sai các ảnh chụp sau nó: xóa để lần chụp sau tính lại
+    earliest = min(_as_of_moment(entry["moved_at"]) for entry in entries)
+    if earliest < datetime.combine(_month_start(datetime.now()), time.min):
+        conn.execute(text("DELETE FROM stock_snapshot WHERE month > :moved_at"), {"moved_at": earliest})
+
+
+def backfill_ledger(engine):
+    # Dựng sổ cái từ import_export cho CSDL cũ (bỏ qua nếu sổ cái đã có dữ liệu).
+    # import_export đã bị gộp dòng nên lịch sử chỉ gần đúng; một dòng 'adjust' tại thời điểm dựng
+    # đưa tổng sổ cái của mỗi phụ tùng về đúng spare_parts.stock hiện tại.
+    with engine.begin() as conn:
+        ensure_stock_ledger(conn)
+        if conn.execute(text("SELECT COUNT(*) FROM stock_ledger")).scalar():
+            return 0
+        result = conn.execute(text("""
+            INSERT INTO stock_ledger (part_id, moved_at, kind, quantity, delta, empl_id, mc_pos, reason)
+            SELECT part_id, date,
+                   CASE WHEN im_ex_flag = 1 THEN 'import' ELSE 'export' END,
+                   quantity,
+                   CASE WHEN im_ex_flag = 1 THEN quantity ELSE -quantity END,
+                   empl_id,
+                   CASE WHEN im_ex_flag = 1 THEN NULL ELSE mc_pos_id END,
+                   reason
+            FROM import_export
+            WHERE date IS NOT NULL AND part_id IS NOT NULL
+            ORDER BY date, id
+        """))
+        conn.execute(text("""
+            INSERT INTO stock_ledger (part_id, moved_at, kind, quantity, delta, reason)
+            SELECT sp.material_no, :now, 'adjust', COALESCE(sp.stock, 0) - COALESCE(l.total, 0),
+                   COALESCE(sp.stock, 0) - COALESCE(l.total, 0), 'Đối chiếu khi dựng sổ cái'
+            FROM spare_parts sp
+            LEFT JOIN (SELECT part_id, SUM(delta) AS total FROM stock_ledger GROUP BY part_id) l
+                ON l.part_id = sp.material_no
+            WHERE COALESCE(sp.stock, 0) <> COALESCE(l.total, 0)
+        """), {"now": datetime.now()})
+    return result.rowcount
+
+
+# ---------------------- ẢNH CHỤP THEO THÁNG ------------------------
+
+def build_snapshots(engine, through=None):
+    # Tạo lần lượt các ảnh chụp còn thiếu đến đầu tháng `through` (mặc định tháng hiện tại);
+    # mỗi tháng dựng từ ảnh chụp tháng trước cộng delta trong tháng, không quét lại cả lịch sử
+    through = _month_start(through or datetime.now())
+    created = []
+    with engine.begin() as conn:
+        ensure_stock_ledger(conn)
+        last = conn.execute(text("SELECT MAX(month) FROM stock_snapshot")).scalar()
+        if last is not None:
+            last = pd.Timestamp(last).date()
+            month = _next_month(last)
+        else:
+            first = conn.execute(text("SELECT MIN(moved_at) FROM stock_ledger")).scalar()
+            if first is None:
+                return created
+            month = _next_month(_month_start(pd.Timestamp(first)))
+
+        while month <= through:
+            if last is None:
+                conn.execute(text("""
+                    INSERT INTO stock_snapshot (month, part_id, stock)
+                    SELECT :month, part_id, SUM(delta) FROM stock_ledger
+                    WHERE moved_at < :month
+                    GROUP BY part_id
+                """), {"month": month})
+            else:
+                conn.execute(text("""
+                    INSERT INTO stock_snapshot (month, part_id, stock)
+                    SELECT :month, part_id, SUM(stock) FROM (
+                        SELECT part_id, stock FROM stock_snapshot WHERE month = :prev
+                        UNION ALL
+                        SELECT part_id, SUM(delta) FROM stock_ledger
+                        WHERE moved_at >= :prev AND moved_at < :month
+                        GROUP BY part_id
+                    ) t
+                    GROUP BY part_id
+                """), {"month": month, "prev": last})
+            created.append(month)
+            last = month
+            month = _next_month(month)
+    return created
+
+
+# ---------------------- TỒN KHO TẠI MỘT THỜI ĐIỂM ------------------------
+
+def _nearest_snapshot(conn, moment):
+    month = conn.execute(
+        text("SELECT MAX(month) FROM stock_snapshot WHERE month <= :moment"), {"moment": moment.date()}
+    ).scalar()
+    return pd.Timestamp(month).date() if month is not None else None
+
+
+def stock_as_of(engine, part_id, as_of):
+    moment = _as_of_moment(as_of)
+    with engine.connect() as conn:
+        month = _nearest_snapshot(conn, moment)
+        if month is None:
+            return int(conn.execute(text("""
+                SELECT COALESCE(SUM(delta), 0) FROM stock_ledger
+                WHERE part_id = :part_id AND moved_at <= :moment
+            """), {"part_id": part_id, "moment": moment}).scalar())
+        return int(conn.execute(text("""
+            SELECT
+                COALESCE((SELECT stock FROM stock_snapshot WHERE month = :month AND part_id = :part_id), 0)
+                + COALESCE((SELECT SUM(delta) FROM stock_ledger
+                            WHERE part_id = :part_id AND moved_at >= :month AND moved_at <= :moment), 0)
+        """), {"part_id": part_id, "month": month, "moment": moment}).scalar())
+
+
+def stock_as_of_all(engine, as_of):
+    # DataFrame (part_id, stock) cho mọi phụ tùng có trong sổ cái
+    moment = _as_of_moment(as_of)
+    with engine.connect() as conn:
+        month = _nearest_snapshot(conn, moment)
+        if month is None:
+            df = pd.read_sql(text("""
+                SELECT part_id, SUM(delta) AS stock FROM stock_ledger
+                WHERE moved_at <= :moment
+                GROUP BY part_id
+            """), conn, params={"moment": moment})
+        else:
+            df = pd.read_sql(text("""
+                SELECT part_id, SUM(stock) AS stock FROM (
+                    SELECT part_id, stock FROM stock_snapshot WHERE month = :month
+                    UNION ALL
+                    SELECT part_id, SUM(delta) FROM stock_ledger
+                    WHERE moved_at >= :month AND moved_at <= :moment
+                    GROUP BY part_id
+                ) t
+                GROUP BY part_id
+            """), conn, params={"month": month, "moment": moment})
+    df["stock"] = df["stock"].fillna(0).astype(int)
+    return df.sort_values("part_id").reset_index(drop=True)
+
+
+def main():
+    from database import get_engine
+
+    parser = argparse.ArgumentParser(description="Sổ cái tồn kho")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("snapshot", help="Tạo các ảnh chụp tồn kho đầu tháng còn thiếu")
+    as_of_parser = sub.add_parser("as-of", help="Tồn kho tại một ngày (cuối ngày) hoặc thời điểm")
+    as_of_parser.add_argument("when")
+    as_of_parser.add_argument("--part", default=None)
+    args = parser.parse_args()
+
+    engine = get_engine()
+    if args.command == "snapshot":
+        created = build_snapshots(engine)
+        print(f"Đã tạo {len(created)} ảnh chụp" + (f" ({created[0]} .. {created[-1]})" if created else ""))
+    elif args.part:
+        print(stock_as_of(engine, args.part, args.when))
+    else:
+        print(stock_as_of_all(engine, args.when).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,594 @@
+# stock_movements.py
+import argparse
+import math
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, inspect, text
+
+from database import get_engine
+from search_index import PARTS_CATALOG_VERSION
+from stock_ledger import append_ledger
+from table_versions import bump, read_version
+
+# Các bảng mà một lượt nhập/xuất kho ghi vào (dùng cho bump() ở cuối giao dịch)
+MOVEMENT_TABLES = ("import_export", "movement_monthly", "spare_parts")
+
+# spare_parts.version: phiên bản dòng, tăng ở mọi câu ghi làm đổi cột hiển thị trên form sửa phụ tùng
+# (tồn kho, đơn giá, thông tin danh mục); xuất FOC chỉ đổi export_date nên không tăng.
+# update_part() chỉ ghi khi phiên bản chưa đổi kể từ lúc mở form.
+
+# ---------------------- BẢNG TỔNG HỢP THEO THÁNG ------------------------
+# movement_monthly: mỗi dòng là tổng nhập (im_ex_flag = 1) hoặc xuất (im_ex_flag = 0)
+# của một phụ tùng trong một tháng. Được cập nhật cùng giao dịch với import_export.
+
+MOVEMENT_MONTHLY_DDL = """
+    CREATE TABLE IF NOT EXISTS movement_monthly (
+        month DATE NOT NULL,
+        part_id VARCHAR(50) NOT NULL,
+        im_ex_flag SMALLINT NOT NULL,
+        quantity BIGINT NOT NULL DEFAULT 0,
+        value DECIMAL(18, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (month, part_id, im_ex_flag)
+    )
+"""
+
+
+def month_start(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return date(value.year, value.month, 1)
+
+
+def _is_mysql(conn):
+    return conn.dialect.name == "mysql"
+
+
+def _upsert_clause(conn, conflict_columns, assignments):
+    # assignments: cột -> biểu thức, trong đó {new} là giá trị định chèn
+    if _is_mysql(conn):
+        sets = [f"{col} = {expr.format(new=f'VALUES({col})')}" for col, expr in assignments.items()]
+        return " ON DUPLICATE KEY UPDATE " + ", ".join(sets)
+    sets = [f"{col} = {expr.format(new=f'excluded.{col}')}" for col, expr in assignments.items()]
+    return f" ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET " + ", ".join(sets)
+
+
+def _month_expr(conn, column):
+    # Biểu thức SQL lấy ngày đầu tháng của một cột thời gian
+    if _is_mysql(conn):
+        return f"DATE_SUB(DATE({column}), INTERVAL DAYOFMONTH({column}) - 1 DAY)"
+    return f"date({column}, 'start of month')"
+
+
+def ensure_movement_monthly(conn):
+    conn.execute(text(MOVEMENT_MONTHLY_DDL))
+
+
+def record_movement(conn, part_id, im_ex_flag, quantity, moved_at):
+    record_movements(conn, [(part_id, im_ex_flag, quantity, moved_at)])
+
+
+def record_movements(conn, movements):
+    # Cộng dồn vào bucket (tháng, phụ tùng, loại). Giá trị tính theo đơn giá hiện tại của spare_parts cho cả nhập
+    # lẫn xuất, cùng quy tắc với rebuild_movement_monthly; đơn giá đổi thì revalue_movements tính lại các bucket.
+    # movements: danh sách (part_id, im_ex_flag, quantity, moved_at), ghi bằng executemany
+    upsert = _upsert_clause(conn, ("month", "part_id", "im_ex_flag"), {
+        "quantity": "quantity + {new}",
+        "value": "value + {new}",
+    })
+    conn.execute(text("""
+        INSERT INTO movement_monthly (month, part_id, im_ex_flag, quantity, value)
+        VALUES (:month, :part_id, :im_ex_flag, :quantity,
+                :quantity * COALESCE((SELECT price FROM spare_parts WHERE material_no = :part_id), 0))
+    """ + upsert), [
+        {
+            "month": month_start(moved_at),
+            "part_id": part_id,
+            "im_ex_flag": im_ex_flag,
+            "quantity": quantity,
+        }
+        for part_id, im_ex_flag, quantity, moved_at in movements
+    ])
+
+
+def revalue_movements(conn, part_ids):
+    # Gọi sau mọi câu ghi đổi spare_parts.price: tính lại giá trị mọi bucket của các phụ tùng theo đơn giá mới,
+    # để bảng tổng hợp luôn bằng kết quả rebuild_movement_monthly (dùng chỉ mục ix_movement_monthly_part)
+    if not part_ids:
+        return
+    conn.execute(text("""
+        UPDATE movement_monthly
+        SET value = quantity * COALESCE((SELECT price FROM spare_parts WHERE material_no = movement_monthly.part_id), 0)
+        WHERE part_id IN :part_ids
+    """).bindparams(bindparam("part_ids", expanding=True)), {"part_ids": sorted(set(part_ids))})
+
+
+# ---------------------- NHẬP KHO THEO BUCKET THÁNG ------------------------
+# Mỗi (phụ tùng, tháng) chỉ có một dòng nhập kho trong import_export, khóa bởi
+# cột import_month và chỉ mục duy nhất uq_import_export_bucket.
+
+def record_import(conn, part_id, quantity, empl_id, moved_at, reason="Nhập kho"):
+    record_imports(conn, [(part_id, quantity, None)], empl_id, moved_at, reason)
+
+
+def record_imports(conn, receipts, empl_id, moved_at, reason="Nhập kho"):
+    # Một câu lệnh INSERT ... ON DUPLICATE KEY UPDATE thay cho SELECT rồi UPDATE/INSERT
+    # receipts: danh sách (part_id, quantity, price), ghi bằng executemany; đơn giá do người gọi ghi vào
+    # spare_parts (receive_stock / apply_receipts), ở đây không dùng
+    upsert = _upsert_clause(conn, ("part_id", "import_month", "im_ex_flag"), {
+        "quantity": "quantity + {new}",
+        "date": "{new}",
+    })
+    conn.execute(text("""
+        INSERT INTO import_export (part_id, quantity, mc_pos_id, empl_id, date, reason, im_ex_flag, import_month)
+        VALUES (:part_id, :quantity, NULL, :empl_id, :date, :reason, 1, :import_month)
+    """ + upsert), [
+        {
+            "part_id": part_id,
+            "quantity": quantity,
+            "empl_id": empl_id,
+            "date": moved_at,
+            "reason": reason,
+            "import_month": month_start(moved_at),
+        }
+        for part_id, quantity, _ in receipts
+    ])
+    record_movements(conn, [
+        (part_id, 1, quantity, moved_at) for part_id, quantity, _ in receipts
+    ])
+    append_ledger(conn, [
+        {"part_id": part_id, "moved_at": moved_at, "kind": "import", "quantity": quantity, "delta": quantity,
+         "empl_id": empl_id, "reason": reason}
+        for part_id, quantity, _ in receipts
+    ])
+
+
+def receive_stock(conn, part_id, quantity, price, moved_at):
+    # Cộng tồn kho và cập nhật đơn giá; tạo dòng spare_parts nếu chưa có
+    # (dòng sổ cái do record_import đi kèm ghi)
+    upsert = _upsert_clause(conn, ("material_no",), {
+        "stock": "COALESCE(stock, 0) + {new}",
+        "price": "{new}",
+        "import_date": "{new}",
+        "version": "version + 1",
+    })
+    conn.execute(text("""
+        INSERT INTO spare_parts (material_no, stock, price, import_date)
+        VALUES (:part_id, :quantity, :price, :import_date)
+    """ + upsert), {
+        "part_id": part_id,
+        "quantity": quantity,
+        "price": price,
+        "import_date": moved_at,
+    })
+    revalue_movements(conn, [part_id])
+
+
+def adjust_stock(conn, part_id, new_stock, moved_at, empl_id=None, reason="Điều chỉnh tồn kho"):
+    # Đặt tồn kho về giá trị mới (sửa tay) và ghi chênh lệch vào sổ cái;
+    # khóa dòng trước khi đọc để không tính sai chênh lệch khi có lượt xuất/nhập đồng thời
+    lock = " FOR UPDATE" if _is_mysql(conn) else ""
+    old_stock = conn.execute(
+        text("SELECT stock FROM spare_parts WHERE material_no = :part_id" + lock), {"part_id": part_id}
+    ).fetchone()
+    if old_stock is None:
+        raise UnknownPart(part_id)
+    delta = new_stock - (old_stock[0] or 0)
+    if delta == 0:
+        return 0
+    conn.execute(
+        text("UPDATE spare_parts SET stock = :stock, version = version + 1 WHERE material_no = :part_id"),
+        {"stock": new_stock, "part_id": part_id},
+    )
+    append_ledger(conn, [{
+        "part_id": part_id, "moved_at": moved_at, "kind": "adjust", "quantity": delta, "delta": delta,
+        "empl_id": empl_id, "reason": reason,
+    }])
+    return delta
+
+
+def apply_receipts(engine, receipts, empl_id, moved_at=None, reason="Nhập kho từ file"):
+    # Nhập kho hàng loạt trong một giao dịch; receipts: danh sách (part_id, quantity, price),
+    # price = None thì giữ nguyên đơn giá hiện tại
+    if not receipts:
+        return
+    moved_at = moved_at or datetime.now()
+    with engine.begin() as conn:
+        conn.execute(text("""
+            UPDATE spare_parts
+            SET stock = COALESCE(stock, 0) + :quantity,
+                price = COALESCE(:price, price),
+                import_date = :import_date,
+                version = version + 1
+            WHERE material_no = :part_id
+        """), [
+            {"part_id": part_id, "quantity": quantity, "price": price, "import_date": moved_at}
+            for part_id, quantity, price in receipts
+        ])
+        record_imports(conn, receipts, empl_id, moved_at, reason)
+        revalue_movements(conn, [part_id for part_id, _, price in receipts if price is not None])
+        bump(conn, *MOVEMENT_TABLES)
+
+
+def migrate_import_buckets(engine):
+    # Thêm cột import_month, gộp các dòng nhập trùng tháng và tạo chỉ mục duy nhất
+    with engine.begin() as conn:
+        columns = {col["name"] for col in inspect(conn).get_columns("import_export")}
+        if "import_month" not in columns:
+            conn.execute(text("ALTER TABLE import_export ADD COLUMN import_month DATE NULL"))
+
+        conn.execute(text(f"""
+            UPDATE import_export
+            SET import_month = {_month_expr(conn, "date")}
+            WHERE im_ex_flag = 1 AND date IS NOT NULL
+        """))
+
+        duplicates = conn.execute(text("""
+            SELECT part_id, import_month
+            FROM import_export
+            WHERE im_ex_flag = 1 AND import_month IS NOT NULL
+            GROUP BY part_id, import_month
+            HAVING COUNT(*) > 1
+        """)).fetchall()
+
+        for part_id, import_month in duplicates:
+            rows = conn.execute(text("""
+                SELECT id, quantity FROM import_export
+                WHERE part_id = :part_id AND import_month = :import_month AND im_ex_flag = 1
+                ORDER BY date DESC, id DESC
+            """), {"part_id": part_id, "import_month": import_month}).fetchall()
+            keep_id = rows[0].id
+            conn.execute(text("UPDATE import_export SET quantity = :quantity WHERE id = :id"), {
+                "quantity": sum(row.quantity or 0 for row in rows),
+                "id": keep_id,
+            })
+            conn.execute(
+                text("DELETE FROM import_export WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                {"ids": [row.id for row in rows[1:]]},
+            )
+
+        indexes = {idx["name"] for idx in inspect(conn).get_indexes("import_export")}
+        if "uq_import_export_bucket" not in indexes:
+            conn.execute(text("""
+                CREATE UNIQUE INDEX uq_import_export_bucket
+                ON import_export (part_id, import_month, im_ex_flag)
+            """))
+    return len(duplicates)
+
+
+# ---------------------- XUẤT KHO ------------------------
+
+class StockError(Exception):
+    pass
+
+
+class UnknownPart(StockError):
+    def __init__(self, part_id):
+        super().__init__(f"Không tìm thấy phụ tùng {part_id} trong kho.")
+        self.part_id = part_id
+
+
+class UnknownMachinePosition(StockError):
+    def __init__(self, mc_pos_id):
+        super().__init__(f"Vị trí máy với ID {mc_pos_id} không tồn tại.")
+        self.mc_pos_id = mc_pos_id
+
+
+class InsufficientStock(StockError):
+    def __init__(self, part_id, requested, available):
+        super().__init__(f"Không đủ hàng trong kho cho {part_id}: cần {requested}, tồn kho hiện tại {available}.")
+        self.part_id = part_id
+        self.requested = requested
+        self.available = available
+
+
+# Các dòng xuất trong ngày của những phụ tùng sắp xuất, để gộp dòng cùng ngày/vị trí/người/lý do;
+# một câu cho cả giỏ, dùng chỉ mục ix_import_export_part_date (xem migrations.py).
+# Vị trí so theo machine_pos.id: nhãn mc_pos có thể trùng giữa các máy (P1, P2...)
+EXPORT_MERGE_SQL = """
+    SELECT id, part_id, machine_pos_id, empl_id, reason FROM import_export
+    WHERE part_id IN :part_ids
+      AND date >= :day_start AND date < :day_end
+      AND im_ex_flag = 0
+    ORDER BY id
+"""
+
+
+def _merge_exports(conn, lines, moved_at):
+    # lines: danh sách dict part_id, quantity, machine_pos_id, mc_pos_id (nhãn lúc xuất), empl_id, reason.
+    # Gộp theo (phụ tùng, vị trí, người, lý do), cộng vào dòng xuất cùng ngày nếu đã có (dữ liệu cũ có nhiều dòng
+    # trùng khóa thì chỉ cộng vào dòng đầu tiên), còn lại thêm mới: một SELECT, một UPDATE và một INSERT executemany
+    groups = {}
+    for line in lines:
+        key = (line["part_id"], line["machine_pos_id"], line["empl_id"], line["reason"])
+        if key in groups:
+            groups[key]["quantity"] += line["quantity"]
+        else:
+            groups[key] = dict(line)
+
+    day_start = datetime(moved_at.year, moved_at.month, moved_at.day)
+    lock = " FOR UPDATE" if _is_mysql(conn) else ""
+    existing = {}
+    for row in conn.execute(
+        text(EXPORT_MERGE_SQL + lock).bindparams(bindparam("part_ids", expanding=True)),
+        {"part_ids": sorted({key[0] for key in groups}), "day_start": day_start,
+         "day_end": day_start + timedelta(days=1)},
+    ):
+        existing.setdefault((row.part_id, row.machine_pos_id, row.empl_id, row.reason), row.id)
+
+    updates = [{"quantity": group["quantity"], "id": existing[key]} for key, group in groups.items() if key in existing]
+    inserts = [{**group, "date": moved_at} for key, group in groups.items() if key not in existing]
+    if updates:
+        conn.execute(text("UPDATE import_export SET quantity = quantity + :quantity WHERE id = :id"),
+                     sorted(updates, key=lambda row: row["id"]))
+    if inserts:
+        conn.execute(text("""
+            INSERT INTO import_export (date, part_id, quantity, im_ex_flag, empl_id, mc_pos_id, machine_pos_id, reason)
+            VALUES (:date, :part_id, :quantity, 0, :empl_id, :mc_pos_id, :machine_pos_id, :reason)
+        """), inserts)
+
+
+def _issue_line(conn, part_id, quantity, mc_pos_id, empl_id, reason, is_foc, moved_at):
+    # Dòng xuất ghi cả id vị trí (machine_pos_id) lẫn nhãn mc_pos lúc xuất (mc_pos_id)
+    mc_pos_value = conn.execute(
+        text("SELECT mc_pos FROM machine_pos WHERE id = :id"),
+        {"id": mc_pos_id}
+    ).scalar()
+    if mc_pos_value is None:
+        raise UnknownMachinePosition(mc_pos_id)
+
+    # Trừ tồn kho có điều kiện trong một câu lệnh: dòng spare_parts bị khóa đến khi commit,
+    # nên hai lượt xuất đồng thời không thể cùng vượt quá tồn kho
+    if is_foc:
+        result = conn.execute(text("""
+            UPDATE spare_parts SET export_date = :export_date
+            WHERE material_no = :part_id
+        """), {"export_date": moved_at, "part_id": part_id})
+    else:
+        result = conn.execute(text("""
+            UPDATE spare_parts
+            SET stock = stock - :quantity,
+                export_date = :export_date,
+                version = version + 1
+            WHERE material_no = :part_id AND stock >= :quantity
+        """), {"quantity": quantity, "export_date": moved_at, "part_id": part_id})
+
+    if result.rowcount == 0:
+        available = conn.execute(
+            text("SELECT stock FROM spare_parts WHERE material_no = :part_id"),
+            {"part_id": part_id}
+        ).fetchone()
+        if available is None:
+            raise UnknownPart(part_id)
+        raise InsufficientStock(part_id, quantity, available[0])
+
+    # Gộp vào dòng xuất cùng ngày/vị trí/người/lý do nếu đã có
+    _merge_exports(conn, [{
+        "part_id": part_id, "quantity": quantity, "machine_pos_id": mc_pos_id, "mc_pos_id": mc_pos_value,
+        "empl_id": empl_id, "reason": reason,
+    }], moved_at)
+
+    record_movement(conn, part_id, 0, quantity, moved_at)
+    append_ledger(conn, [{
+        "part_id": part_id, "moved_at": moved_at, "kind": "export", "quantity": quantity,
+        "delta": 0 if is_foc else -quantity, "empl_id": empl_id, "mc_pos": mc_pos_value, "reason": reason,
+    }])
+
+
+def issue_stock(engine, part_id, quantity, mc_pos_id, empl_id, reason, is_foc=False, moved_at=None):
+    # Xuất kho trong một giao dịch ngắn; lỗi nghiệp vụ được báo bằng StockError
+    if quantity <= 0:
+        raise StockError("Số lượng xuất kho phải lớn hơn 0.")
+    moved_at = moved_at or datetime.now()
+    with engine.begin() as conn:
+        _issue_line(conn, part_id, quantity, mc_pos_id, empl_id, reason, is_foc, moved_at)
+        bump(conn, *MOVEMENT_TABLES)
+
+
+def issue_stock_batch(engine, lines, moved_at=None):
+    # Xuất nhiều dòng (giỏ xuất kho) trong một giao dịch với các câu lệnh executemany: trừ tồn kho,
+    # gộp import_export (_merge_exports), movement_monthly và sổ cái, mỗi bảng một câu cho cả giỏ.
+    # lines: danh sách dict part_id, quantity, mc_pos_id, empl_id, reason, is_foc.
+    # Nếu một dòng không đủ tồn kho thì cả giỏ được rollback.
+    if not lines:
+        return
+    if any(line["quantity"] <= 0 for line in lines):
+        raise StockError("Số lượng xuất kho phải lớn hơn 0.")
+    moved_at = moved_at or datetime.now()
+
+    # Tổng số lượng cần trừ theo phụ tùng (dòng FOC không trừ tồn kho)
+    deductions = {}
+    for line in lines:
+        deductions.setdefault(line["part_id"], 0)
+        if not line.get("is_foc"):
+            deductions[line["part_id"]] += line["quantity"]
+
+    with engine.begin() as conn:
+        pos_ids = sorted({int(line["mc_pos_id"]) for line in lines})
+        pos_map = dict(conn.execute(
+            text("SELECT id, mc_pos FROM machine_pos WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": pos_ids},
+        ).fetchall())
+        for pos_id in pos_ids:
+            if pos_id not in pos_map:
+                raise UnknownMachinePosition(pos_id)
+
+        # Trừ trước rồi kiểm tra: sau câu UPDATE các dòng spare_parts đã bị khóa đến khi commit.
+        # Khóa theo thứ tự part_id để hai giỏ đồng thời không khóa chéo nhau (deadlock trên MySQL)
+        conn.execute(text("""
+            UPDATE spare_parts
+            SET stock = stock - :quantity,
+                export_date = :export_date,
+                version = version + 1
+            WHERE material_no = :part_id
+        """), [
+            {"quantity": quantity, "export_date": moved_at, "part_id": part_id}
+            for part_id, quantity in sorted(deductions.items())
+        ])
+
+        remaining = dict(conn.execute(
+            text("SELECT material_no, stock FROM spare_parts WHERE material_no IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": list(deductions)},
+        ).fetchall())
+        for part_id, quantity in deductions.items():
+            if part_id not in remaining:
+                raise UnknownPart(part_id)
+            # Tồn kho NULL coi như không đủ hàng, giống điều kiện stock >= :quantity của issue_stock
+            if quantity > 0 and (remaining[part_id] is None or remaining[part_id] < 0):
+                available = None if remaining[part_id] is None else remaining[part_id] + quantity
+                raise InsufficientStock(part_id, quantity, available)
+
+        # Cùng đường gộp với issue_stock, để giỏ xuất không tạo dòng trùng với lượt xuất lẻ trong ngày
+        _merge_exports(conn, [
+            {
+                "part_id": line["part_id"],
+                "quantity": line["quantity"],
+                "machine_pos_id": int(line["mc_pos_id"]),
+                "mc_pos_id": pos_map[int(line["mc_pos_id"])],
+                "empl_id": line["empl_id"],
+                "reason": line["reason"],
+            }
+            for line in lines
+        ], moved_at)
+
+        record_movements(conn, [
+            (line["part_id"], 0, line["quantity"], moved_at) for line in lines
+        ])
+        append_ledger(conn, [
+            {
+                "part_id": line["part_id"],
+                "moved_at": moved_at,
+                "kind": "export",
+                "quantity": line["quantity"],
+                "delta": 0 if line.get("is_foc") else -line["quantity"],
+                "empl_id": line["empl_id"],
+                "mc_pos": pos_map[int(line["mc_pos_id"])],
+                "reason": line["reason"],
+            }
+            for line in lines
+        ])
+        bump(conn, *MOVEMENT_TABLES)
+
+
+# ---------------------- SỬA THÔNG TIN PHỤ TÙNG ------------------------
+
+PART_EDIT_COLUMNS = (
+    "description", "part_no", "machine_type_id", "bin", "cost_center", "price", "safety_stock", "safety_stock_check",
+)
+
+
+class PartEditConflict(StockError):
+    def __init__(self, part_id, current):
+        super().__init__(f"Phụ tùng {part_id} đã được sửa hoặc nhập/xuất kho sau khi mở form, chưa lưu thay đổi nào.")
+        self.part_id = part_id
+        self.current = current
+
+
+def _is_blank(value):
+    return value is None or value == "" or (isinstance(value, float) and math.isnan(value))
+
+
+def safety_check_enabled(value):
+    # safety_stock_check được lưu theo nhiều kiểu: "Yes"/"No" (form sửa), 1/0 hoặc "1"/"0" (form thêm mới); NULL là tắt
+    if _is_blank(value):
+        return False
+    if isinstance(value, (int, float)):
+        return value != 0
+    return str(value).strip().lower() in ("yes", "1")
+
+
+def changed_part_columns(original, values):
+    # Các cột trên form khác với bản ghi lúc mở form; ô trống / 0 của giá trị NULL coi như không đổi
+    changes = {}
+    for col, value in values.items():
+        old = original.get(col)
+        if col == "safety_stock_check":
+            if safety_check_enabled(old) == safety_check_enabled(value):
+                continue
+            # Dòng đang lưu kiểu 1/0 thì ghi tiếp kiểu 1/0
+            if (isinstance(old, (int, float)) and not _is_blank(old)) or str(old).strip() in ("0", "1"):
+                value = "1" if safety_check_enabled(value) else "0"
+        elif _is_blank(old):
+            if _is_blank(value) or value == 0:
+                continue
+        elif isinstance(value, (int, float)) and not isinstance(old, str):
+            if float(old) == float(value):
+                continue
+        elif str(old) == str(value):
+            continue
+        changes[col] = value
+    return changes
+
+
+def update_part(engine, part_id, expected_version, changes, new_stock=None, moved_at=None, empl_id=None,
+                reason="Cập nhật thông tin vật liệu"):
+    # Chỉ ghi các cột đã đổi, kèm điều kiện version = phiên bản lúc mở form; new_stock khác None thì
+    # đặt lại tồn kho qua adjust_stock (ghi sổ cái). Phiên bản đã đổi -> PartEditConflict, không ghi gì.
+    # Trả về phiên bản bảng spare_parts do giao dịch này tạo ra (cho reference_data.refresh_rows).
+    unknown = set(changes) - set(PART_EDIT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Không sửa được cột {', '.join(sorted(unknown))}")
+    params = {col: value.item() if hasattr(value, "item") else value for col, value in changes.items()}
+    sets = [f"{col} = :{col}" for col in changes] + ["version = version + 1"]
+
+    with engine.begin() as conn:
+        result = conn.execute(text(f"""
+            UPDATE spare_parts SET {', '.join(sets)}
+            WHERE material_no = :part_id AND version = :version
+        """), {**params, "part_id": part_id, "version": int(expected_version)})
+        if result.rowcount == 0:
+            current = conn.execute(
+                text("SELECT stock, price, version FROM spare_parts WHERE material_no = :part_id"),
+                {"part_id": part_id}
+            ).mappings().fetchone()
+            if current is None:
+                raise UnknownPart(part_id)
+            raise PartEditConflict(part_id, dict(current))
+
+        if "price" in changes:
+            revalue_movements(conn, [part_id])
+        if new_stock is not None:
+            adjust_stock(conn, part_id, new_stock, moved_at or datetime.now(), empl_id=empl_id, reason=reason)
+        # Sửa thông tin danh mục thì chỉ mục tìm kiếm phụ tùng cũng phải cập nhật
+        bump(conn, "spare_parts", *([PARTS_CATALOG_VERSION] if changes else []))
+        return read_version(conn, "spare_parts")
+
+
+def rebuild_movement_monthly(engine):
+    # Tính lại toàn bộ bảng tổng hợp từ import_export (giá theo đơn giá hiện tại)
+    with engine.begin() as conn:
+        ensure_movement_monthly(conn)
+        month_expr = _month_expr(conn, "ie.date")
+
+        conn.execute(text("DELETE FROM movement_monthly"))
+        result = conn.execute(text(f"""
+            INSERT INTO movement_monthly (month, part_id, im_ex_flag, quantity, value)
+            SELECT
+                {month_expr} AS month,
+                ie.part_id,
+                ie.im_ex_flag,
+                SUM(ie.quantity),
+                SUM(ie.quantity * COALESCE(sp.price, 0))
+            FROM import_export ie
+            LEFT JOIN spare_parts sp ON ie.part_id = sp.material_no
+            WHERE ie.date IS NOT NULL
+            GROUP BY {month_expr}, ie.part_id, ie.im_ex_flag
+        """))
+    return result.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Công cụ bảo trì dữ liệu nhập/xuất kho")
+    parser.add_argument("command", choices=["rebuild-rollup", "migrate-import-buckets"])
+    args = parser.parse_args()
+
+    if args.command == "rebuild-rollup":
+        rows = rebuild_movement_monthly(get_engine())
+        print(f"Đã dựng lại movement_monthly: {rows} dòng.")
+    elif args.command == "migrate-import-buckets":
+        merged = migrate_import_buckets(get_engine())
+        print(f"Đã tạo bucket nhập kho theo tháng, gộp {merged} nhóm dòng trùng.")
+
+
+if __name__ == "__main__":
+    main()
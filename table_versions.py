@@ -0,0 +1,94 @@
+# table_versions.py
+# Phiên bản dữ liệu của từng bảng, lưu trong bảng table_versions của CSDL.
+# Mọi giao dịch ghi gọi bump() ở cuối (cùng conn, trước khi commit) để tăng phiên bản các bảng đã sửa.
+# Các cache (reference_data, kpi, chỉ mục tìm kiếm) so phiên bản lúc tải với phiên bản hiện tại
+# nên giữ dữ liệu vô thời hạn và chỉ tải lại khi bảng thật sự thay đổi, kể cả khi tiến trình khác ghi.
+import threading
+import time
+
+from sqlalchemy import event, text
+
+# Khoảng cách tối thiểu giữa hai lần đọc table_versions, dùng chung cho mọi phiên của tiến trình
+# (ghi trong chính tiến trình này thì lần đọc sau được làm ngay, không chờ)
+POLL_INTERVAL_SECONDS = 1.0
+
+TABLE_VERSIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name VARCHAR(64) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    )
+"""
+
+_versions = {}
+_polled_at = None
+_stale_count = 0
+_lock = threading.Lock()
+_poll_lock = threading.Lock()
+
+
+def ensure_table_versions(conn):
+    conn.execute(text(TABLE_VERSIONS_DDL))
+
+
+def bump(conn, *tables):
+    # Một câu upsert cho tất cả các bảng; sắp xếp tên bảng để các giao dịch khóa dòng theo cùng thứ tự
+    if conn.dialect.name == "mysql":
+        upsert = " ON DUPLICATE KEY UPDATE version = version + 1"
+    else:
+        upsert = " ON CONFLICT (table_name) DO UPDATE SET version = version + 1"
+    conn.execute(
+        text("INSERT INTO table_versions (table_name, version) VALUES (:table_name, 1)" + upsert),
+        [{"table_name": table} for table in sorted(set(tables))],
+    )
+    conn.info["bumped_versions"] = True
+
+
+def read_version(conn, table):
+    # Phiên bản trong giao dịch đang mở (sau bump() thì là phiên bản do chính giao dịch này tạo ra)
+    value = conn.execute(
+        text("SELECT version FROM table_versions WHERE table_name = :table_name"), {"table_name": table}
+    ).scalar()
+    return value or 0
+
+
+def mark_stale():
+    # Lần gọi current_versions() tiếp theo sẽ đọc lại table_versions
+    global _polled_at, _stale_count
+    with _lock:
+        _polled_at = None
+        _stale_count += 1
+
+
+def install(engine):
+    # Kết nối trả về pool sau giao dịch đã bump() (tức là đã commit hoặc rollback) -> đọc lại phiên bản
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        if connection_record is not None and connection_record.info.pop("bumped_versions", None):
+            mark_stale()
+
+
+def current_versions(engine):
+    # {tên bảng: phiên bản}; đọc CSDL tối đa một lần mỗi POLL_INTERVAL_SECONDS
+    global _versions, _polled_at
+    with _lock:
+        if _polled_at is not None and time.monotonic() - _polled_at < POLL_INTERVAL_SECONDS:
+            return _versions
+
+    with _poll_lock:
+        with _lock:
+            if _polled_at is not None and time.monotonic() - _polled_at < POLL_INTERVAL_SECONDS:
+                return _versions
+            stale_count = _stale_count
+        started = time.monotonic()
+        with engine.connect() as conn:
+            versions = dict(conn.execute(text("SELECT table_name, version FROM table_versions")).fetchall())
+        with _lock:
+            _versions = versions
+            # Có ghi mới trong lúc đang đọc thì để lần sau đọc lại
+            if stale_count == _stale_count:
+                _polled_at = started
+    return versions
+
+
+def version(engine, table):
+    return current_versions(engine).get(table, 0)